@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Radius search in the far north, around Nunavut (X0A) postal codes.
+
+For each query, the number of candidate rows of the old ``radius * 1.05``
+lat, lng box and of the exact spherical bounding box, the number of rows
+really within the radius, and the ``near`` latency of both backends.
+
+Usage::
+
+    python benchmark/arctic.py [n_repeat]
+"""
+
+from __future__ import print_function
+import sys
+import time
+from math import radians, cos
+from cazipcode import fields, SearchEngine
+from cazipcode.data import get_snapshot
+from cazipcode.pkg.geo_search import bounding_boxes, great_circle
+
+QUERIES = [("X0A 0J0", 100), ("X0A 0J0", 500), ("X0A 0V0", 300),
+           ("X0A 0A0", 700), ("X0A 0H0", 200), ("X0A 0G0", 1000)]
+
+
+def fudge_box(lat, lng, radius):
+    """The box used before, for comparison.
+    """
+    lat_degr_rad = abs(radius * 1.05 / 69.172)
+    lon_degr_rad = abs(radius * 1.05 / (cos(radians(lat)) * 69.172))
+    return [(lat - lat_degr_rad, lat + lat_degr_rad,
+             lng - lon_degr_rad, lng + lon_degr_rad)]
+
+
+def count(points, boxes):
+    return sum([
+        any([lat_lower <= lat <= lat_upper and lng_lower <= lng <= lng_upper
+             for lat_lower, lat_upper, lng_lower, lng_upper in boxes])
+        for lat, lng in points
+    ])
+
+
+def timeit(search, lat, lng, radius, n_repeat):
+    search.near(lat, lng, radius, sort_by=None)  # warm up
+    st = time.time()
+    for _ in range(n_repeat):
+        search.near(lat, lng, radius, sort_by=None)
+    return (time.time() - st) / n_repeat
+
+
+def main(n_repeat=20):
+    snapshot = get_snapshot()
+    points = list(zip(snapshot.array(fields.latitude),
+                      snapshot.array(fields.longitude)))
+    engines = [SearchEngine(backend="sqlite"), SearchEngine(backend="mmap")]
+
+    print("%-8s %7s %10s %10s %8s %12s %12s" % (
+        "query", "radius", "1.05 box", "exact box", "within",
+        "sqlite (ms)", "mmap (ms)"))
+    for postalcode, radius in QUERIES:
+        p = engines[0].by_postalcode(postalcode)
+        lat, lng = p.latitude, p.longitude
+        within = sum([great_circle((lat, lng), point) <= radius
+                      for point in points])
+        elapsed = [timeit(search, lat, lng, radius, n_repeat) * 1000
+                   for search in engines]
+        print("%-8s %7s %10s %10s %8s %12.3f %12.3f" % (
+            postalcode, radius,
+            count(points, fudge_box(lat, lng, radius)),
+            count(points, bounding_boxes(lat, lng, radius)),
+            within, elapsed[0], elapsed[1]))
+
+    for search in engines:
+        search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the ``sqlite`` and the ``mmap`` backend of ``SearchEngine`` on every
+``by_*`` method. Average latency per call.
+
+Usage::
+
+    python benchmark/backend.py [n_repeat]
+"""
+
+from __future__ import print_function
+import sys
+import time
+from cazipcode import fields, SearchEngine
+
+CASES = [
+    ("near", dict(lat=45.477873, lng=-75.721100, radius=20)),
+    ("by_postalcode", dict(postalcode="K1G 0A1")),
+    ("by_prefix", dict(prefix="K1A")),
+    ("by_substring", dict(substring="1A")),
+    ("by_province", dict(province="on", sort_by=fields.population)),
+    ("by_city", dict(city="ottawa", sort_by=fields.population)),
+    ("by_area_name", dict(area_name="ottawa", sort_by=fields.population)),
+    ("by_area_code", dict(area_code=613)),
+    ("by_lat_lng_elevation", dict(lat_greater=45.1, lat_less=46.0,
+                                  sort_by=fields.elevation)),
+    ("by_population", dict(population_greater=10000)),
+    ("by_dwellings", dict(dwellings_greater=10000,
+                          sort_by=fields.dwellings, ascending=False)),
+    ("by_timezone", dict(timezone_greater=5, timezone_less=8)),
+    ("by_day_light_savings", dict(day_light_savings=False)),
+]
+
+
+def timeit(search, method, kwargs, n_repeat):
+    func = getattr(search, method)
+    func(**kwargs)  # warm up
+    st = time.time()
+    for _ in range(n_repeat):
+        func(**kwargs)
+    return (time.time() - st) / n_repeat
+
+
+def main(n_repeat=100):
+    engines = [
+        ("sqlite", SearchEngine(backend="sqlite")),
+        ("mmap", SearchEngine(backend="mmap")),
+    ]
+    print("%-22s %12s %12s" % ("method", "sqlite (ms)", "mmap (ms)"))
+    for method, kwargs in CASES:
+        elapsed = [timeit(search, method, kwargs, n_repeat) * 1000
+                   for _, search in engines]
+        print("%-22s %12.3f %12.3f" % (method, elapsed[0], elapsed[1]))
+    for _, search in engines:
+        search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Database build timing harness.
+
+Build ``data.sqlite`` into a temp directory with the old sqlalchemy
+``executemany`` path and with :func:`cazipcode.data.bulk_load`. The json
+data is loaded once up front, so only the database work is timed.
+
+Usage::
+
+    python benchmark/build_database.py
+"""
+
+from __future__ import print_function
+import os
+import time
+import shutil
+import tempfile
+from sqlalchemy import create_engine
+from cazipcode.data import (
+    t, metadata, create_index_sql, load_postalcode_data, bulk_load,
+)
+
+
+def legacy_load(engine, postalcode_data):
+    """The build procedure before ``bulk_load``.
+    """
+    metadata.create_all(engine)
+    engine.execute(t.insert(), postalcode_data)
+    for sql in create_index_sql():
+        engine.execute(sql)
+
+
+def timeit(loader, postalcode_data, path):
+    engine = create_engine("sqlite:///%s" % path)
+    st = time.time()
+    loader(engine, postalcode_data)
+    elapsed = time.time() - st
+    engine.dispose()
+    return elapsed
+
+
+def main():
+    st = time.time()
+    postalcode_data = load_postalcode_data()
+    print("load %s rows from json: %.3f sec" % (
+        len(postalcode_data), time.time() - st))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for title, loader in [
+            ("sqlalchemy executemany (legacy)", legacy_load),
+            ("bulk_load", bulk_load),
+        ]:
+            path = os.path.join(tmp_dir, "%s.sqlite" % loader.__name__)
+            elapsed = timeit(loader, postalcode_data, path)
+            print("%-35s %.3f sec" % (title, elapsed))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
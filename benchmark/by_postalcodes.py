@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Validate a batch of postal codes (10% of them don't exist):
+``by_postalcode`` in a loop compared with ``by_postalcodes``, with both
+backends and with the in-memory ``exact_index``.
+
+Usage::
+
+    python benchmark/by_postalcodes.py [n_postalcode]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+from cazipcode import SearchEngine
+from cazipcode.data import get_snapshot
+
+
+def loop(search, postalcodes):
+    result = list()
+    for postalcode in postalcodes:
+        try:
+            result.append(search.by_postalcode(postalcode))
+        except ValueError:
+            result.append(None)
+    return result
+
+
+def bulk(search, postalcodes):
+    return search.by_postalcodes(postalcodes)
+
+
+def main(n=10000):
+    snapshot = get_snapshot()
+    random.seed(0)
+    postalcodes = [snapshot.postalcode(i).lower()
+                   for i in random.sample(range(len(snapshot)), n)]
+    for i in random.sample(range(n), n // 10):
+        postalcodes[i] = postalcodes[i][:-1] + "Z"  # no Z in postal codes
+
+    print("%s postal codes" % n)
+    print("%-16s %12s %12s %18s" % (
+        "", "sqlite (ms)", "mmap (ms)", "exact_index (ms)"))
+    engines = [SearchEngine(backend="sqlite"), SearchEngine(backend="mmap"),
+               SearchEngine(exact_index=True)]
+    for name, func in [("by_postalcode", loop), ("by_postalcodes", bulk)]:
+        elapsed = list()
+        for search in engines:
+            st = time.time()
+            func(search, postalcodes)
+            elapsed.append((time.time() - st) * 1000)
+        print("%-16s %12.1f %12.1f %18.1f" % ((name,) + tuple(elapsed)))
+    for search in engines:
+        search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
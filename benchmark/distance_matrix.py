@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Distance between every pair of two lists of random postal codes:
+``by_postalcode`` and ``great_circle`` pairwise in a loop, compared with
+``SearchEngine.distance_matrix``.
+
+Usage::
+
+    python benchmark/distance_matrix.py [n_postalcode]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+from cazipcode import SearchEngine
+from cazipcode.data import get_snapshot
+from cazipcode.pkg.geo_search import great_circle
+
+
+def pairwise_loop(search, origins, destinations):
+    origins = [search.by_postalcode(p) for p in origins]
+    destinations = [search.by_postalcode(p) for p in destinations]
+    return [[great_circle((p1.latitude, p1.longitude),
+                          (p2.latitude, p2.longitude))
+             for p2 in destinations] for p1 in origins]
+
+
+def main(n=300):
+    snapshot = get_snapshot()
+    random.seed(0)
+    postalcodes = [snapshot.postalcode(i)
+                   for i in random.sample(range(len(snapshot)), 2 * n)]
+    origins, destinations = postalcodes[:n], postalcodes[n:]
+
+    with SearchEngine() as search:
+        print("%s x %s matrix" % (n, n))
+        st = time.time()
+        pairwise_loop(search, origins, destinations)
+        print("%-16s %10.1f ms" % ("pairwise loop", (time.time() - st) * 1000))
+        st = time.time()
+        search.distance_matrix(origins, destinations)
+        print("%-16s %10.1f ms" % ("distance_matrix",
+                                   (time.time() - st) * 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Resolve typo'd city names: ``extractOne`` over all distinct cities (also
+over the prepared choices, and pruned with score upper bounds) compared
+with ``fuzzy_match`` seeded by the trigram shortlist, and with
+``fuzzy_match`` seeded by the deletion dictionary and the trigram
+shortlist, how often they give the same name as the full scan.
+
+Usage::
+
+    python benchmark/fuzzy_match.py [n_query]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+from cazipcode.data import get_all_city, get_city_ngram_index, \
+    get_city_symspell_index, get_city_prepared_choices, fuzzy_match
+from cazipcode.pkg.fuzzywuzzy import process
+
+
+def typo(text):
+    chars = list(text.lower())
+    i = random.randrange(len(chars))
+    op = random.randrange(3)
+    letter = random.choice("abcdefghijklmnopqrstuvwxyz")
+    if op == 0:
+        del chars[i]
+    elif op == 1:
+        chars[i] = letter
+    else:
+        chars.insert(i, letter)
+    return "".join(chars)
+
+
+def main(n=20):
+    cities = sorted(get_all_city())
+    st = time.time()
+    index = get_city_ngram_index()
+    print("%s cities, trigram index built in %.1f ms" % (
+        len(cities), (time.time() - st) * 1000))
+    st = time.time()
+    spell = get_city_symspell_index()
+    print("deletion dictionary built in %.1f ms" % (
+        (time.time() - st) * 1000))
+
+    random.seed(0)
+    queries = [typo(city) for city in random.sample(cities, n)]
+
+    st = time.time()
+    expected = [process.extractOne(text, cities) for text in queries]
+    full_scan = time.time() - st
+
+    expected_names = [[e[0]] if e[1] >= 70 else [] for e in expected]
+
+    st = time.time()
+    pruned = [process.extractOne(text, cities, prune=True)
+              for text in queries]
+    full_scan_pruned = time.time() - st
+
+    st = time.time()
+    prepared = get_city_prepared_choices()
+    print("prepared choices built in %.1f ms" % ((time.time() - st) * 1000))
+
+    st = time.time()
+    prepared_result = [process.extractOne(text, prepared)
+                       for text in queries]
+    full_scan_prepared = time.time() - st
+
+    st = time.time()
+    prepared_pruned = [process.extractOne(text, prepared, prune=True)
+                       for text in queries]
+    full_scan_prepared_pruned = time.time() - st
+
+    st = time.time()
+    matched = [fuzzy_match(text, prepared, best_match=True, index=index)
+               for text in queries]
+    fast_path = time.time() - st
+
+    st = time.time()
+    spelled = [fuzzy_match(text, prepared, best_match=True, index=index,
+                           spell=spell)
+               for text in queries]
+    spell_seeded = time.time() - st
+
+    print("%-24s %10.2f ms / query" % (
+        "full scan", full_scan * 1000 / n))
+    print("%-24s %10.2f ms / query, same result: %s / %s" % (
+        "full scan, pruned", full_scan_pruned * 1000 / n,
+        sum([p == e for p, e in zip(pruned, expected)]), n))
+    print("%-24s %10.2f ms / query, same result: %s / %s" % (
+        "full scan, prepared", full_scan_prepared * 1000 / n,
+        sum([p == e for p, e in zip(prepared_result, expected)]), n))
+    print("%-24s %10.2f ms / query, same result: %s / %s" % (
+        "prepared, pruned", full_scan_prepared_pruned * 1000 / n,
+        sum([p == e for p, e in zip(prepared_pruned, expected)]), n))
+    print("%-24s %10.2f ms / query, same name: %s / %s" % (
+        "fuzzy_match", fast_path * 1000 / n,
+        sum([m == e for m, e in zip(matched, expected_names)]), n))
+    print("%-24s %10.2f ms / query, same name: %s / %s" % (
+        "fuzzy_match, spell seed", spell_seeded * 1000 / n,
+        sum([s == e for s, e in zip(spelled, expected_names)]), n))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
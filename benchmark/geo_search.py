@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+``GeoSearchEngine``: time to train 100k random points with each record
+serializer (json, pickle, none), and the latency of ``find_n_nearest`` with
+and without radius.
+
+Usage::
+
+    python benchmark/geo_search.py [n_points]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import json
+import pickle
+import random
+from cazipcode.pkg.geo_search import GeoSearchEngine
+
+
+def main(n_points=100000):
+    random.seed(0)
+    data = [(i, random.uniform(42, 70), random.uniform(-140, -53))
+            for i in range(n_points)]
+    queries = [(random.uniform(42, 70), random.uniform(-140, -53))
+               for _ in range(100)]
+
+    for name, serializer in [("json", json), ("pickle", pickle),
+                             ("none", None)]:
+        search = GeoSearchEngine(serializer=serializer)
+        st = time.time()
+        search.train(data, key_id=lambda x: x[0],
+                     key_lat=lambda x: x[1], key_lng=lambda x: x[2])
+        print("train %s points, %-6s %8.3f sec" % (
+            n_points, name, time.time() - st))
+
+    search = GeoSearchEngine()
+    search.train(data, key_id=lambda x: x[0],
+                 key_lat=lambda x: x[1], key_lng=lambda x: x[2])
+
+    for n, radius in [(5, 20), (5, 100), (5, None)]:
+        st = time.time()
+        for lat, lng in queries:
+            search.find_n_nearest(lat, lng, n=n, radius=radius)
+        elapsed = (time.time() - st) / len(queries)
+        print("find_n_nearest n=%s radius=%-5s %8.3f ms" % (
+            n, radius, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Distance from one point to 100k random points: scalar ``great_circle`` in a
+loop, ``great_circle_array`` without numpy (pure python) and with numpy.
+
+Usage::
+
+    python benchmark/great_circle.py [n_repeat]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+from cazipcode.pkg import geo_search
+from cazipcode.pkg.geo_search import great_circle, great_circle_array
+
+N_POINTS = 100000
+POINT = (45.477873, -75.721100)
+
+
+def scalar_loop(lats, lngs):
+    return [great_circle(POINT, point) for point in zip(lats, lngs)]
+
+
+def pure_python(lats, lngs):
+    np, geo_search.np = geo_search.np, None
+    try:
+        return great_circle_array(POINT[0], POINT[1], lats, lngs)
+    finally:
+        geo_search.np = np
+
+
+def vectorized(lats, lngs):
+    return great_circle_array(POINT[0], POINT[1], lats, lngs)
+
+
+def timeit(func, lats, lngs, n_repeat):
+    func(lats, lngs)  # warm up
+    st = time.time()
+    for _ in range(n_repeat):
+        func(lats, lngs)
+    return (time.time() - st) / n_repeat
+
+
+def main(n_repeat=10):
+    random.seed(0)
+    lats = [random.uniform(42, 70) for _ in range(N_POINTS)]
+    lngs = [random.uniform(-140, -53) for _ in range(N_POINTS)]
+
+    cases = [("scalar loop", scalar_loop, lats, lngs),
+             ("pure python", pure_python, lats, lngs)]
+    if geo_search.np is not None:
+        np = geo_search.np
+        cases.append(("numpy", vectorized, np.array(lats), np.array(lngs)))
+
+    print("%-14s %12s" % ("%s points" % N_POINTS, "time (ms)"))
+    for name, func, x, y in cases:
+        print("%-14s %12.3f" % (name, timeit(func, x, y, n_repeat) * 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
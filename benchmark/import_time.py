@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark.
+
+Compare the cost of ``import cazipcode`` alone, with the cost of import plus
+bootstrapping the data layer, which is what every ``import cazipcode`` used
+to pay before the data layer became lazy. Every sample runs in a fresh
+interpreter.
+
+Usage::
+
+    python benchmark/import_time.py [n_repeat]
+"""
+
+from __future__ import print_function
+import os
+import sys
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+TEMPLATE = """
+import time
+st = time.time()
+%s
+print(time.time() - st)
+"""
+
+CASES = [
+    (
+        "import cazipcode (lazy)",
+        "import cazipcode",
+    ),
+    (
+        "import cazipcode + bootstrap (eager, old behavior)",
+        "import cazipcode\n"
+        "from cazipcode import data\n"
+        "data.get_engine()\n"
+        "data.get_city_long_to_long_upper()\n"
+        "data.get_area_name_long_to_long_upper()",
+    ),
+]
+
+
+def run(code, n_repeat):
+    elapsed = list()
+    for _ in range(n_repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", TEMPLATE % code], cwd=ROOT)
+        elapsed.append(float(output.decode("utf-8").strip().split()[-1]))
+    return elapsed
+
+
+def main(n_repeat=5):
+    for title, code in CASES:
+        elapsed = sorted(run(code, n_repeat))
+        print("%-55s min %.4f sec, median %.4f sec" % (
+            title, elapsed[0], elapsed[len(elapsed) // 2]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+``StringMatcher`` backed by the bit-parallel ``pure_levenshtein`` compared
+with ``difflib.SequenceMatcher``, on pairs of city names: ``ratio``,
+``get_matching_blocks``, ``distance``, and ``fuzz.WRatio`` of a typo'd
+city against all cities. Also the C extension if python-Levenshtein is
+installed.
+
+Usage::
+
+    python benchmark/levenshtein.py [n_pair]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+import difflib
+from cazipcode.data import get_all_city
+from cazipcode.pkg.fuzzywuzzy import fuzz, pure_levenshtein
+from cazipcode.pkg.fuzzywuzzy.StringMatcher import StringMatcher, NATIVE
+
+
+def timeit(func, pairs):
+    st = time.time()
+    for s1, s2 in pairs:
+        func(s1, s2)
+    return (time.time() - st) * 1000000 / len(pairs)
+
+
+def wratio_scan(matcher, text, cities):
+    fuzz.SequenceMatcher = matcher
+    try:
+        st = time.time()
+        scores = [fuzz.WRatio(text, city) for city in cities]
+        return (time.time() - st) * 1000, scores
+    finally:
+        fuzz.SequenceMatcher = StringMatcher
+
+
+def main(n=10000):
+    cities = sorted(get_all_city())
+    random.seed(0)
+    pairs = [(random.choice(cities).lower(), random.choice(cities).lower())
+             for _ in range(n)]
+
+    print("%s pairs of city names, StringMatcher %s" % (
+        n, "native (C extension)" if NATIVE else "pure python"))
+    print("%-20s %14s %14s" % ("", "difflib (us)", "pure (us)"))
+    rows = [
+        ("ratio",
+         lambda s1, s2: difflib.SequenceMatcher(None, s1, s2).ratio(),
+         lambda s1, s2: pure_levenshtein.ratio(s1, s2)),
+        ("matching_blocks",
+         lambda s1, s2: difflib.SequenceMatcher(
+             None, s1, s2).get_matching_blocks(),
+         lambda s1, s2: pure_levenshtein.matching_blocks(
+             pure_levenshtein.opcodes(s1, s2), s1, s2)),
+        ("distance",
+         None,
+         lambda s1, s2: pure_levenshtein.distance(s1, s2)),
+    ]
+    for name, slow, fast in rows:
+        print("%-20s %14s %14.2f" % (
+            name, "%.2f" % timeit(slow, pairs) if slow else "-",
+            timeit(fast, pairs)))
+
+    text = "montrael"
+    difflib_ms, difflib_scores = wratio_scan(
+        difflib.SequenceMatcher, text, cities)
+    pure_ms, pure_scores = wratio_scan(StringMatcher, text, cities)
+    print("WRatio(%r) x %s cities: difflib %.1f ms, StringMatcher %.1f ms, "
+          "same score %.1f%%" % (
+              text, len(cities), difflib_ms, pure_ms,
+              100.0 * sum([a == b for a, b in
+                           zip(difflib_scores, pure_scores)]) / len(cities)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
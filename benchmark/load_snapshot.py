@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare loading the dataset from ``canada_postalcode.json.gz`` with opening
+the columnar snapshot and touching every numeric column.
+
+Usage::
+
+    python benchmark/load_snapshot.py
+"""
+
+from __future__ import print_function
+import time
+from cazipcode.data import snapshot_path, load_postalcode_data
+from cazipcode.data.snapshot import Snapshot, schema, PLAIN
+
+
+def load_json():
+    return load_postalcode_data()
+
+
+def load_snapshot():
+    snapshot = Snapshot(snapshot_path)
+    for column, encoding, _ in schema:
+        if encoding == PLAIN:
+            snapshot.array(column)[-1]
+    return snapshot
+
+
+def main(n_repeat=5):
+    for title, loader in [
+        ("json.gz", load_json),
+        ("snapshot", load_snapshot),
+    ]:
+        elapsed = list()
+        for _ in range(n_repeat):
+            st = time.time()
+            loader()
+            elapsed.append(time.time() - st)
+        print("%-10s min %.6f sec" % (title, min(elapsed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Near search latency in a dense area (downtown Toronto), small to large
+radius. Compare the sqlite backend with the latitude / longitude B-tree
+prefilter and with the R*Tree spatial index.
+
+Usage::
+
+    python benchmark/near.py [n_repeat]
+"""
+
+from __future__ import print_function
+import sys
+import time
+from cazipcode import SearchEngine
+
+TORONTO = (43.653226, -79.383184)
+RADIUS = [1, 5, 10, 50]  # miles
+
+
+def timeit(search, radius, n_repeat):
+    lat, lng = TORONTO
+    search.near(lat, lng, radius, sort_by=None)  # warm up
+    st = time.time()
+    for _ in range(n_repeat):
+        search.near(lat, lng, radius, sort_by=None)
+    return (time.time() - st) / n_repeat
+
+
+def main(n_repeat=20):
+    search = SearchEngine()
+    print("%-12s %16s %16s" % ("radius", "B-tree (ms)", "R*Tree (ms)"))
+    for radius in RADIUS:
+        elapsed = list()
+        for use_rtree in [False, True]:
+            search.backend.use_rtree = use_rtree
+            elapsed.append(timeit(search, radius, n_repeat) * 1000)
+        print("%-12s %16.3f %16.3f" % (
+            "%s miles" % radius, elapsed[0], elapsed[1]))
+    search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+``SearchEngine.nearest`` latency, reverse geocoding random GPS points
+around postal code locations.
+
+Usage::
+
+    python benchmark/nearest.py [n_points]
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+from cazipcode import fields, SearchEngine
+from cazipcode.data import get_snapshot
+
+
+def random_points(n_points):
+    snapshot = get_snapshot()
+    latitude = snapshot.array(fields.latitude)
+    longitude = snapshot.array(fields.longitude)
+    random.seed(0)
+    points = list()
+    for _ in range(n_points):
+        i = random.randrange(len(snapshot))
+        points.append((latitude[i] + random.uniform(-0.05, 0.05),
+                       longitude[i] + random.uniform(-0.05, 0.05)))
+    return points
+
+
+def main(n_points=2000):
+    points = random_points(n_points)
+    search = SearchEngine()
+    search.nearest(*points[0])  # warm up
+    for k in [1, 5, 20]:
+        st = time.time()
+        for lat, lng in points:
+            search.nearest(lat, lng, k=k)
+        elapsed = (time.time() - st) / n_points
+        print("nearest k=%-3s %.3f ms" % (k, elapsed * 1000))
+    search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+``SearchEngine.nearest_many`` throughput, batch reverse geocoding random GPS
+points around postal code locations, compared with a ``nearest`` loop, then with
+1, 2, 4 ... worker processes up to the number of CPUs.
+
+Usage::
+
+    python benchmark/nearest_many.py [n_points]
+"""
+
+from __future__ import print_function
+import sys
+import time
+from multiprocessing import cpu_count
+from cazipcode import SearchEngine
+
+try:
+    from nearest import random_points
+except ImportError:
+    from benchmark.nearest import random_points
+
+
+def main(n_points=200000):
+    points = random_points(n_points)
+    lats = [lat for lat, _ in points]
+    lngs = [lng for _, lng in points]
+    search = SearchEngine()
+    search.nearest_many(lats[:10], lngs[:10])  # warm up
+
+    n_loop = min(n_points, 2000)
+    st = time.time()
+    for lat, lng in points[:n_loop]:
+        search.nearest(lat, lng)
+    elapsed = time.time() - st
+    print("nearest loop    k=1   %10.0f points / sec" % (n_loop / elapsed))
+
+    for k in [1, 5, 20]:
+        st = time.time()
+        search.nearest_many(lats, lngs, k=k)
+        elapsed = time.time() - st
+        print("nearest_many    k=%-3s %10.0f points / sec" % (
+            k, n_points / elapsed))
+
+    max_workers = 1
+    while max_workers <= cpu_count():
+        st = time.time()
+        search.nearest_many(lats, lngs, max_workers=max_workers)
+        elapsed = time.time() - st
+        print("%2s workers      k=1   %10.0f points / sec" % (
+            max_workers, n_points / elapsed))
+        max_workers *= 2
+    search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Polygon and route queries, ``find(polygon=...)`` and
+``find(along_route=..., buffer=...)``, compared with a lat, lng box query
+post-filtered in python.
+
+Usage::
+
+    python benchmark/polygon.py [n_repeat]
+"""
+
+from __future__ import print_function
+import sys
+import time
+from cazipcode import SearchEngine
+from cazipcode.pkg.geo_search import (
+    point_in_polygon, polygon_bounding_box, distance_to_route,
+)
+
+#: greater Toronto area
+POLYGON = [(43.58, -79.64), (43.86, -79.64), (43.86, -79.12), (43.75, -79.12),
+           (43.62, -79.30), (43.58, -79.50)]
+#: Toronto - Ottawa - Montreal
+ROUTE = [(43.65, -79.38), (45.42, -75.70), (45.50, -73.57)]
+BUFFER = 5  # miles
+RETURNS = 10 ** 6
+
+
+def post_filter_polygon(search):
+    lat_lower, lat_upper, lng_lower, lng_upper = polygon_bounding_box(POLYGON)
+    return [p for p in search.find(
+        lat_greater=lat_lower, lat_less=lat_upper,
+        lng_greater=lng_lower, lng_less=lng_upper, returns=RETURNS,
+    ) if point_in_polygon(p.latitude, p.longitude, POLYGON)]
+
+
+def post_filter_route(search):
+    lats = [lat for lat, _ in ROUTE]
+    lngs = [lng for _, lng in ROUTE]
+    return [p for p in search.find(
+        lat_greater=min(lats) - 0.1, lat_less=max(lats) + 0.1,
+        lng_greater=min(lngs) - 0.1, lng_less=max(lngs) + 0.1,
+        returns=RETURNS,
+    ) if distance_to_route(p.latitude, p.longitude, ROUTE) <= BUFFER]
+
+
+CASES = [
+    ("polygon, post filter", post_filter_polygon),
+    ("polygon", lambda search: search.find(polygon=POLYGON,
+                                           returns=RETURNS)),
+    ("route, post filter", post_filter_route),
+    ("route", lambda search: search.find(along_route=ROUTE, buffer=BUFFER,
+                                         returns=RETURNS)),
+]
+
+
+def timeit(func, search, n_repeat):
+    n_result = len(func(search))  # warm up
+    st = time.time()
+    for _ in range(n_repeat):
+        func(search)
+    return (time.time() - st) / n_repeat, n_result
+
+
+def main(n_repeat=3):
+    engines = [SearchEngine(backend="sqlite"), SearchEngine(backend="mmap")]
+    print("%-22s %8s %12s %12s" % ("query", "results", "sqlite (ms)",
+                                   "mmap (ms)"))
+    for name, func in CASES:
+        elapsed = [timeit(func, search, n_repeat) for search in engines]
+        print("%-22s %8s %12.1f %12.1f" % (
+            name, elapsed[0][1], elapsed[0][0] * 1000, elapsed[1][0] * 1000))
+    for search in engines:
+        search.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
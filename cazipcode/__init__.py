@@ -11,6 +11,8 @@ __license__ = "MIT"
 __author__ = "Sanhe Hu"
 
 try:
-    from .search import great_circle, fields, PostalCode, SearchEngine
+    from .search import (
+        great_circle, fields, PostalCode, SearchEngine, ResultCache,
+    )
 except:
     pass
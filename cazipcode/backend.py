@@ -0,0 +1,625 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Storage backends of :class:`~cazipcode.search.SearchEngine`.
+
+:meth:`SearchEngine.find() <cazipcode.search.SearchEngine.find>` turns its
+arguments into a backend neutral list of criteria, ``(field, op, value)``
+tuples, plus an optional ``(lat, lng, radius)`` near filter. A backend
+answers them and returns rows, anything ``PostalCode._make`` accepts.
+
+- :class:`SqliteBackend`: sql queries on ``data.sqlite``.
+- :class:`MmapBackend`: array scans on the memory mapped columnar snapshot,
+  requires numpy.
+
+**中文文档**
+
+SearchEngine 的存储后端。find() 先把参数转化为与后端无关的查询条件, 再交给
+后端执行。
+"""
+
+import heapq
+import random
+from operator import itemgetter
+from bisect import bisect_left, bisect_right
+from sqlalchemy import select, and_, or_, union_all, literal_column, bindparam
+from sqlalchemy.util import LRUCache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from .data import t, rtree, fields, has_rtree
+    from .data.snapshot import (
+        DICTIONARY, ORDER_PREFIX, POSTALCODE_WIDTH,
+    )
+    from .pkg.geo_search import (
+        great_circle_array, bounding_boxes,
+        polygon_bounding_box, points_in_polygon,
+        distances_to_route, route_bounding_boxes,
+    )
+    from .pkg.memo import Memo
+except:
+    from cazipcode.data import t, rtree, fields, has_rtree
+    from cazipcode.data.snapshot import (
+        DICTIONARY, ORDER_PREFIX, POSTALCODE_WIDTH,
+    )
+    from cazipcode.pkg.geo_search import (
+        great_circle_array, bounding_boxes,
+        polygon_bounding_box, points_in_polygon,
+        distances_to_route, route_bounding_boxes,
+    )
+    from cazipcode.pkg.memo import Memo
+
+
+#--- criteria operators ---
+EQ = "=="
+GE = ">="
+LE = "<="
+PREFIX = "prefix"
+SUBSTRING = "substring"
+
+INF = float("inf")
+
+
+def first_k(dists, radius, returns):
+    """Positions of the first ``returns`` distances within radius.
+    """
+    if np is None:
+        return [i for i, dist in enumerate(dists) if dist <= radius][:returns]
+    return np.flatnonzero(np.asarray(dists) <= radius)[:returns]
+
+
+def top_k(dists, radius, returns, ascending):
+    """Positions of the ``returns`` smallest (largest if not ascending)
+    distances within radius. Ties are in position order, same as
+    ``heapq.nsmallest`` and ``heapq.nlargest``.
+    """
+    if np is None:
+        heap = [(dist, i) for i, dist in enumerate(dists) if dist <= radius]
+        if ascending:
+            heap = heapq.nsmallest(returns, heap, key=itemgetter(0))
+        else:
+            heap = heapq.nlargest(returns, heap, key=itemgetter(0))
+        return [i for _, i in heap]
+
+    dists = np.asarray(dists)
+    positions = np.flatnonzero(dists <= radius)
+    keys = dists[positions] if ascending else -dists[positions]
+    # partial sort, but keep every tie of the k-th distance
+    if 0 < returns < len(keys):
+        kth = np.partition(keys, returns - 1)[returns - 1]
+        keep = np.flatnonzero(keys <= kth)
+        positions, keys = positions[keep], keys[keep]
+    return positions[np.argsort(keys, kind="stable")[:returns]]
+
+
+class Area(object):
+    """A geo filter of :meth:`~cazipcode.search.SearchEngine.find` other
+    than the near circle. Bounding boxes prefilter the candidates with the
+    spatial index, then ``contains`` tests them exactly.
+
+    :param boxes: list of (lat_lower, lat_upper, lng_lower, lng_upper).
+    :param contains: function(lats, lngs) -> boolean mask, ``numpy.ndarray``
+      or list.
+    """
+
+    def __init__(self, boxes, contains):
+        self.boxes = boxes
+        self.contains = contains
+
+    @classmethod
+    def polygon(cls, polygon):
+        """Inside a polygon, list of (lat, lng) vertices.
+        """
+        return cls(
+            [polygon_bounding_box(polygon)],
+            lambda lats, lngs: points_in_polygon(lats, lngs, polygon),
+        )
+
+    @classmethod
+    def route(cls, route, buffer):
+        """Within ``buffer`` miles of a route, list of (lat, lng) points.
+        """
+        def contains(lats, lngs):
+            dists = distances_to_route(lats, lngs, route)
+            if np is None:
+                return [dist <= buffer for dist in dists]
+            return dists <= buffer
+
+        return cls(route_bounding_boxes(route, buffer), contains)
+
+
+def geo_distances(lats, lngs, near, areas):
+    """Distances of points to the center of the near circle (zero without
+    near), inf if a point is outside of an area. Points within the near
+    radius (zero without near) pass every geo filter.
+    """
+    if near:
+        dists = great_circle_array(near[0], near[1], lats, lngs)
+    elif np is None:
+        dists = [0.0] * len(lats)
+    else:
+        dists = np.zeros(len(lats))
+
+    for area in areas:
+        inside = area.contains(lats, lngs)
+        if np is None:
+            dists = [dist if flag else INF
+                     for dist, flag in zip(dists, inside)]
+        else:
+            dists = np.where(inside, dists, INF)
+    return dists
+
+
+class SqliteBackend(object):
+    """Search ``data.sqlite``.
+
+    Near search prefilters candidates with the R*Tree spatial index, only
+    rows in the lat, lng box are read. If the database has no R*Tree, it
+    uses the latitude / longitude B-tree indexes, sqlite can only use one of
+    them, so it reads a whole latitude band.
+
+    Statements are built once per shape of the query (which criteria, how
+    many boxes, the sort order) with bound parameters for the values, and
+    kept in a LRU cache. The compiled sql of a cached statement is cached
+    too (``compiled_cache``), so a repeated shape skips both building and
+    compiling. See :meth:`statement_cache_info` and
+    :attr:`on_statement_cache`.
+
+    :param engine: sqlalchemy engine.
+    """
+
+    #: number of statements, and of compiled statements, kept
+    statement_cache_size = 256
+
+    #: optional instrumentation hook, ``function(key, hit)``, called on every
+    #: statement cache lookup with the shape of the query and whether it was
+    #: found in the cache
+    on_statement_cache = None
+
+    def __init__(self, engine):
+        self.connect = engine.connect().execution_options(
+            compiled_cache=LRUCache(self.statement_cache_size))
+        self.use_rtree = has_rtree()
+        self._statements = Memo(self.statement_cache_size)
+
+    rowid = literal_column("%s.rowid" % t.name)
+
+    #: near search sorted by a column reads rows in chunks, the first chunk
+    #: is ``returns`` rows, then doubles up to this size
+    near_chunk_size = 1000
+
+    def close(self):
+        self.connect.close()
+
+    def _statement(self, key, build):
+        """Return the cached statement of a query shape, ``build()`` it on a
+        cache miss.
+        """
+        sql = self._statements.get(key)
+        hit = sql is not None
+        if not hit:
+            sql = build()
+            self._statements.put(key, sql)
+        if self.on_statement_cache is not None:
+            self.on_statement_cache(key, hit)
+        return sql
+
+    def statement_cache_info(self):
+        """Statement cache statistics.
+
+        :return: dict of hits, misses, hit_rate, size, maxsize.
+        """
+        return self._statements.info()
+
+    @staticmethod
+    def _filter(field, op, param):
+        """Filter of a criterion, the value is the bound parameter
+        ``param``, see :meth:`_value`.
+        """
+        column = t.c[field]
+        if op == EQ:
+            return column == param
+        elif op == GE:
+            return column >= param
+        elif op == LE:
+            return column <= param
+        elif op in (PREFIX, SUBSTRING):
+            return column.like(param)
+        else:
+            raise ValueError("unknown operator %r!" % op)
+
+    @staticmethod
+    def _value(op, value):
+        """Value of the bound parameter of a criterion.
+        """
+        if op == PREFIX:
+            return "%s%%" % value
+        elif op == SUBSTRING:
+            return "%%%s%%" % value
+        return value
+
+    def _in_boxes(self, boxes):
+        """Filter rows in any of the lat, lng boxes, numbers or bound
+        parameters.
+        """
+        if self.use_rtree:
+            in_boxes = [
+                select([rtree.c.id]).where(and_(
+                    rtree.c.max_lat >= lat_lower,
+                    rtree.c.min_lat <= lat_upper,
+                    rtree.c.max_lng >= lng_lower,
+                    rtree.c.min_lng <= lng_upper,
+                ))
+                for lat_lower, lat_upper, lng_lower, lng_upper in boxes
+            ]
+            in_box = in_boxes[0] if len(in_boxes) == 1 \
+                else union_all(*in_boxes)
+            return self.rowid.in_(in_box)
+        else:
+            return or_(*[
+                and_(
+                    t.c.latitude >= lat_lower,
+                    t.c.latitude <= lat_upper,
+                    t.c.longitude >= lng_lower,
+                    t.c.longitude <= lng_upper,
+                )
+                for lat_lower, lat_upper, lng_lower, lng_upper in boxes
+            ])
+
+    @staticmethod
+    def _geo_distances(rows, near, areas):
+        return geo_distances(
+            [row.latitude for row in rows],
+            [row.longitude for row in rows],
+            near, areas,
+        )
+
+    def _find_statement(self, shape, box_counts, sort_by, ascending, limit):
+        """Build the statement of a :meth:`find` query shape. Criterion i is
+        bound to ``c<i>``, the box j of box group g (near first, then the
+        areas) to ``b<g>_<j>_<k>``, k in 0..3, and the limit to ``limit``.
+        """
+        filters = [self._filter(field, op, bindparam("c%s" % i))
+                   for i, (field, op) in enumerate(shape)]
+        for g, count in enumerate(box_counts):
+            if count:
+                filters.append(self._in_boxes([
+                    [bindparam("b%s_%s_%s" % (g, j, k)) for k in range(4)]
+                    for j in range(count)
+                ]))
+
+        sql = select([t]).where(and_(*filters))
+        if sort_by:
+            if ascending:
+                sql = sql.order_by(t.c[sort_by].asc())
+            else:
+                sql = sql.order_by(t.c[sort_by].desc())
+            # ties in postal code order, whatever index the plan uses
+            if sort_by != fields.postalcode:
+                sql = sql.order_by(t.c.postalcode.asc())
+        if limit:
+            sql = sql.limit(bindparam("limit"))
+        return sql
+
+    def find(self, criteria, near, sort_by, ascending, returns, areas=()):
+        # near lat, lng, polygon, route, prefilter with the bounding boxes
+        box_groups = [bounding_boxes(*near) if near else []]
+        box_groups.extend([area.boxes for area in areas])
+        radius = near[2] if near else 0.0
+
+        # if use "near" search, sort_by not given, then sort by distance,
+        # don't use limit clause
+        by_distance = bool(near) and not sort_by
+        if by_distance:
+            sort_by = None
+        else:
+            sort_by = sort_by or fields.postalcode
+        limit = not (near or areas)
+
+        shape = tuple([(field, op) for field, op, _ in criteria])
+        box_counts = tuple([len(boxes) for boxes in box_groups])
+        key = ("find", shape, box_counts, sort_by, bool(ascending), limit,
+               self.use_rtree)
+        sql = self._statement(key, lambda: self._find_statement(
+            shape, box_counts, sort_by, ascending, limit))
+
+        params = {"c%s" % i: self._value(op, value)
+                  for i, (_, op, value) in enumerate(criteria)}
+        for g, boxes in enumerate(box_groups):
+            for j, box in enumerate(boxes):
+                for k, value in enumerate(box):
+                    params["b%s_%s_%s" % (g, j, k)] = value
+        if limit:
+            params["limit"] = returns
+
+        if by_distance:
+            rows = self.connect.execute(sql, params).fetchall()
+            dists = self._geo_distances(rows, near, areas)
+            return [rows[i] for i in top_k(dists, radius, returns, ascending)]
+
+        # exact geo filter, stop once enough rows
+        if near or areas:
+            result = list()
+            cursor = self.connect.execute(sql, params)
+            chunk_size = returns
+            while len(result) < returns:
+                rows = cursor.fetchmany(chunk_size)
+                chunk_size = min(chunk_size * 2, self.near_chunk_size)
+                if not rows:
+                    break
+                dists = self._geo_distances(rows, near, areas)
+                result.extend([
+                    rows[i] for i in
+                    first_k(dists, radius, returns - len(result))
+                ])
+            cursor.close()
+
+        else:
+            result = self.connect.execute(sql, params).fetchall()
+
+        return result
+
+    def by_postalcode(self, postalcode):
+        sql = self._statement(("by_postalcode",), lambda: select([t]).where(
+            t.c.postalcode == bindparam("postalcode")))
+        return self.connect.execute(sql, postalcode=postalcode).fetchone()
+
+    #: postal codes per ``IN (...)`` query of :meth:`by_postalcodes`, sqlite
+    #: allows at most 999 bound parameters
+    in_chunk_size = 500
+
+    def by_postalcodes(self, postalcodes):
+        rows = dict()
+        distinct = sorted(set(postalcodes))
+        sql = self._statement(("by_postalcodes",), lambda: select([t]).where(
+            t.c.postalcode.in_(bindparam("postalcodes", expanding=True))))
+        for start in range(0, len(distinct), self.in_chunk_size):
+            chunk = distinct[start:start + self.in_chunk_size]
+            for row in self.connect.execute(sql, postalcodes=chunk):
+                rows[row[fields.postalcode]] = row
+        return [rows.get(postalcode) for postalcode in postalcodes]
+
+    def random(self, returns):
+        sql = select([t.c.postalcode])
+        all_postalcode = [row[0] for row in self.connect.execute(sql)]
+        return [self.by_postalcode(postalcode)
+                for postalcode in random.sample(all_postalcode, returns)]
+
+
+class MmapBackend(object):
+    """Search the memory mapped columnar
+    :class:`~cazipcode.data.snapshot.Snapshot` with numpy array scans.
+
+    Nothing is copied, every process opening the same snapshot shares its
+    pages. Sorting uses the orders precomputed in the snapshot, small
+    candidate sets are sorted directly. Ties are in postal code order, in
+    a descending sort too, and ``None`` sorts first, like sqlite.
+
+    :param snapshot: :class:`~cazipcode.data.snapshot.Snapshot` instance.
+    """
+
+    def __init__(self, snapshot):
+        if np is None:
+            raise ImportError("numpy is required by the mmap backend!")
+        self.snapshot = snapshot
+        self.n_rows = len(snapshot)
+        self.postalcode = snapshot.numpy(fields.postalcode)
+
+    def close(self):
+        pass
+
+    def column(self, field):
+        return self.snapshot.numpy(self.snapshot.columns[field]["array"])
+
+    def _postalcode_range(self, prefix):
+        """Postal code are sorted, rows with a prefix are a contiguous
+        range.
+        """
+        try:
+            prefix = prefix.upper().encode("ascii")
+        except UnicodeError:  # postal code are ascii
+            return 0, 0
+        lower = int(np.searchsorted(self.postalcode, prefix, "left"))
+        upper = int(np.searchsorted(self.postalcode, prefix + b"\xff", "left"))
+        return lower, upper
+
+    def _substring_mask(self, substring, lower, upper):
+        """Compare the postal code bytes column by column, at every offset
+        the substring fits in.
+        """
+        chars = self.postalcode[lower:upper].view(np.uint8) \
+            .reshape(-1, POSTALCODE_WIDTH)
+        substring = bytearray(substring)
+        mask = np.zeros(len(chars), dtype=bool)
+        for offset in range(POSTALCODE_WIDTH - len(substring) + 1):
+            m = chars[:, offset] == substring[0]
+            for i, char in enumerate(substring[1:], 1):
+                m &= chars[:, offset + i] == char
+            mask |= m
+        return mask
+
+    def _mask(self, field, op, value, lower, upper):
+        """Boolean mask of rows[lower:upper] matching a criterion. None if
+        nothing can match.
+        """
+        if op == SUBSTRING:
+            try:
+                substring = value.upper().encode("ascii")
+            except UnicodeError:  # postal code are ascii
+                return None
+            return self._substring_mask(substring, lower, upper)
+
+        header = self.snapshot.columns[field]
+        values = self.column(field)[lower:upper]
+
+        # string column, compare the codes of the sorted dictionary
+        if header["encoding"] == DICTIONARY:
+            dictionary = header["dictionary"]
+            if op == EQ:
+                i = bisect_left(dictionary, value)
+                if i == len(dictionary) or dictionary[i] != value:
+                    return None
+                return values == i
+            elif op == GE:
+                return values >= bisect_left(dictionary, value)
+            elif op == LE:
+                return values < bisect_right(dictionary, value)
+
+        null = header.get("null")
+        if op == EQ:
+            return values == value
+        elif op == GE:
+            mask = values >= value
+        elif op == LE:
+            mask = values <= value
+        else:
+            raise ValueError("unknown operator %r!" % op)
+        if null is not None:  # like sql, null doesn't match a comparison
+            mask &= values != null
+        return mask
+
+    def _candidates(self, criteria, near, areas=()):
+        """Row numbers matching all criteria and in the bounding boxes of
+        the geo filters, in postal code order.
+        """
+        lower, upper = 0, self.n_rows
+        for field, op, value in criteria:
+            if op == PREFIX:
+                prefix_lower, prefix_upper = self._postalcode_range(value)
+                lower = max(lower, prefix_lower)
+                upper = min(upper, prefix_upper)
+        if lower >= upper:
+            return np.zeros(0, dtype=np.intp)
+
+        criteria = [criterion for criterion in criteria
+                    if criterion[1] != PREFIX]
+        mask = None
+        for field, op, value in criteria:
+            m = self._mask(field, op, value, lower, upper)
+            if m is None:
+                return np.zeros(0, dtype=np.intp)
+            if mask is None:
+                mask = m
+            else:
+                mask &= m
+        boxes = [area.boxes for area in areas]
+        if near:
+            boxes.append(bounding_boxes(*near))
+        for area_boxes in boxes:
+            m = self._boxes_mask(area_boxes, lower, upper)
+            if mask is None:
+                mask = m
+            else:
+                mask &= m
+
+        if mask is None:
+            return np.arange(lower, upper)
+        return np.flatnonzero(mask) + lower
+
+    def _boxes_mask(self, boxes, lower, upper):
+        """Boolean mask of rows[lower:upper] in any of the lat, lng boxes.
+        """
+        mask = np.zeros(upper - lower, dtype=bool)
+        for lat_lower, lat_upper, lng_lower, lng_upper in boxes:
+            m = self._mask(fields.latitude, GE, lat_lower, lower, upper)
+            m &= self._mask(fields.latitude, LE, lat_upper, lower, upper)
+            m &= self._mask(fields.longitude, GE, lng_lower, lower, upper)
+            m &= self._mask(fields.longitude, LE, lng_upper, lower, upper)
+            mask |= m
+        return mask
+
+    def _sort(self, candidates, sort_by, ascending):
+        """Sort candidates (in postal code order) by a column.
+        """
+        if sort_by and sort_by != fields.postalcode:
+            # few candidates, sort them directly
+            if len(candidates) * 16 < self.n_rows:
+                values = self.column(sort_by)[candidates]
+                candidates = candidates[np.argsort(values, kind="stable")]
+
+            # many, filter the precomputed order
+            else:
+                order = self.snapshot.numpy(ORDER_PREFIX + sort_by)
+                mask = np.zeros(self.n_rows, dtype=bool)
+                mask[candidates] = True
+                candidates = order[mask[order]]
+
+        if not ascending:
+            if sort_by and sort_by != fields.postalcode:
+                candidates = self._reverse_groups(
+                    candidates, self.column(sort_by)[candidates])
+            else:
+                candidates = candidates[::-1]
+        return candidates
+
+    @staticmethod
+    def _reverse_groups(candidates, values):
+        """Reverse candidates sorted by values, but keep the ties in their
+        order, so a descending sort still has ties in postal code order.
+        """
+        if len(candidates) < 2:
+            return candidates
+        changed = values[1:] != values[:-1]
+        if values.dtype.kind == "f":  # NaN != NaN, but both are null
+            changed &= ~(np.isnan(values[1:]) & np.isnan(values[:-1]))
+        group = np.concatenate([[0], np.cumsum(changed)])
+        return candidates[np.argsort(-group, kind="stable")]
+
+    def _geo_distances(self, candidates, near, areas):
+        return geo_distances(
+            self.column(fields.latitude)[candidates],
+            self.column(fields.longitude)[candidates],
+            near, areas,
+        )
+
+    def _rows(self, candidates):
+        return self.snapshot.rows(candidates)
+
+    def find(self, criteria, near, sort_by, ascending, returns, areas=()):
+        candidates = self._candidates(criteria, near, areas)
+        radius = near[2] if near else 0.0
+
+        # near, sort_by not given, then sort by distance
+        if near and not sort_by:
+            dists = self._geo_distances(candidates, near, areas)
+            result = candidates[top_k(dists, radius, returns, ascending)]
+
+        # exact geo filter on the sorted candidates
+        elif near or areas:
+            candidates = self._sort(candidates, sort_by, ascending)
+            dists = self._geo_distances(candidates, near, areas)
+            result = candidates[first_k(dists, radius, returns)]
+
+        else:
+            result = self._sort(candidates, sort_by, ascending)[:returns]
+
+        return self._rows(result)
+
+    def by_postalcode(self, postalcode):
+        try:
+            key = postalcode.encode("ascii")
+        except UnicodeError:
+            return None
+        i = int(np.searchsorted(self.postalcode, key))
+        if i < self.n_rows and self.postalcode[i] == key:
+            return self.snapshot.row(i)
+        return None
+
+    def by_postalcodes(self, postalcodes):
+        if not postalcodes:
+            return []
+        rows, found = self.snapshot.find_postalcodes(postalcodes)
+        result = [None] * len(postalcodes)
+        positions = found.nonzero()[0]
+        for i, row in zip(positions.tolist(),
+                          self.snapshot.rows(rows[positions])):
+            result[i] = row
+        return result
+
+    def random(self, returns):
+        return self._rows(random.sample(range(self.n_rows), returns))
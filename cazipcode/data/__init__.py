@@ -1,16 +1,47 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+"""
+Postal code database and name lookup tables.
+
+Nothing heavy happens at import time. The sqlite engine, the indexes and the
+distinct city / area name sets are built the first time they are used, so
+``import cazipcode`` stays cheap for processes that never search.
+
+The old module level names ``engine``, ``all_city``, ``all_area_name``,
+``city_long_to_long_upper`` and ``area_name_long_to_long_upper`` still work,
+they are resolved lazily through :func:`__getattr__`.
+"""
+
 import os
+import sys
+import atexit
+import errno
+import json
+import hashlib
+import warnings
+import tempfile
+import threading
+import functools
 from sqlalchemy import String, Integer, Float
-from sqlalchemy import create_engine, MetaData, Table, Column, Index
-from sqlalchemy import select
+from sqlalchemy import create_engine, MetaData, Table, Column
+from sqlalchemy import select, event
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
 try:
-    from ..pkg.superjson import json
-    from ..pkg.fuzzywuzzy import process
+    from ..pkg.fuzzywuzzy import fuzz, process
+    from ..pkg.filelock import atomic_build
+    from ..pkg.memo import Memo
+    from ..pkg.ngram import NGramIndex
+    from ..pkg.symspell import SymSpellIndex
 except:
-    from cazipcode.pkg.superjson import json
-    from cazipcode.pkg.fuzzywuzzy import process
+    from cazipcode.pkg.fuzzywuzzy import fuzz, process
+    from cazipcode.pkg.filelock import atomic_build
+    from cazipcode.pkg.memo import Memo
+    from cazipcode.pkg.ngram import NGramIndex
+    from cazipcode.pkg.symspell import SymSpellIndex
 
 
 class fields(object):
@@ -45,6 +76,16 @@ t = Table("canada_postalcode", metadata,
           Column(fields.day_light_savings, Integer),
           )
 
+# 2-d spatial index, a sqlite R*Tree virtual table, ``id`` is the rowid of
+# ``t``. It has its own metadata, it's created with raw DDL, not create_all.
+rtree = Table("canada_postalcode_rtree", MetaData(),
+              Column("id", Integer, primary_key=True),
+              Column("min_lat", Float),
+              Column("max_lat", Float),
+              Column("min_lng", Float),
+              Column("max_lng", Float),
+              )
+
 
 db_file = "data.sqlite"
 db_path = os.path.join(os.path.dirname(__file__), db_file)
@@ -52,47 +93,235 @@ db_path = os.path.join(os.path.dirname(__file__), db_file)
 json_data_path = os.path.join(os.path.dirname(
     __file__), "canada_postalcode.json.gz")
 
-# if exists
-if os.path.exists(db_path):
-    engine = create_engine("sqlite:///%s" % db_path)
+snapshot_file = "canada_postalcode.v3.snapshot"  # see snapshot.VERSION
+snapshot_path = os.path.join(os.path.dirname(__file__), snapshot_file)
+
+#: max bytes of the database file sqlite memory maps, mapped pages live in
+#: the OS page cache and are shared by all processes, set it before first use.
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+#: columns that get a single column index, created after the data is loaded
+indexed_columns = [
+    fields.city,
+    fields.province,
+    fields.latitude,
+    fields.longitude,
+    fields.population,
+    fields.dwellings,
+    fields.timezone,
+]
+
+def create_index_sql():
+    """``CREATE INDEX`` statements for :data:`indexed_columns`. Plain DDL,
+    an ``Index`` object would attach itself to the table and be created
+    together with it, before the data is loaded.
+    """
+    return [
+        "CREATE INDEX c_%s ON %s (%s)" % (column, t.name, column)
+        for column in indexed_columns
+    ]
+
+
+def create_rtree(cursor):
+    """Create and fill the :data:`rtree` spatial index, skipped if sqlite
+    is compiled without the R*Tree module.
+    """
+    try:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE %s USING rtree(%s)" %
+            (rtree.name, ", ".join([column.name for column in rtree.columns])))
+    except Exception as e:
+        warnings.warn("sqlite R*Tree module is not available (%s), "
+                      "near search falls back to B-tree index." % e)
+        return
+    cursor.execute(
+        "INSERT INTO %s SELECT rowid, %s, %s, %s, %s FROM %s" % (
+            rtree.name,
+            fields.latitude, fields.latitude,
+            fields.longitude, fields.longitude,
+            t.name,
+        )
+    )
+
+
+#: rows per transaction in :func:`bulk_load`
+BULK_LOAD_BATCH_SIZE = 50000
+
+
+def load_postalcode_data():
+    """Load all postal code from the compressed json file, sorted by
+    postal code.
+    """
+    try:
+        from ..pkg.superjson import json
+    except:
+        from cazipcode.pkg.superjson import json
 
-# if not exists, create the database
-else:
     postalcode_data = json.load(json_data_path, verbose=False)
-    postalcode_data = sorted(postalcode_data, key=lambda p: p["postalcode"])
+    return sorted(postalcode_data, key=lambda p: p["postalcode"])
+
+
+def bulk_load(engine, postalcode_data, batch_size=BULK_LOAD_BATCH_SIZE):
+    """Create the table and load the data through the raw DB-API cursor.
 
-    # try to create a database file locally.
+    Journal and fsync are turned off for the build, a crash simply means
+    the file is rebuilt. Rows are inserted in large transactions, the
+    indexes and the R*Tree are built after the data is in place, then
+    ``ANALYZE`` collects statistics for the query planner.
+    """
+    t.create(engine)
+
+    columns = [column.name for column in t.columns]
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        t.name, ", ".join(columns), ", ".join(["?"] * len(columns)))
+
+    connection = engine.raw_connection()
     try:
-        engine = create_engine("sqlite:///%s" % db_path)
-        metadata.create_all(engine)
-        engine.execute(t.insert(), postalcode_data)
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+
+        for i in range(0, len(postalcode_data), batch_size):
+            cursor.executemany(sql, [
+                tuple([row[column] for column in columns])
+                for row in postalcode_data[i:i + batch_size]
+            ])
+            connection.commit()
+
+        for sql in create_index_sql():
+            cursor.execute(sql)
+        create_rtree(cursor)
+        cursor.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _build_database(engine):
+    """Create the table, load all postal code and build the indexes.
+    """
+    bulk_load(engine, load_postalcode_data())
 
-    # if meet permission error, use in-memory database.
-    except:
+
+def build_database(path=db_path):
+    """Build the sqlite database file. It's done once at packaging time
+    (see ``setup.py``), the file is shipped with the package.
+
+    This doesn't protect against concurrent builds, at runtime it's called
+    through :func:`~cazipcode.pkg.filelock.atomic_build`.
+    """
+    engine = create_engine("sqlite:///%s" % path)
+    try:
+        _build_database(engine)
+    finally:
+        engine.dispose()
+
+
+def create_readonly_engine(path=db_path, mmap_size=None):
+    """Open the database file read-only through a sqlite URI.
+
+    ``mode=ro`` and ``immutable=1`` tell sqlite the file never changes, so
+    it skips locking and change detection. ``PRAGMA mmap_size`` makes it
+    read the file through memory map, every process shares the same pages
+    from the OS page cache instead of having its own copy.
+    """
+    if mmap_size is None:
+        mmap_size = MMAP_SIZE
+    url = "sqlite:///file:%s?mode=ro&immutable=1&uri=true" % \
+        pathname2url(os.path.abspath(path))
+    engine = create_engine(url)
+
+    @event.listens_for(engine, "connect")
+    def set_mmap_size(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA mmap_size = %d" % mmap_size)
+
+    return engine
+
+
+def _is_permission_error(e):
+    return e.errno in (errno.EACCES, errno.EPERM, errno.EROFS)
+
+
+def _create_engine():
+    # if not exists, build it. When many processes start at the same time
+    # only one builds, the others wait and open the finished file.
+    try:
+        atomic_build(db_path, build_database)
+
+    # if the package directory is not writable, use in-memory database.
+    except (IOError, OSError) as e:
+        if not _is_permission_error(e):
+            raise
+        warnings.warn("can not create '%s' (%s), use in-memory database, "
+                      "it's rebuilt in every process!" % (db_path, e))
         engine = create_engine("sqlite:///:memory:")
-        metadata.create_all(engine)
-        engine.execute(t.insert(), postalcode_data)
+        _build_database(engine)
+        return engine
 
-    i_city = Index("c_city", t.c.city)
-    i_city.create(engine)
+    return create_readonly_engine(db_path)
 
-    i_province = Index("c_province", t.c.province)
-    i_province.create(engine)
 
-    i_latitude = Index("c_latitude", t.c.latitude)
-    i_latitude.create(engine)
+def _open_snapshot():
+    try:
+        from .snapshot import Snapshot, build_snapshot
+    except:
+        from cazipcode.data.snapshot import Snapshot, build_snapshot
 
-    i_longitude = Index("c_longitude", t.c.longitude)
-    i_longitude.create(engine)
+    try:
+        atomic_build(snapshot_path, build_snapshot)
+        return Snapshot(snapshot_path)
+
+    # if the package directory is not writable, use a temp file.
+    except (IOError, OSError) as e:
+        if not _is_permission_error(e):
+            raise
+        warnings.warn("can not create '%s' (%s), use a temp file, "
+                      "it's rebuilt in every process!" % (snapshot_path, e))
+        fd, path = tempfile.mkstemp(suffix=".snapshot")
+        os.close(fd)
+        # kept until exit, the workers of nearest_many open it by path
+        atexit.register(_remove_temp_snapshot, path)
+        build_snapshot(path)
+        return Snapshot(path)
+
+
+def _remove_temp_snapshot(path):
+    try:
+        os.remove(path)
+    except OSError:  # can't remove a mapped file on Windows
+        pass
+
+
+_lazy_cache = dict()
+_lazy_lock = threading.RLock()
+
+
+def lazy(func):
+    """Decorator, the function is called only once, on first use, and its
+    return value is cached and shared by all following calls. Thread safe.
+    """
+    key = func.__name__
 
-    i_population = Index("c_population", t.c.population)
-    i_population.create(engine)
+    @functools.wraps(func)
+    def wrapper():
+        try:
+            return _lazy_cache[key]
+        except KeyError:
+            with _lazy_lock:
+                if key not in _lazy_cache:
+                    _lazy_cache[key] = func()
+                return _lazy_cache[key]
 
-    i_dwellings = Index("c_dwellings", t.c.dwellings)
-    i_dwellings.create(engine)
+    return wrapper
+
+
+@lazy
+def get_engine():
+    """Return the sqlalchemy engine, build the database if it's not there.
+    """
+    return _create_engine()
 
-    i_timezone = Index("c_timezone", t.c.timezone)
-    i_timezone.create(engine)
 
 #
 province_short_to_long = {
@@ -120,35 +349,272 @@ all_province_long = set(province_long_to_short)
 all_province_short_and_long = {
     province.upper() for province in set.union(all_province_short, all_province_long)}
 
-sql = select([t.c.city.distinct()])
-all_city = {row["city"] for row in engine.execute(sql) if row["city"]}
-city_long_to_long_upper = {city.upper(): city for city in all_city}
+@lazy
+def has_rtree():
+    """Whether the database has the :data:`rtree` spatial index.
+    """
+    return get_engine().has_table(rtree.name)
+
+
+@lazy
+def get_snapshot():
+    """Return the memory mapped columnar
+    :class:`~cazipcode.data.snapshot.Snapshot`, build it if it's not there.
+    """
+    return _open_snapshot()
+
 
-sql = select([t.c.area_name.distinct()])
-all_area_name = {
-    row["area_name"] for row in engine.execute(sql) if row["area_name"]}
-area_name_long_to_long_upper = {
-    area_name.upper(): area_name for area_name in all_area_name}
+@lazy
+def get_kdtree():
+    """Return the :class:`~cazipcode.pkg.kdtree.KDTree` spatial index stored
+    in the snapshot, point ids are snapshot row numbers.
+    """
+    return get_snapshot().kdtree()
 
 
-def fuzzy_match(text, choices, best_match=False, min_confidence=70):
+@lazy
+def get_postalcode_index():
+    """Return the exact lookup hash index, dict of postal code -> snapshot
+    row number.
     """
+    return get_snapshot().postalcode_index()
 
+
+@lazy
+def get_all_city():
+    """Set of all distinct city names.
     """
-    result = list()
-    if best_match:
-        choice, confidence = process.extractOne(text, choices)
-#         print(choice, confidence)
-        if confidence >= min_confidence:
-            result.append(choice)
+    sql = select([t.c.city.distinct()])
+    return {row["city"] for row in get_engine().execute(sql) if row["city"]}
+
+
+@lazy
+def get_city_long_to_long_upper():
+    return {city.upper(): city for city in get_all_city()}
 
-    else:
-        for choice, confidence in process.extract(text, choices):
-            #             print(choice, confidence)
-            if confidence >= min_confidence:
-                result.append(choice)
 
-    return result
+@lazy
+def get_all_area_name():
+    """Set of all distinct area names.
+    """
+    sql = select([t.c.area_name.distinct()])
+    return {row["area_name"]
+            for row in get_engine().execute(sql) if row["area_name"]}
+
+
+@lazy
+def get_area_name_long_to_long_upper():
+    return {area_name.upper(): area_name for area_name in get_all_area_name()}
+
+
+@lazy
+def get_city_ngram_index():
+    """Trigram :class:`~cazipcode.pkg.ngram.NGramIndex` of all city names.
+    """
+    return NGramIndex(sorted(get_all_city()))
+
+
+@lazy
+def get_area_name_ngram_index():
+    """Trigram :class:`~cazipcode.pkg.ngram.NGramIndex` of all area names.
+    """
+    return NGramIndex(sorted(get_all_area_name()))
+
+
+@lazy
+def get_province_prepared_choices():
+    """:class:`~cazipcode.pkg.fuzzywuzzy.process.PreparedChoices` of all
+    province full names.
+    """
+    return process.PreparedChoices(sorted(all_province_long))
+
+
+@lazy
+def get_city_prepared_choices():
+    """:class:`~cazipcode.pkg.fuzzywuzzy.process.PreparedChoices` of all
+    city names.
+    """
+    return process.PreparedChoices(sorted(get_all_city()))
+
+
+@lazy
+def get_area_name_prepared_choices():
+    """:class:`~cazipcode.pkg.fuzzywuzzy.process.PreparedChoices` of all
+    area names.
+    """
+    return process.PreparedChoices(sorted(get_all_area_name()))
+
+
+@lazy
+def get_province_symspell_index():
+    """:class:`~cazipcode.pkg.symspell.SymSpellIndex` of all province full
+    names.
+    """
+    return SymSpellIndex(sorted(all_province_long))
+
+
+@lazy
+def get_city_symspell_index():
+    """:class:`~cazipcode.pkg.symspell.SymSpellIndex` of all city names.
+    """
+    return SymSpellIndex(sorted(get_all_city()))
+
+
+@lazy
+def get_area_name_symspell_index():
+    """:class:`~cazipcode.pkg.symspell.SymSpellIndex` of all area names.
+    """
+    return SymSpellIndex(sorted(get_all_area_name()))
+
+
+_lazy_attributes = {
+    "engine": get_engine,
+    "all_city": get_all_city,
+    "city_long_to_long_upper": get_city_long_to_long_upper,
+    "all_area_name": get_all_area_name,
+    "area_name_long_to_long_upper": get_area_name_long_to_long_upper,
+}
+
+
+def __getattr__(name):
+    """Resolve the lazy module level names (PEP 562, Python3.7+).
+    """
+    try:
+        return _lazy_attributes[name]()
+    except KeyError:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+
+
+# no module level __getattr__ before Python3.7, load everything eagerly.
+if sys.version_info < (3, 7):
+    for _name, _func in _lazy_attributes.items():
+        globals()[_name] = _func()
+
+#: max number of fuzzy resolutions kept in :data:`fuzzy_memo`
+FUZZY_MEMO_SIZE = 10000
+
+#: memo of fuzzy resolutions, (kind, text, best_match, min_confidence) ->
+#: list of [name, confidence], see :func:`fuzzy_match`
+fuzzy_memo = Memo(FUZZY_MEMO_SIZE)
+
+#: bump when :func:`fuzzy_match` changes its results, saved memos of the
+#: older versions are not loaded
+FUZZY_MEMO_FORMAT = 1
+
+
+@lazy
+def get_fuzzy_memo_version():
+    """Fingerprint of what the fuzzy resolutions depend on: the
+    :data:`FUZZY_MEMO_FORMAT`, the string matcher fuzzywuzzy uses, and all
+    the province, city and area names.
+    """
+    matcher = sys.modules[fuzz.SequenceMatcher.__module__]
+    fingerprint = [
+        FUZZY_MEMO_FORMAT,
+        matcher.__name__,
+        getattr(matcher, "NATIVE", False),
+        sorted(all_province_long),
+        sorted(get_all_city()),
+        sorted(get_all_area_name()),
+    ]
+    return hashlib.md5(
+        json.dumps(fingerprint).encode("utf-8")).hexdigest()
+
+
+_fuzzy_memo_path = None
+
+
+def _save_fuzzy_memo():
+    if _fuzzy_memo_path is not None:
+        fuzzy_memo.save(_fuzzy_memo_path)
+
+
+def persist_fuzzy_memo(path):
+    """Load :data:`fuzzy_memo` from a json file and save it back there at
+    exit, so the typos seen before resolve without fuzzy matching after a
+    restart. A file saved with other names or another string matcher is
+    not loaded, see :func:`get_fuzzy_memo_version`. Called again, the memo
+    is saved once, to the last path.
+
+    :return: number of fuzzy resolutions loaded.
+    """
+    global _fuzzy_memo_path
+    fuzzy_memo.version = get_fuzzy_memo_version()
+    with _lazy_lock:
+        if _fuzzy_memo_path is None:
+            atexit.register(_save_fuzzy_memo)
+        _fuzzy_memo_path = path
+    return fuzzy_memo.load(path)
+
+
+#: number of candidates the n-gram index shortlists, their best score is
+#: the cutoff of the full fuzzy matching scan
+FUZZY_CANDIDATES = 50
+
+
+def _subset(choices, names):
+    """The ``names`` of ``choices``, prepared if ``choices`` is.
+    """
+    if isinstance(choices, process.PreparedChoices):
+        return choices.subset(names)
+    return names
+
+
+def fuzzy_match(text, choices, best_match=False, min_confidence=70,
+                kind=None, index=None, spell=None):
+    """Names in ``choices`` similar to ``text``, with confidence at least
+    ``min_confidence``.
+
+    :param choices: names, or their
+      :class:`~cazipcode.pkg.fuzzywuzzy.process.PreparedChoices`, names are
+      processed once instead of for every text.
+
+    :param kind: name of the vocabulary, for example ``"city"``. If given,
+      the fuzzy match of a text is done once and kept in
+      :data:`fuzzy_memo`.
+    :param index: :class:`~cazipcode.pkg.ngram.NGramIndex` of ``choices``,
+      speeds up ``best_match``. The best score of the
+      :data:`FUZZY_CANDIDATES` choices sharing the most trigrams with
+      ``text`` is the cutoff of the pruned scan of all choices, the result
+      is the same as without index.
+    :param spell: optional :class:`~cazipcode.pkg.symspell.SymSpellIndex`
+      of ``choices``, seeds the cutoff like ``index`` does, with the choices
+      within its edit distance of ``text``. Not used by the ``find_*``
+      functions, the trigram shortlist is as fast without the cost of
+      building the index, see ``benchmark/fuzzy_match.py``.
+    """
+    key = (kind, text, bool(best_match), min_confidence)
+    scored = fuzzy_memo.get(key) if kind is not None else None
+
+    if scored is None:
+        if best_match:
+            # the best score of a few likely choices is a high cutoff, most
+            # choices are pruned by their score upper bound in the full scan
+            shortlists = list()
+            if spell is not None:
+                shortlists.append(
+                    [choice for _, choice in spell.lookup(text)])
+            if index is not None:
+                shortlists.append(index.candidates(text, FUZZY_CANDIDATES))
+            cutoff = min_confidence
+            for shortlist in shortlists:
+                seed = process.extractOne(
+                    text, _subset(choices, shortlist), prune=True,
+                    score_cutoff=cutoff)
+                if seed is not None:
+                    cutoff = seed[1]
+            best = process.extractOne(
+                text, choices, prune=True, score_cutoff=cutoff)
+            scored = [list(best)] if best is not None else list()
+        else:
+            scored = [[choice, confidence]
+                      for choice, confidence in process.extract(text, choices)]
+        if kind is not None:
+            fuzzy_memo.put(key, scored)
+
+    return [choice for choice, confidence in scored
+            if confidence >= min_confidence]
 
 
 def find_province(text, best_match=True):
@@ -168,7 +634,8 @@ def find_province(text, best_match=True):
 
     # use fuzzy match
     result = fuzzy_match(
-        text, all_province_long, best_match, min_confidence=70)
+        text, get_province_prepared_choices(), best_match, min_confidence=70,
+        kind=fields.province)
 
     if len(result) == 0:
         message = ("'%s' is not a valid province name, use 2 letter "
@@ -180,10 +647,13 @@ def find_province(text, best_match=True):
 
 
 def find_city(text, best_match=True):
+    city_long_to_long_upper = get_city_long_to_long_upper()
     if text.upper() in city_long_to_long_upper:
         return [city_long_to_long_upper[text.upper()], ]
 
-    result = fuzzy_match(text, all_city, best_match, min_confidence=70)
+    result = fuzzy_match(
+        text, get_city_prepared_choices(), best_match, min_confidence=70,
+        kind=fields.city, index=get_city_ngram_index())
 
     if len(result) == 0:
         message = ("'%s' is not a valid city name, "
@@ -194,10 +664,13 @@ def find_city(text, best_match=True):
 
 
 def find_area_name(text, best_match=True):
+    area_name_long_to_long_upper = get_area_name_long_to_long_upper()
     if text.upper() in area_name_long_to_long_upper:
         return [area_name_long_to_long_upper[text.upper()], ]
 
-    result = fuzzy_match(text, all_area_name, best_match, min_confidence=70)
+    result = fuzzy_match(
+        text, get_area_name_prepared_choices(), best_match, min_confidence=70,
+        kind=fields.area_name, index=get_area_name_ngram_index())
 
     if len(result) == 0:
         message = ("'%s' is not a valid city name, "
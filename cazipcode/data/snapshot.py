@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Columnar binary snapshot of the postal code dataset.
+
+Loading ``canada_postalcode.json.gz`` means decompressing and parsing one
+python dict per postal code. The snapshot stores the same data column by
+column, opening it is a ``mmap`` plus parsing a small json header, no per
+row python object is created:
+
+- numeric columns are typed arrays (``array`` typecodes), ``None`` is
+  stored as a sentinel, NaN for float, the type's min value for integer.
+- string columns are dictionary encoded, an integer code per row plus the
+  sorted distinct values. Because the dictionary is sorted, comparing codes
+  is comparing the strings.
+- postal code is a fixed width (7 bytes) ascii blob, rows are sorted by
+  postal code, so the row number is the rank of the postal code.
+
+File layout, all numbers little endian::
+
+    magic (8 bytes) | version (uint32) | header size (uint32) | header json
+    | padding | array | padding | array | ...
+
+Every array starts at an 8 bytes aligned offset, so it can be viewed in
+place with :meth:`memoryview.cast` or ``numpy.frombuffer``.
+
+**中文文档**
+
+按列存储的二进制数据快照。数值列是定长数组, 字符串列是字典编码。打开文件只需
+mmap 并解析一个很小的 json 头, 不需要为每一行创建 python 对象。
+"""
+
+import io
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from . import fields, load_postalcode_data
+    from ..pkg.kdtree import KDTree
+except:
+    from cazipcode.data import fields, load_postalcode_data
+    from cazipcode.pkg.kdtree import KDTree
+
+
+MAGIC = b"CAZIPSNP"
+#: bump it when the layout or the content changes, the version is part of
+#: the file name, so an old file is never opened by a new version.
+VERSION = 3
+ALIGNMENT = 8
+
+PLAIN = "plain"
+DICTIONARY = "dictionary"
+FIXED = "fixed"
+
+#: (column, encoding, typecode)
+schema = [
+    (fields.postalcode, FIXED, "B"),
+    (fields.city, DICTIONARY, "i"),
+    (fields.province, DICTIONARY, "B"),
+    (fields.area_code, PLAIN, "h"),
+    (fields.area_name, DICTIONARY, "i"),
+    (fields.latitude, PLAIN, "d"),
+    (fields.longitude, PLAIN, "d"),
+    (fields.elevation, PLAIN, "i"),
+    (fields.population, PLAIN, "i"),
+    (fields.dwellings, PLAIN, "i"),
+    (fields.timezone, PLAIN, "b"),
+    (fields.day_light_savings, PLAIN, "b"),
+]
+
+POSTALCODE_WIDTH = 7
+
+#: null sentinel of integer typecodes
+int_null = {
+    "b": -2 ** 7,
+    "h": -2 ** 15,
+    "i": -2 ** 31,
+}
+
+#: array typecode -> numpy dtype
+numpy_dtype = {
+    "b": "<i1",
+    "B": "<u1",
+    "h": "<i2",
+    "i": "<i4",
+    "d": "<f8",
+}
+
+IS_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _null(typecode):
+    if typecode == "d":
+        return float("nan")
+    else:
+        return int_null[typecode]
+
+
+def _padding(offset):
+    return (ALIGNMENT - offset % ALIGNMENT) % ALIGNMENT
+
+
+def encode_column(values, encoding, typecode):
+    """Encode a list of values.
+
+    :return: (array, column header dict)
+    """
+    header = {"encoding": encoding}
+
+    if encoding == FIXED:
+        blob = b"".join([value.encode("ascii") for value in values])
+        if len(blob) != POSTALCODE_WIDTH * len(values):
+            raise ValueError("values are not %s bytes fixed width!" %
+                             POSTALCODE_WIDTH)
+        header["width"] = POSTALCODE_WIDTH
+        return array(typecode, blob), header
+
+    if encoding == DICTIONARY:
+        dictionary = sorted(set(values))
+        code = {value: i for i, value in enumerate(dictionary)}
+        header["dictionary"] = dictionary
+        return array(typecode, [code[value] for value in values]), header
+
+    null = _null(typecode)
+    if typecode != "d":
+        header["null"] = null
+    return array(typecode, [null if value is None else value
+                            for value in values]), header
+
+
+def write_snapshot(path, postalcode_data, extra_arrays=None):
+    """Write a snapshot file.
+
+    :param postalcode_data: list of postal code dict, sorted by postal code.
+    :param extra_arrays: optional, dict of name -> ``array``. Auxiliary
+      arrays stored next to the columns (sort orders, indexes, ...).
+    """
+    arrays = list()  # (name, array)
+    header = {"version": VERSION, "n_rows": len(postalcode_data),
+              "columns": dict(), "arrays": dict()}
+
+    for column, encoding, typecode in schema:
+        values = [row[column] for row in postalcode_data]
+        arr, column_header = encode_column(values, encoding, typecode)
+        column_header["array"] = column
+        header["columns"][column] = column_header
+        arrays.append((column, arr))
+
+    for name, arr in sorted((extra_arrays or dict()).items()):
+        arrays.append((name, arr))
+
+    # compute offsets, the header size depends on the offsets, so iterate
+    # until it stops changing.
+    header_size = 0
+    while True:
+        offset = len(MAGIC) + 8 + header_size
+        offset += _padding(offset)
+        for name, arr in arrays:
+            header["arrays"][name] = {
+                "typecode": arr.typecode,
+                "offset": offset,
+                "length": len(arr),
+            }
+            offset += len(arr) * arr.itemsize
+            offset += _padding(offset)
+        header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        if len(header_bytes) == header_size:
+            break
+        header_size = len(header_bytes)
+
+    with io.open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", VERSION, header_size))
+        f.write(header_bytes)
+        for name, arr in arrays:
+            f.write(b"\x00" * _padding(f.tell()))
+            assert f.tell() == header["arrays"][name]["offset"]
+            if IS_BIG_ENDIAN and arr.itemsize > 1:
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            f.write(arr.tobytes())
+
+
+ORDER_PREFIX = "order_"
+
+
+def sort_orders(postalcode_data):
+    """Precompute the ascending sort order of every column but postal code
+    (rows are sorted by postal code already).
+
+    Like sqlite, ``None`` comes first and ties keep the postal code order.
+    Descending order is the reversed ascending order.
+
+    :return: dict of ``"order_<column>"`` -> ``array("i")`` of row numbers.
+    """
+    orders = dict()
+    for column, _, _ in schema:
+        if column == fields.postalcode:
+            continue
+        values = [row[column] for row in postalcode_data]
+        order = sorted(range(len(values)),
+                       key=lambda i: (values[i] is not None, values[i]))
+        orders[ORDER_PREFIX + column] = array("i", order)
+    return orders
+
+
+KDTREE_PREFIX = "kdtree_"
+
+
+def kdtree_arrays(postalcode_data):
+    """Build the :class:`~cazipcode.pkg.kdtree.KDTree` spatial index.
+
+    :return: dict of ``"kdtree_<name>"`` -> array.
+    """
+    tree = KDTree.build(
+        [row[fields.latitude] for row in postalcode_data],
+        [row[fields.longitude] for row in postalcode_data],
+    )
+    return {KDTREE_PREFIX + name: arr
+            for name, arr in tree.to_arrays().items()}
+
+
+def build_snapshot(path):
+    """Build the snapshot file from ``canada_postalcode.json.gz``.
+    """
+    postalcode_data = load_postalcode_data()
+    extra_arrays = sort_orders(postalcode_data)
+    extra_arrays.update(kdtree_arrays(postalcode_data))
+    write_snapshot(path, postalcode_data, extra_arrays=extra_arrays)
+
+
+class Snapshot(object):
+    """A read-only, memory mapped snapshot file.
+
+    Arrays are views on the mapped file, nothing is copied. The OS page
+    cache is shared by every process that opens the same file.
+
+    :param path: snapshot file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with io.open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError("'%s' is not a snapshot file!" % path)
+        version, header_size = struct.unpack(
+            "<II", self._mmap[len(MAGIC):len(MAGIC) + 8])
+        if version != VERSION:
+            raise ValueError("unsupported snapshot version %s!" % version)
+        start = len(MAGIC) + 8
+        header = json.loads(
+            self._mmap[start:start + header_size].decode("utf-8"))
+
+        self.n_rows = header["n_rows"]
+        self.columns = header["columns"]
+        self.arrays = header["arrays"]
+        self._views = dict()
+        self._numpy_views = dict()
+        self._decoders = None
+
+    def __len__(self):
+        return self.n_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the views and unmap the file.
+        """
+        for view in self._views.values():
+            if isinstance(view, memoryview):
+                view.release()
+        self._views.clear()
+        self._numpy_views.clear()
+        self._decoders = None
+        self._mmap.close()
+
+    def array(self, name):
+        """Return a read-only typed view of an array, indexing it gives
+        python numbers. Zero-copy unless the host is big endian.
+        """
+        try:
+            return self._views[name]
+        except KeyError:
+            info = self.arrays[name]
+            typecode = info["typecode"]
+            size = array(typecode).itemsize * info["length"]
+            start = info["offset"]
+            if IS_BIG_ENDIAN and array(typecode).itemsize > 1:
+                view = array(typecode, self._mmap[start:start + size])
+                view.byteswap()
+            else:
+                view = memoryview(self._mmap)[start:start + size] \
+                    .cast(typecode)
+            self._views[name] = view
+            return view
+
+    def numpy(self, name):
+        """Return an array as a read-only ``numpy.ndarray``, zero-copy.
+        The postal code column is a ``S7`` array. Requires numpy.
+        """
+        if np is None:
+            raise ImportError("numpy is required!")
+        try:
+            return self._numpy_views[name]
+        except KeyError:
+            info = self.arrays[name]
+            if self.columns.get(name, {}).get("encoding") == FIXED:
+                # fixed width bytes, one item per row
+                dtype = "S%s" % self.columns[name]["width"]
+                count = self.n_rows
+            else:
+                dtype = numpy_dtype[info["typecode"]]
+                count = info["length"]
+            view = np.frombuffer(
+                self._mmap, dtype=dtype, count=count, offset=info["offset"])
+            self._numpy_views[name] = view
+            return view
+
+    def kdtree(self):
+        """The :class:`~cazipcode.pkg.kdtree.KDTree` spatial index, on top
+        of the memory mapped arrays.
+        """
+        return KDTree(
+            self.array(fields.latitude), self.array(fields.longitude),
+            **{name[len(KDTREE_PREFIX):]: self.array(name)
+               for name in self.arrays if name.startswith(KDTREE_PREFIX)}
+        )
+
+    def dictionary(self, column):
+        """Sorted distinct values of a dictionary encoded column.
+        """
+        return self.columns[column]["dictionary"]
+
+    def postalcode(self, i):
+        """Postal code of the i-th row.
+        """
+        info = self.arrays[fields.postalcode]
+        start = info["offset"] + i * POSTALCODE_WIDTH
+        return self._mmap[start:start + POSTALCODE_WIDTH].decode("ascii")
+
+    def find_postalcodes(self, postalcodes):
+        """Row numbers of many postal codes, one vectorized binary search of
+        the sorted postal code column. Requires numpy.
+
+        :param postalcodes: list of normalized postal code.
+
+        :return: (rows, found), two numpy arrays in input order, the row
+          number of a postal code not found is meaningless.
+        """
+        column = self.numpy(fields.postalcode)
+        keys = list()
+        for postalcode in postalcodes:
+            try:
+                keys.append(postalcode.encode("ascii"))
+            except UnicodeError:
+                keys.append(b"")  # never matches
+        keys = np.array(keys, dtype="S%s" % max(
+            [POSTALCODE_WIDTH] + [len(key) for key in keys]))
+        rows = np.minimum(np.searchsorted(column, keys), self.n_rows - 1)
+        return rows, column[rows] == keys
+
+    def value(self, column, i):
+        """Decoded value of ``column`` in the i-th row.
+        """
+        header = self.columns[column]
+        encoding = header["encoding"]
+        if encoding == FIXED:
+            return self.postalcode(i)
+        value = self.array(header["array"])[i]
+        if encoding == DICTIONARY:
+            return header["dictionary"][value]
+        if value != value or value == header.get("null"):  # NaN or null
+            return None
+        return value
+
+    def _row_decoders(self):
+        """(column, view, dictionary, null) of every column but postal code,
+        so :meth:`row` doesn't look up the headers again.
+        """
+        if self._decoders is None:
+            decoders = list()
+            for column, encoding, _ in schema[1:]:
+                header = self.columns[column]
+                decoders.append((
+                    column, self.array(header["array"]),
+                    header.get("dictionary"), header.get("null"),
+                ))
+            self._decoders = decoders
+        return self._decoders
+
+    def row(self, i):
+        """The i-th row as a dict, same as the json records.
+        """
+        if not (-self.n_rows <= i < self.n_rows):
+            raise IndexError("row index out of range")
+        if i < 0:
+            i += self.n_rows
+        row = {fields.postalcode: self.postalcode(i)}
+        for column, view, dictionary, null in self._row_decoders():
+            value = view[i]
+            if dictionary is not None:
+                value = dictionary[value]
+            elif value != value or value == null:  # NaN or null
+                value = None
+            row[column] = value
+        return row
+
+    def postalcode_index(self):
+        """Build the exact lookup hash index.
+
+        :return: dict of postal code -> row number.
+        """
+        info = self.arrays[fields.postalcode]
+        start = info["offset"]
+        blob = self._mmap[start:start + self.n_rows * POSTALCODE_WIDTH] \
+            .decode("ascii")
+        return {blob[i:i + POSTALCODE_WIDTH]: row for row, i in enumerate(
+            range(0, len(blob), POSTALCODE_WIDTH))}
+
+    def rows(self, indices):
+        """Many rows as dicts, same as :meth:`row` for each index, decoded
+        column by column with numpy. Requires numpy.
+
+        :param indices: row numbers, non negative.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        columns = list()
+        for column, encoding, _ in schema:
+            header = self.columns[column]
+            values = self.numpy(header["array"])[indices]
+            if encoding == FIXED:
+                values = values.astype("U").tolist()
+            elif encoding == DICTIONARY:
+                dictionary = header["dictionary"]
+                values = [dictionary[code] for code in values.tolist()]
+            else:
+                if "null" in header:
+                    null = values == header["null"]
+                else:
+                    null = values != values  # NaN
+                values = values.tolist()
+                for i in null.nonzero()[0].tolist():
+                    values[i] = None
+            columns.append((column, values))
+        names = [column for column, _ in columns]
+        return [dict(zip(names, values))
+                for values in zip(*[values for _, values in columns])]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Build a file exactly once, even if many processes ask for it at the same
+time.
+
+The builder writes to a temp file next to the target and renames it into
+place, so readers never see a half-built file. A lock file, created with
+``O_CREAT | O_EXCL`` (atomic on every platform), elects a single builder.
+The other processes wait until the target shows up. A lock left over by a
+dead process is broken once it's older than the timeout.
+
+**中文文档**
+
+多个进程同时需要构建同一个文件时, 只有拿到锁的进程真正构建, 构建时写入临时
+文件, 完成后 rename 到目标路径。其他进程等待, 然后直接使用构建好的文件。
+"""
+
+import os
+import sys
+import time
+import uuid
+import errno
+
+
+class LockTimeout(Exception):
+    """Raised when waiting for another process's build takes too long.
+    """
+
+
+def _replace(src, dst):
+    if sys.version_info[0] == 3:
+        os.replace(src, dst)
+    else:  # os.rename is atomic on POSIX
+        os.rename(src, dst)
+
+
+def _break_stale_lock(lock_path, timeout):
+    """Remove a lock file left over by a dead process.
+
+    Several waiters can find the same stale lock, and by the time one of
+    them removes it, another may already have broken it and created a fresh
+    lock of its own. So the lock is first renamed to a name only this
+    process knows (rename is atomic, only one waiter wins it), then its age
+    is checked again on the renamed file. A fresh lock was taken from a
+    live builder by mistake and is put back.
+    """
+    broken_path = "%s.%s.%s.broken" % (
+        lock_path, os.getpid(), uuid.uuid4().hex)
+    os.rename(lock_path, broken_path)  # OSError if another waiter won
+    try:
+        if time.time() - os.path.getmtime(broken_path) <= timeout:
+            try:  # link fails if a new lock was created in between
+                os.link(broken_path, lock_path)
+            except (OSError, AttributeError):
+                pass
+    finally:
+        os.remove(broken_path)
+
+
+def _release(fd, lock_path):
+    """Close and remove our lock file, unless it's no longer ours.
+    """
+    try:
+        mine = os.path.samestat(os.fstat(fd), os.stat(lock_path))
+    except OSError:  # already removed
+        mine = False
+    os.close(fd)
+    if mine:
+        os.remove(lock_path)
+
+
+def atomic_build(path, build, timeout=600, poll_interval=0.05):
+    """Make sure ``path`` exists, call ``build(tmp_path)`` to create it if not.
+
+    :param path: the target file.
+    :param build: callable, takes a temp file path and creates the file
+      there. It's called at most once across all processes racing on
+      ``path``.
+    :param timeout: max seconds to wait for another process's build. A lock
+      file older than this is considered left over by a dead process and
+      is broken.
+    :param poll_interval: seconds between two checks while waiting.
+
+    :return: True if this process built the file, False if it already
+      existed or another process built it.
+    """
+    if os.path.exists(path):
+        return False
+
+    lock_path = path + ".lock"
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+            # someone else is building it, wait for the result
+            if os.path.exists(path):
+                return False
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    _break_stale_lock(lock_path, timeout)
+                    continue
+            except OSError:  # lock released in between
+                continue
+            if time.time() > deadline:
+                raise LockTimeout(
+                    "waited %s seconds for '%s'!" % (timeout, lock_path))
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            os.write(fd, str(os.getpid()).encode("utf-8"))
+
+            # built by the previous lock holder while we were waiting
+            if os.path.exists(path):
+                return False
+
+            tmp_path = "%s.%s.tmp" % (path, os.getpid())
+            try:
+                build(tmp_path)
+                _replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return True
+        finally:
+            _release(fd, lock_path)
@@ -8,7 +8,16 @@ ported from python-Levenshtein
 License available here: https://github.com/miohtama/python-Levenshtein/blob/master/COPYING
 """
 
-from Levenshtein import *
+try:
+    from Levenshtein import ratio, distance, editops, opcodes, \
+        matching_blocks
+    #: whether the python-Levenshtein C extension is used
+    NATIVE = True
+except ImportError:
+    # same results, bit-parallel pure python, much faster than difflib
+    from .pure_levenshtein import ratio, distance, editops, opcodes, \
+        matching_blocks
+    NATIVE = False
 from warnings import warn
 
 
@@ -27,6 +27,7 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from __future__ import unicode_literals
 import platform
 import warnings
+from collections import Counter
 
 try:
     from .StringMatcher import StringMatcher as SequenceMatcher
@@ -37,6 +38,11 @@ except ImportError:
 
 from . import utils
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 ###########################
 # Basic Scoring Functions #
@@ -157,6 +163,16 @@ def _token_set(s1, s2, partial=True, force_ascii=True, full_process=True):
     tokens1 = set(p1.split())
     tokens2 = set(p2.split())
 
+    if partial:
+        ratio_func = partial_ratio
+    else:
+        ratio_func = ratio
+
+    return _token_set_of_sets(tokens1, tokens2, ratio_func)
+
+
+def _token_set_of_sets(tokens1, tokens2, ratio_func):
+    """Token set ratio of two sets of tokens."""
     intersection = tokens1.intersection(tokens2)
     diff1to2 = tokens1.difference(tokens2)
     diff2to1 = tokens2.difference(tokens1)
@@ -173,11 +189,6 @@ def _token_set(s1, s2, partial=True, force_ascii=True, full_process=True):
     combined_1to2 = combined_1to2.strip()
     combined_2to1 = combined_2to1.strip()
 
-    if partial:
-        ratio_func = partial_ratio
-    else:
-        ratio_func = ratio
-
     pairwise = [
         ratio_func(sorted_sect, combined_1to2),
         ratio_func(sorted_sect, combined_2to1),
@@ -315,3 +326,298 @@ def UWRatio(s1, s2):
     using different algorithms. Same as WRatio but preserving unicode.
     """
     return WRatio(s1, s2, force_ascii=False)
+
+
+####################
+# Prepared Strings #
+####################
+
+class PreparedString(object):
+    """A string with the forms WRatio uses computed once: processed,
+    token sorted, token set, and the character counts of the upper bound.
+    Prepare a vocabulary once, score many queries against it with
+    :func:`WRatio_prepared`.
+    """
+    __slots__ = ("string", "processed", "sorted_tokens", "tokens",
+                 "n_tokens", "chars", "spaces", "set_chars")
+
+    def __init__(self, s, force_ascii=True):
+        self.string = s
+        self.processed = utils.full_process(s, force_ascii=force_ascii)
+        tokens = self.processed.split()
+        self.sorted_tokens = u" ".join(sorted(tokens)).strip()
+        self.tokens = set(tokens)
+        self.n_tokens = len(tokens)
+        # the token sorted and token set strings have the same characters
+        # as the processed string, but spaces, unless a token is repeated
+        self.chars = Counter(self.processed.replace(u" ", u""))
+        self.spaces = self.processed.count(u" ")
+        if len(self.tokens) == len(tokens):
+            self.set_chars = self.chars
+        else:
+            self.set_chars = Counter(u"".join(self.tokens))
+
+
+def WRatio_prepared(s1, s2):
+    """``WRatio(s1.string, s2.string)`` of two :class:`PreparedString`, same
+    score, without processing, tokenizing and sorting the strings again.
+    """
+    p1 = s1.processed
+    p2 = s2.processed
+
+    if not utils.validate_string(p1):
+        return 0
+    if not utils.validate_string(p2):
+        return 0
+
+    # should we look at partials?
+    try_partial = True
+    unbase_scale = .95
+    partial_scale = .90
+
+    base = ratio(p1, p2)
+    len_ratio = float(max(len(p1), len(p2))) / min(len(p1), len(p2))
+
+    # if strings are similar length, don't use partials
+    if len_ratio < 1.5:
+        try_partial = False
+
+    # if one string is much much shorter than the other
+    if len_ratio > 8:
+        partial_scale = .6
+
+    if try_partial:
+        partial = partial_ratio(p1, p2) * partial_scale
+        ptsor = partial_ratio(s1.sorted_tokens, s2.sorted_tokens) \
+            * unbase_scale * partial_scale
+        ptser = _token_set_of_sets(s1.tokens, s2.tokens, partial_ratio) \
+            * unbase_scale * partial_scale
+
+        return utils.intr(max(base, partial, ptsor, ptser))
+    else:
+        tsor = ratio(s1.sorted_tokens, s2.sorted_tokens) * unbase_scale
+        tser = _token_set_of_sets(s1.tokens, s2.tokens, ratio) \
+            * unbase_scale
+
+        return utils.intr(max(base, tsor, tser))
+
+
+################
+# Upper Bounds #
+################
+
+def _ratio_bound(common, len1, len2, partial=False):
+    """Upper bound of ``ratio`` or ``partial_ratio`` of two strings of
+    length ``len1``, ``len2`` having ``common`` characters in common,
+    counted with multiplicity.
+
+    The matching characters of two strings are at most their common
+    characters (``quick_ratio`` of difflib). A partial ratio compares the
+    shorter string with a substring of the longer one, at most as long as
+    the shorter one.
+    """
+    if not len1 or not len2:
+        return 0
+    if partial:
+        r = 2.0 * common / (min(len1, len2) + common) if common else 0
+        if r > .995:
+            return 100
+    else:
+        r = 2.0 * common / (len1 + len2)
+    return utils.intr(100 * r)
+
+
+def WRatio_prepared_upper_bound(s1, s2):
+    """Upper bound of ``WRatio_prepared(s1, s2)``. Much cheaper than
+    ``WRatio``, it only counts characters, it follows the steps of
+    ``WRatio`` with every sub-ratio replaced by :func:`_ratio_bound`.
+
+    The token set ratios can be 100 as soon as the two strings share a
+    token, their bound is 100 then.
+    """
+    p1 = s1.processed
+    p2 = s2.processed
+
+    if not utils.validate_string(p1):
+        return 0
+    if not utils.validate_string(p2):
+        return 0
+
+    try_partial = True
+    unbase_scale = .95
+    partial_scale = .90
+
+    common = sum((s1.chars & s2.chars).values())
+    base = _ratio_bound(
+        common + min(s1.spaces, s2.spaces), len(p1), len(p2))
+    len_ratio = float(max(len(p1), len(p2))) / min(len(p1), len(p2))
+
+    if len_ratio < 1.5:
+        try_partial = False
+
+    if len_ratio > 8:
+        partial_scale = .6
+
+    # token sorted strings
+    sorted_args = (common + min(s1.n_tokens, s2.n_tokens) - 1,
+                   len(s1.sorted_tokens), len(s2.sorted_tokens))
+
+    # token set strings, without common token only the remainders compare
+    if s1.tokens & s2.tokens:
+        set_args = None
+    else:
+        if s1.set_chars is s1.chars and s2.set_chars is s2.chars:
+            set_common = common
+        else:
+            set_common = sum((s1.set_chars & s2.set_chars).values())
+        set_args = (
+            set_common + min(len(s1.tokens), len(s2.tokens)) - 1,
+            sum(s1.set_chars.values()) + len(s1.tokens) - 1,
+            sum(s2.set_chars.values()) + len(s2.tokens) - 1,
+        )
+
+    if try_partial:
+        partial = _ratio_bound(
+            common + min(s1.spaces, s2.spaces), len(p1), len(p2),
+            partial=True) * partial_scale
+        ptsor = _ratio_bound(*sorted_args, partial=True) \
+            * unbase_scale * partial_scale
+        if set_args is None:
+            ptser = 100 * unbase_scale * partial_scale
+        else:
+            ptser = _ratio_bound(*set_args, partial=True) \
+                * unbase_scale * partial_scale
+
+        return utils.intr(max(base, partial, ptsor, ptser))
+    else:
+        tsor = _ratio_bound(*sorted_args) * unbase_scale
+        if set_args is None:
+            tser = 100 * unbase_scale
+        else:
+            tser = _ratio_bound(*set_args) * unbase_scale
+
+        return utils.intr(max(base, tsor, tser))
+
+
+def WRatio_upper_bound(p1, p2):
+    """Upper bound of ``WRatio(p1, p2)``, ``p1`` and ``p2`` are already
+    processed with ``full_process(s, force_ascii=True)``, see
+    :func:`WRatio_prepared_upper_bound`.
+    """
+    return WRatio_prepared_upper_bound(PreparedString(p1), PreparedString(p2))
+
+
+class PreparedArrays(object):
+    """The lengths, token counts and character counts of many
+    :class:`PreparedString` as numpy arrays, for
+    :func:`WRatio_prepared_upper_bounds`. Requires numpy.
+    """
+
+    def __init__(self, prepared):
+        n = len(prepared)
+        self.length = np.array([len(p.processed) for p in prepared])
+        self.spaces = np.array([p.spaces for p in prepared])
+        self.n_tokens = np.array([p.n_tokens for p in prepared])
+        self.sorted_length = np.array(
+            [len(p.sorted_tokens) for p in prepared])
+        self.n_set_tokens = np.array([len(p.tokens) for p in prepared])
+        self.set_length = np.array([sum(p.set_chars.values())
+                                    for p in prepared])
+        # the token set of these strings has other characters
+        self.repeated = np.array([p.set_chars is not p.chars
+                                  for p in prepared], dtype=bool)
+
+        alphabet = sorted(set().union(*[p.chars for p in prepared]))
+        self.column = {char: i for i, char in enumerate(alphabet)}
+        self.chars = np.zeros((len(alphabet), n), dtype=np.int32)
+        postings = dict()
+        for i, p in enumerate(prepared):
+            for char, count in p.chars.items():
+                self.chars[self.column[char], i] = count
+            for token in p.tokens:
+                postings.setdefault(token, list()).append(i)
+        self.postings = {token: np.array(indices)
+                         for token, indices in postings.items()}
+
+
+def _ratio_bounds(common, len1, len2, partial=False):
+    """Vectorized :func:`_ratio_bound`, not rounded."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if partial:
+            r = 2.0 * common / (np.minimum(len1, len2) + common)
+            r = np.where(common > 0, r, 0.0)
+            r = np.where(r > .995, 1.0, r)
+        else:
+            r = 2.0 * common / (len1 + len2)
+    return np.where((len1 > 0) & (len2 > 0), 100 * r, 0.0)
+
+
+def WRatio_prepared_upper_bounds(s1, arrays):
+    """:func:`WRatio_prepared_upper_bound` of ``s1`` against all strings of
+    a :class:`PreparedArrays` at once, a float ``numpy.ndarray``.
+
+    The sub-ratios aren't rounded, a bound can be up to 1 lower than
+    :func:`WRatio_prepared_upper_bound`. The bound of a string with a
+    repeated token is inf, use the exact bound for it.
+    """
+    n = len(arrays.length)
+    if not utils.validate_string(s1.processed):
+        return np.zeros(n)
+
+    def common_chars(chars):
+        common = np.zeros(n, dtype=np.int32)
+        for char, count in chars.items():
+            i = arrays.column.get(char)
+            if i is not None:
+                common += np.minimum(arrays.chars[i], count)
+        return common
+
+    common = common_chars(s1.chars)
+    if s1.set_chars is s1.chars:
+        set_common = common
+    else:
+        set_common = common_chars(s1.set_chars)
+    share_token = np.zeros(n, dtype=bool)
+    for token in s1.tokens:
+        indices = arrays.postings.get(token)
+        if indices is not None:
+            share_token[indices] = True
+
+    len1, len2 = len(s1.processed), arrays.length
+    with np.errstate(divide="ignore", invalid="ignore"):
+        len_ratio = np.maximum(len1, len2) / np.minimum(len1, len2)
+    try_partial = len_ratio >= 1.5
+    unbase_scale = .95
+    partial_scale = np.where(len_ratio > 8, .6, .90)
+
+    base = _ratio_bounds(
+        common + np.minimum(s1.spaces, arrays.spaces), len1, len2)
+    sorted_args = (common + np.minimum(s1.n_tokens, arrays.n_tokens) - 1,
+                   len(s1.sorted_tokens), arrays.sorted_length)
+    set_args = (
+        set_common + np.minimum(len(s1.tokens), arrays.n_set_tokens) - 1,
+        sum(s1.set_chars.values()) + len(s1.tokens) - 1,
+        arrays.set_length + arrays.n_set_tokens - 1,
+    )
+
+    partial = _ratio_bounds(
+        common + np.minimum(s1.spaces, arrays.spaces), len1, len2,
+        partial=True) * partial_scale
+    ptsor = _ratio_bounds(*sorted_args, partial=True) \
+        * unbase_scale * partial_scale
+    ptser = np.where(share_token, 100.0,
+                     _ratio_bounds(*set_args, partial=True)) \
+        * unbase_scale * partial_scale
+
+    tsor = _ratio_bounds(*sorted_args) * unbase_scale
+    tser = np.where(share_token, 100.0, _ratio_bounds(*set_args)) \
+        * unbase_scale
+
+    bounds = np.where(
+        try_partial,
+        np.maximum(np.maximum(base, partial), np.maximum(ptsor, ptser)),
+        np.maximum(base, np.maximum(tsor, tser)),
+    )
+    bounds[len2 == 0] = 0.0
+    bounds[arrays.repeated] = np.inf
+    return bounds
@@ -37,6 +37,69 @@ default_scorer = fuzz.WRatio
 default_processor = utils.full_process
 
 
+class PreparedChoices(object):
+    """A list of string choices processed, tokenized and sorted once (see
+    fuzz.PreparedString), for a vocabulary matched against many queries.
+
+    Pass it as ``choices`` to extract(), extractBests(), extractOne() and
+    extractWithoutOrder(). With the default processor (or None) and the
+    fuzz.WRatio scorer, the prepared forms are scored with
+    fuzz.WRatio_prepared, same scores, otherwise the plain strings are used.
+    """
+
+    def __init__(self, choices):
+        self.prepared = [fuzz.PreparedString(choice) for choice in choices]
+        self._by_choice = {p.string: p for p in self.prepared}
+        self._arrays = None
+
+    @property
+    def choices(self):
+        return [p.string for p in self.prepared]
+
+    def __len__(self):
+        return len(self.prepared)
+
+    def __iter__(self):
+        return iter(self.choices)
+
+    def subset(self, choices):
+        """PreparedChoices of some of the choices, without preparing them
+        again.
+        """
+        subset = PreparedChoices([])
+        subset.prepared = [self._by_choice[choice] for choice in choices]
+        subset._by_choice = {p.string: p for p in subset.prepared}
+        return subset
+
+    def above(self, prepared_query, score_cutoff):
+        """The prepared choices whose WRatio with the query may reach
+        score_cutoff, in order. Their upper bounds are computed all at once
+        with numpy (fuzz.WRatio_prepared_upper_bounds), for large choice
+        lists only, otherwise all prepared choices are returned.
+        """
+        if fuzz.np is None or score_cutoff <= 0 or \
+                len(self.prepared) < PREFILTER_MIN_CHOICES:
+            return self.prepared
+        if self._arrays is None:
+            self._arrays = fuzz.PreparedArrays(self.prepared)
+        bounds = fuzz.WRatio_prepared_upper_bounds(
+            prepared_query, self._arrays)
+        # the vectorized bounds are at most 1 lower
+        prepared = self.prepared
+        return [prepared[i] for i in
+                fuzz.np.flatnonzero(bounds + 1 >= score_cutoff).tolist()]
+
+
+#: PreparedChoices with fewer choices are not prefiltered with numpy
+PREFILTER_MIN_CHOICES = 256
+
+
+def _use_prepared(choices, processor, scorer):
+    """Whether the prepared forms of PreparedChoices can be scored."""
+    return isinstance(choices, PreparedChoices) and \
+        scorer == fuzz.WRatio and processor in (utils.full_process, None)
+
+
 def extractWithoutOrder(query, choices, processor=default_processor, scorer=default_scorer, score_cutoff=0):
     """Select the best match in a list or dictionary of choices.
 
@@ -83,6 +146,18 @@ def extractWithoutOrder(query, choices, processor=default_processor, scorer=defa
 
         ('train', 22, 'bard'), ('man', 0, 'dog')
     """
+    # PreparedChoices, score the prepared forms or fall back to the strings
+    if isinstance(choices, PreparedChoices):
+        if _use_prepared(choices, processor, scorer):
+            prepared_query = fuzz.PreparedString(
+                query if processor is None else processor(query))
+            for p in choices.prepared:
+                score = fuzz.WRatio_prepared(prepared_query, p)
+                if score >= score_cutoff:
+                    yield (p.string, score)
+            return
+        choices = choices.choices
+
     # Catch generators without lengths
     def no_process(x):
         return x
@@ -206,7 +281,7 @@ def extractBests(query, choices, processor=default_processor, scorer=default_sco
         sorted(best_list, key=lambda i: i[1], reverse=True)
 
 
-def extractOne(query, choices, processor=default_processor, scorer=default_scorer, score_cutoff=0):
+def extractOne(query, choices, processor=default_processor, scorer=default_scorer, score_cutoff=0, prune=False):
     """Find the single best match above a score in a list of choices.
 
     This is a convenience method which returns the single best choice.
@@ -222,11 +297,18 @@ def extractOne(query, choices, processor=default_processor, scorer=default_score
         score_cutoff: Optional argument for score threshold. If the best
             match is found, but it is not greater than this number, then
             return None anyway ("not a good enough match").  Defaults to 0.
+        prune: Optional, if True and the scorer is fuzz.WRatio, skip the
+            choices whose score upper bound (fuzz.WRatio_upper_bound) can't
+            beat the best score so far, and stop at a perfect 100. Same
+            result, faster. Defaults to False.
 
     Returns:
         A tuple containing a single match and its score, if a match
         was found that was above score_cutoff. Otherwise, returns None.
     """
+    if prune and scorer == fuzz.WRatio:
+        return _extractOnePruned(query, choices, processor, score_cutoff)
+
     best_list = extractWithoutOrder(
         query, choices, processor, scorer, score_cutoff)
     try:
@@ -235,6 +317,53 @@ def extractOne(query, choices, processor=default_processor, scorer=default_score
         return None
 
 
+def _extractOnePruned(query, choices, processor, score_cutoff):
+    """extractOne with fuzz.WRatio, choices that can't beat the best score
+    so far aren't scored. The first of the best choices is returned, like
+    max() does.
+    """
+    def no_process(x):
+        return x
+
+    if choices is None:
+        return None
+    use_prepared = _use_prepared(choices, processor, fuzz.WRatio)
+    if processor is None:
+        processor = no_process
+
+    # WRatio processes both strings again, processing twice is the same
+    prepared_query = fuzz.PreparedString(processor(query))
+    if use_prepared:
+        items = ((None, p.string, p)
+                 for p in choices.above(prepared_query, score_cutoff))
+        keyed = False
+    else:
+        if isinstance(choices, PreparedChoices):
+            choices = choices.choices
+        if processor == utils.full_process:
+            processor = no_process
+        try:
+            items = ((key, choice, fuzz.PreparedString(processor(choice)))
+                     for key, choice in choices.items())
+            keyed = True
+        except AttributeError:
+            items = ((None, choice, fuzz.PreparedString(processor(choice)))
+                     for choice in choices)
+            keyed = False
+
+    best = None
+    for key, choice, prepared in items:
+        bound = fuzz.WRatio_prepared_upper_bound(prepared_query, prepared)
+        if bound < score_cutoff or (best is not None and bound <= best[1]):
+            continue
+        score = fuzz.WRatio_prepared(prepared_query, prepared)
+        if score >= score_cutoff and (best is None or score > best[1]):
+            best = (choice, score, key) if keyed else (choice, score)
+            if score == 100:
+                break
+    return best
+
+
 def dedupe(contains_dupes, threshold=70, scorer=fuzz.token_set_ratio):
     """This convenience function takes a list of strings containing duplicates and uses fuzzy matching to identify
     and remove duplicates. Specifically, it uses the process.extract to identify duplicates that
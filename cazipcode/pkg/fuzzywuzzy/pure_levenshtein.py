@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+pure_levenshtein.py
+
+Pure python replacement of the functions of the python-Levenshtein C
+extension used by StringMatcher: distance, ratio, editops, opcodes and
+matching_blocks.
+
+Both edit distances are bit-parallel, a python int is a bit vector as long
+as the first string, one row of the dynamic programming matrix is updated
+with a few integer operations per character of the second string:
+
+- distance, Levenshtein distance (substitution cost 1): Myers' algorithm as
+  formulated by Hyyro.
+- ratio, ``2 * LCS / (len1 + len2)``, same as ``Levenshtein.ratio``
+  (substitution cost 2): the bit-parallel LCS length of Allison-Dix / Hyyro.
+- editops, opcodes, matching_blocks: an optimal Levenshtein alignment,
+  backtracked through the bit vectors of the distance rows.
+"""
+
+
+def _pattern_masks(s):
+    """dict of character -> bit mask of its positions in ``s``."""
+    masks = dict()
+    for i, c in enumerate(s):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    return masks
+
+
+def _distance_rows(s1, s2):
+    """Distance and the (vp, vn) bit vectors of the rows of the Levenshtein
+    matrix, one per character of ``s2``. Bit i of vp / vn is set if the
+    distance grows / shrinks by one from s1[:i] to s1[:i + 1].
+    """
+    m = len(s1)
+    masks = _pattern_masks(s1)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp = full
+    vn = 0
+    dist = m
+    rows = list()
+    for c in s2:
+        x = masks.get(c, 0) | vn
+        d0 = (((x & vp) + vp) ^ vp) | x
+        hp = (vn | ~(d0 | vp)) & full
+        hn = d0 & vp
+        if hp & last:
+            dist += 1
+        elif hn & last:
+            dist -= 1
+        hp = (hp << 1) | 1
+        hn = hn << 1
+        vp = (hn | ~(d0 | hp)) & full
+        vn = d0 & hp & full
+        rows.append((vp, vn))
+    return dist, rows
+
+
+def distance(s1, s2):
+    """Levenshtein distance, insert, delete and substitute cost 1."""
+    if not s1:
+        return len(s2)
+    return _distance_rows(s1, s2)[0]
+
+
+def lcs_length(s1, s2):
+    """Length of the longest common subsequence."""
+    if not s1 or not s2:
+        return 0
+    masks = _pattern_masks(s1)
+    full = (1 << len(s1)) - 1
+    s = full
+    for c in s2:
+        u = s & masks.get(c, 0)
+        s = ((s + u) | (s - u)) & full
+    return len(s1) - bin(s).count("1")
+
+
+def ratio(s1, s2):
+    """Similarity between 0 and 1, ``2 * LCS / (len1 + len2)``."""
+    lensum = len(s1) + len(s2)
+    if not lensum:
+        return 1.0
+    return 2.0 * lcs_length(s1, s2) / lensum
+
+
+def _editops(s1, s2):
+    """Edit operations of an optimal Levenshtein alignment. The common
+    prefix and suffix are matched first, the rest is backtracked through
+    the bit vectors of the rows.
+    """
+    prefix = 0
+    while prefix < min(len(s1), len(s2)) and s1[prefix] == s2[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(s1), len(s2)) - prefix and \
+            s1[-suffix - 1] == s2[-suffix - 1]:
+        suffix += 1
+    s1 = s1[prefix:len(s1) - suffix]
+    s2 = s2[prefix:len(s2) - suffix]
+
+    rows = _distance_rows(s1, s2)[1] if s1 else list()
+    ops = list()
+    col, row = len(s1), len(s2)
+    while row and col:
+        if (rows[row - 1][0] >> (col - 1)) & 1:
+            col -= 1
+            ops.append(("delete", col + prefix, row + prefix))
+        else:
+            row -= 1
+            if row and (rows[row - 1][1] >> (col - 1)) & 1:
+                ops.append(("insert", col + prefix, row + prefix))
+            else:
+                col -= 1
+                if s1[col] != s2[row]:
+                    ops.append(("replace", col + prefix, row + prefix))
+    while col:
+        col -= 1
+        ops.append(("delete", col + prefix, row + prefix))
+    while row:
+        row -= 1
+        ops.append(("insert", col + prefix, row + prefix))
+    ops.reverse()
+    return ops
+
+
+def _opcodes_to_editops(codes):
+    ops = list()
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "delete":
+            ops.extend([("delete", i, j1) for i in range(i1, i2)])
+        elif tag == "insert":
+            ops.extend([("insert", i1, j) for j in range(j1, j2)])
+        elif tag == "replace":
+            ops.extend([("replace", i1 + k, j1 + k)
+                        for k in range(i2 - i1)])
+    return ops
+
+
+def _editops_to_opcodes(ops, len1, len2):
+    codes = list()
+    i = j = 0
+    for tag, spos, dpos in ops:
+        if spos > i or dpos > j:
+            n = min(spos - i, dpos - j)
+            codes.append(("equal", i, i + n, j, j + n))
+            i, j = i + n, j + n
+        if tag == "delete":
+            codes.append(("delete", i, i + 1, j, j))
+            i += 1
+        elif tag == "insert":
+            codes.append(("insert", i, i, j, j + 1))
+            j += 1
+        else:
+            codes.append(("replace", i, i + 1, j, j + 1))
+            i, j = i + 1, j + 1
+    if i < len1 or j < len2:
+        codes.append(("equal", i, len1, j, len2))
+
+    # merge the runs of the same operation
+    merged = list()
+    for code in codes:
+        if merged and merged[-1][0] == code[0] and \
+                merged[-1][2] == code[1] and merged[-1][4] == code[3]:
+            merged[-1] = (code[0], merged[-1][1], code[2],
+                          merged[-1][3], code[4])
+        else:
+            merged.append(code)
+    return merged
+
+
+def _length(s):
+    return s if isinstance(s, int) else len(s)
+
+
+def editops(*args):
+    """``editops(s1, s2)``, edit operations turning s1 into s2, list of
+    (tag, source position, destination position). ``editops(opcodes, s1,
+    s2)`` converts opcodes.
+    """
+    if len(args) == 3:
+        return _opcodes_to_editops(args[0])
+    return _editops(*args)
+
+
+def opcodes(*args):
+    """``opcodes(s1, s2)``, difflib style list of (tag, i1, i2, j1, j2)
+    turning s1 into s2. ``opcodes(editops, s1, s2)`` converts editops.
+    """
+    if len(args) == 3:
+        ops, s1, s2 = args
+    else:
+        s1, s2 = args
+        ops = _editops(s1, s2)
+    return _editops_to_opcodes(ops, _length(s1), _length(s2))
+
+
+def matching_blocks(ops, s1, s2):
+    """difflib style matching blocks, list of (i, j, n) with the last one
+    (len1, len2, 0), from editops or opcodes.
+    """
+    len1, len2 = _length(s1), _length(s2)
+    if ops and len(ops[0]) == 3:
+        ops = _editops_to_opcodes(ops, len1, len2)
+    blocks = [(i1, j1, i2 - i1)
+              for tag, i1, i2, j1, j2 in ops if tag == "equal"]
+    blocks.append((len1, len2, 0))
+    return blocks
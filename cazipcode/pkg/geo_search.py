@@ -1,11 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import heapq
-from math import radians, cos, sin, asin, sqrt
-from sqlalchemy import create_engine, MetaData, Table, Column, Index
-from sqlalchemy import String, Float, PickleType
-from sqlalchemy import select, and_, func
+import sqlite3
+from numbers import Number
+from math import radians, degrees, cos, sin, asin, sqrt, pi
+from sqlalchemy import create_engine, MetaData, Table, Column
+from sqlalchemy import String, Integer, Float
+from sqlalchemy import select, func, and_, or_, union_all, literal_column
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 AVG_EARTH_RADIUS = 6371  # in km
@@ -25,7 +33,8 @@ def great_circle(point1, point2, miles=True):
     lat2, lng2 = point2
 
     # convert all latitudes/longitudes from decimal degrees to radians
-    lat1, lng1, lat2, lng2 = list(map(radians, [lat1, lng1, lat2, lng2]))
+    lat1, lng1 = radians(lat1), radians(lng1)
+    lat2, lng2 = radians(lat2), radians(lng2)
 
     # calculate haversine
     lat = lat2 - lat1
@@ -38,87 +47,485 @@ def great_circle(point1, point2, miles=True):
         return h  # in kilometers
 
 
+def great_circle_array(lat1, lng1, lat2, lng2, miles=True):
+    """Vectorized :func:`great_circle`.
+
+    With numpy, arguments are anything ``numpy.asarray`` accepts and
+    broadcast against each other, e.g. one point against arrays of points,
+    or a column of points against a row of points for a distance matrix.
+    Returns a ``numpy.ndarray``.
+
+    Without numpy, each argument is a number or a sequence (all sequences
+    of the same length), returns a list.
+    """
+    if np is not None:
+        lat1, lng1 = np.radians(lat1), np.radians(lng1)
+        lat2, lng2 = np.radians(lat2), np.radians(lng2)
+        d = np.sin((lat2 - lat1) / 2) ** 2 + \
+            np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        h = 2 * AVG_EARTH_RADIUS * np.arcsin(np.sqrt(d))
+        if miles:
+            return h * 0.621371  # in miles
+        else:
+            return h  # in kilometers
+
+    # pure python, numbers are repeated to the length of the sequences
+    args = [lat1, lng1, lat2, lng2]
+    lengths = [len(arg) for arg in args if not isinstance(arg, Number)]
+    n = lengths[0] if lengths else 1
+    args = [[arg] * n if isinstance(arg, Number) else arg for arg in args]
+    return [great_circle((a, b), (c, d), miles=miles)
+            for a, b, c, d in zip(*args)]
+
+
+def bounding_boxes(lat, lng, radius, miles=True):
+    """Exact lat, lng bounding box of a circle on the earth surface, used
+    as prefilter of a radius search.
+
+    The latitude range is the angular radius around ``lat``. The longitude
+    range is bounded by the two meridians tangent to the circle, it widens
+    with the latitude. A circle covering a pole spans all longitudes, a box
+    crossing longitude 180 is split in two.
+
+    :param lat, lng: center of the circle, in degrees.
+    :param radius: radius of the circle.
+    :param miles: unit of radius, miles or kilometers.
+
+    :return: list of one or two (lat_lower, lat_upper, lng_lower,
+      lng_upper) boxes, within [-90, 90] and [-180, 180].
+    """
+    earth_radius = AVG_EARTH_RADIUS * 0.621371 if miles else AVG_EARTH_RADIUS
+    # a little larger, float error must not drop a point on the circle
+    angle = abs(radius) / earth_radius * (1 + 1e-9)
+    dlat = degrees(angle)
+    lat_lower, lat_upper = lat - dlat, lat + dlat
+
+    # the circle covers a pole
+    if lat_lower <= -90 or lat_upper >= 90:
+        return [(max(lat_lower, -90.0), min(lat_upper, 90.0), -180.0, 180.0)]
+
+    dlng = degrees(asin(min(1.0, sin(angle) / cos(radians(lat)))))
+    lng_lower, lng_upper = lng - dlng, lng + dlng
+
+    return _split_box(lat_lower, lat_upper, lng_lower, lng_upper)
+
+
+def _split_box(lat_lower, lat_upper, lng_lower, lng_upper):
+    """Split a box crossing longitude 180 in two.
+    """
+    if lng_upper - lng_lower >= 360:
+        return [(lat_lower, lat_upper, -180.0, 180.0)]
+    if lng_lower < -180:
+        return [(lat_lower, lat_upper, lng_lower + 360, 180.0),
+                (lat_lower, lat_upper, -180.0, lng_upper)]
+    if lng_upper > 180:
+        return [(lat_lower, lat_upper, lng_lower, 180.0),
+                (lat_lower, lat_upper, -180.0, lng_upper - 360)]
+    return [(lat_lower, lat_upper, lng_lower, lng_upper)]
+
+
+#--- polygon ---
+def polygon_bounding_box(polygon):
+    """Bounding box of a polygon.
+
+    :return: (lat_lower, lat_upper, lng_lower, lng_upper)
+    """
+    lats = [lat for lat, _ in polygon]
+    lngs = [lng for _, lng in polygon]
+    return min(lats), max(lats), min(lngs), max(lngs)
+
+
+def point_in_polygon(lat, lng, polygon):
+    """Is the point inside the polygon, even-odd ray casting.
+
+    Edges are straight lines in the lat, lng plane, like GeoJSON. The
+    polygon must not cross longitude 180.
+
+    :param polygon: list of (lat, lng) vertices, closing the ring is
+      optional.
+    """
+    inside = False
+    lat1, lng1 = polygon[-1]
+    for lat2, lng2 in polygon:
+        if (lat1 > lat) != (lat2 > lat):
+            if lng < lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1):
+                inside = not inside
+        lat1, lng1 = lat2, lng2
+    return inside
+
+
+def points_in_polygon(lats, lngs, polygon):
+    """Vectorized :func:`point_in_polygon`, a boolean ``numpy.ndarray``, or
+    a list without numpy.
+    """
+    if np is None:
+        return [point_in_polygon(lat, lng, polygon)
+                for lat, lng in zip(lats, lngs)]
+
+    lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+    inside = np.zeros(lats.shape, dtype=bool)
+    lat1, lng1 = polygon[-1]
+    for lat2, lng2 in polygon:
+        if lat1 != lat2:  # a horizontal edge never crosses the ray
+            crosses = (lat1 > lats) != (lat2 > lats)
+            inside ^= crosses & (
+                lngs < lng1 + (lats - lat1) * (lng2 - lng1) / (lat2 - lat1))
+        lat1, lng1 = lat2, lng2
+    return inside
+
+
+#--- route ---
+def _unit(lat, lng):
+    """Unit vector of a point on the sphere.
+    """
+    lat, lng = radians(lat), radians(lng)
+    return cos(lat) * cos(lng), cos(lat) * sin(lng), sin(lat)
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _segments(route):
+    """Great circle arcs of a route, the plane normal and the two vectors
+    bounding the arc.
+
+    A point p projects inside the arc a -> b if ``p . (n x a) >= 0`` and
+    ``p . (b x n)`` >= 0, n is None if a, b are the same point.
+
+    :return: list of ((lat1, lng1), (lat2, lng2), n, n x a, b x n)
+    """
+    if len(route) == 1:
+        route = [route[0], route[0]]
+    segments = list()
+    for point1, point2 in zip(route[:-1], route[1:]):
+        a, b = _unit(*point1), _unit(*point2)
+        n = _cross(a, b)
+        norm = sqrt(_dot(n, n))
+        if norm < 1e-12:  # same point
+            segments.append((point1, point2, None, None, None))
+            continue
+        n = (n[0] / norm, n[1] / norm, n[2] / norm)
+        segments.append((point1, point2, n, _cross(n, a), _cross(b, n)))
+    return segments
+
+
+def distance_to_route(lat, lng, route, miles=True):
+    """Great circle distance from a point to a route, the polyline of great
+    circle arcs between its points.
+
+    :param route: list of (lat, lng) points.
+    """
+    earth_radius = AVG_EARTH_RADIUS * 0.621371 if miles else AVG_EARTH_RADIUS
+    p = _unit(lat, lng)
+    best = float("inf")
+    for point1, point2, n, na, bn in _segments(route):
+        dist = min(great_circle((lat, lng), point1, miles=miles),
+                   great_circle((lat, lng), point2, miles=miles))
+        if n is not None and _dot(p, na) >= 0 and _dot(p, bn) >= 0:
+            # cross track distance, to the closest point of the arc
+            dist = min(dist, asin(min(1.0, abs(_dot(p, n)))) * earth_radius)
+        best = min(best, dist)
+    return best
+
+
+def distances_to_route(lats, lngs, route, miles=True):
+    """Vectorized :func:`distance_to_route`, a ``numpy.ndarray``, or a list
+    without numpy.
+    """
+    if np is None:
+        return [distance_to_route(lat, lng, route, miles=miles)
+                for lat, lng in zip(lats, lngs)]
+
+    earth_radius = AVG_EARTH_RADIUS * 0.621371 if miles else AVG_EARTH_RADIUS
+    lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+    lat, lng = np.radians(lats), np.radians(lngs)
+    p = (np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat))
+    best = np.full(lats.shape, np.inf)
+    for point1, point2, n, na, bn in _segments(route):
+        dist = np.minimum(
+            great_circle_array(point1[0], point1[1], lats, lngs, miles=miles),
+            great_circle_array(point2[0], point2[1], lats, lngs, miles=miles),
+        )
+        if n is not None:
+            within = (_dot(p, na) >= 0) & (_dot(p, bn) >= 0)
+            cross_track = np.arcsin(
+                np.minimum(1.0, np.abs(_dot(p, n)))) * earth_radius
+            dist = np.where(within, np.minimum(dist, cross_track), dist)
+        best = np.minimum(best, dist)
+    return best
+
+
+def route_bounding_boxes(route, buffer, miles=True):
+    """Bounding boxes of the points within ``buffer`` of a route, one (or
+    two, across longitude 180) per arc.
+
+    The latitude range of an arc includes its highest / lowest point when
+    the great circle turns inside the arc. It's extended by the angular
+    buffer, the longitude range by the widest offset at the arc's highest
+    absolute latitude.
+
+    :return: list of (lat_lower, lat_upper, lng_lower, lng_upper)
+    """
+    earth_radius = AVG_EARTH_RADIUS * 0.621371 if miles else AVG_EARTH_RADIUS
+    # a little larger, float error must not drop a point on the border
+    angle = abs(buffer) / earth_radius * (1 + 1e-9)
+    dlat = degrees(angle)
+
+    boxes = list()
+    for (lat1, lng1), (lat2, lng2), n, na, bn in _segments(route):
+        arc_lats = [lat1, lat2]
+        if n is not None:
+            # highest and lowest point of the great circle
+            vertex = (-n[2] * n[0], -n[2] * n[1], 1 - n[2] ** 2)
+            norm = sqrt(_dot(vertex, vertex))
+            if norm > 1e-12:
+                vertex = (vertex[0] / norm, vertex[1] / norm,
+                          vertex[2] / norm)
+                for v in [vertex, (-vertex[0], -vertex[1], -vertex[2])]:
+                    if _dot(v, na) >= 0 and _dot(v, bn) >= 0:
+                        arc_lats.append(degrees(asin(max(-1.0, min(
+                            1.0, v[2])))))
+        lat_lower, lat_upper = min(arc_lats) - dlat, max(arc_lats) + dlat
+
+        # the buffer covers a pole
+        if lat_lower <= -90 or lat_upper >= 90:
+            boxes.append((max(lat_lower, -90.0), min(lat_upper, 90.0),
+                          -180.0, 180.0))
+            continue
+
+        max_abs_lat = max([abs(lat) for lat in arc_lats])
+        dlng = degrees(asin(min(1.0, sin(angle) / cos(radians(max_abs_lat)))))
+        # the arc goes the short way around
+        lng2 = lng1 + (lng2 - lng1 + 180) % 360 - 180
+        boxes.extend(_split_box(lat_lower, lat_upper,
+                                min(lng1, lng2) - dlng,
+                                max(lng1, lng2) + dlng))
+    return boxes
+
+
+#: half of the earth circumference in miles, no point is farther
+MAX_DISTANCE = pi * AVG_EARTH_RADIUS * 0.621371
+
+
 class GeoSearchEngine(object):
-    def __init__(self, name="point", database=":memory:"):
+    """Nearest point search on sqlite, for any (id, lat, lng) data.
+
+    Points are stored in a sqlite table with an R*Tree spatial index (a
+    lat / lng B-tree index if sqlite has no R*Tree module). Each record is
+    serialized into the ``data`` column, only the n nearest are loaded back
+    by a search. A file database trained before can be opened again, with
+    the same serializer.
+
+    :param name: table name.
+    :param database: sqlite database file, in memory by default.
+    :param serializer: module or object with ``dumps`` and ``loads``, json
+      by default (a tuple comes back as a list). Pass ``pickle`` for any
+      python object. ``None`` stores only id, lat, lng, then
+      :meth:`find_n_nearest` returns the ids instead of the records, map
+      them back to your records.
+    """
+
+    def __init__(self, name="point", database=":memory:", serializer=json):
         self.engine = create_engine("sqlite:///%s" % database)
         self.metadata = MetaData()
         self.t_point = Table(name, self.metadata,
                              Column("id", String),
                              Column("lat", Float),
                              Column("lng", Float),
-                             Column("data", PickleType),
+                             Column("data", String),  # text or blob
+                             )
+        # virtual table, created with raw sql, not part of self.metadata
+        self.t_rtree = Table("%s_rtree" % name, MetaData(),
+                             Column("id", Integer),
+                             Column("min_lat", Float),
+                             Column("max_lat", Float),
+                             Column("min_lng", Float),
+                             Column("max_lng", Float),
                              )
+        self.rowid = literal_column("%s.rowid" % name)
+        self.serializer = serializer
+
+        # an existing database
+        self.n_points = 0
+        self.use_rtree = False
+        if self.t_point.exists(self.engine):
+            self.n_points = self.engine.execute(
+                select([func.count()]).select_from(self.t_point)).scalar()
+            self.use_rtree = self.t_rtree.exists(self.engine)
+
+    def _dumps(self, record):
+        value = self.serializer.dumps(record)
+        if isinstance(value, bytes) and not isinstance(value, str):
+            value = sqlite3.Binary(value)  # python3 bytes, stored as blob
+        return value
 
     def train(self, data, key_id, key_lat, key_lng, clear_old=True):
         """Feed data into database.
+
+        Rows are inserted in one transaction through the raw DB-API cursor,
+        the indexes are updated afterwards.
+
+        :param clear_old: drop the existing points, otherwise add to them.
         """
-        engine, t_point = self.engine, self.t_point
+        engine, t_point, t_rtree = self.engine, self.t_point, self.t_rtree
         if clear_old:
+            t_point.drop(engine, checkfirst=True)
+            t_rtree.drop(engine, checkfirst=True)
+            self.n_points = 0
+        t_point.create(engine, checkfirst=True)
+
+        first_rowid = rowid = engine.execute(
+            select([func.max(self.rowid)]).select_from(t_point)).scalar() or 0
+        rows = list()
+        if self.serializer is None:
+            for record in data:
+                rowid += 1
+                rows.append((rowid, key_id(record),
+                             key_lat(record), key_lng(record), None))
+        else:
+            dumps = self._dumps
+            for record in data:
+                rowid += 1
+                rows.append((rowid, key_id(record),
+                             key_lat(record), key_lng(record),
+                             dumps(record)))
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(
+                "INSERT INTO %s (rowid, id, lat, lng, data) "
+                "VALUES (?, ?, ?, ?, ?)" % t_point.name, rows)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_%s_lat_lng ON %s (lat, lng)" %
+                (t_point.name, t_point.name))
             try:
-                t_point.drop(engine)
-            except:
-                pass
-        t_point.create(engine)
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING rtree(%s)" %
+                    (t_rtree.name,
+                     ", ".join([column.name for column in t_rtree.columns])))
+                cursor.execute(
+                    "INSERT INTO %s SELECT rowid, lat, lat, lng, lng "
+                    "FROM %s WHERE rowid > ?" % (t_rtree.name, t_point.name),
+                    (first_rowid,))
+                use_rtree = True
+            except Exception:  # sqlite without the R*Tree module
+                use_rtree = False
+            connection.commit()
+        finally:
+            connection.close()
+        self.use_rtree = use_rtree
+        self.n_points += len(rows)
 
-        table_data = list()
-        for record in data:
-            id = key_id(record)
-            lat = key_lat(record)
-            lng = key_lng(record)
-            row = {"id": id, "lat": lat, "lng": lng, "data": record}
-            table_data.append(row)
+    def _in_box(self, lat, lng, radius):
+        """Points in the bounding boxes of the circle.
 
-        ins = t_point.insert()
-        engine.execute(ins, table_data)
+        :return: list of (rowid, lat, lng)
+        """
+        t_point, t_rtree = self.t_point, self.t_rtree
+        boxes = bounding_boxes(lat, lng, radius)
+        if self.use_rtree:
+            in_box = union_all(*[
+                select([t_rtree.c.id]).where(and_(
+                    t_rtree.c.max_lat >= lat_lower,
+                    t_rtree.c.min_lat <= lat_upper,
+                    t_rtree.c.max_lng >= lng_lower,
+                    t_rtree.c.min_lng <= lng_upper,
+                ))
+                for lat_lower, lat_upper, lng_lower, lng_upper in boxes
+            ])
+            filters = [self.rowid.in_(in_box)]
+        else:
+            filters = [or_(*[
+                and_(
+                    t_point.c.lat >= lat_lower,
+                    t_point.c.lat <= lat_upper,
+                    t_point.c.lng >= lng_lower,
+                    t_point.c.lng <= lng_upper,
+                )
+                for lat_lower, lat_upper, lng_lower, lng_upper in boxes
+            ])]
+        s = select([self.rowid, t_point.c.lat, t_point.c.lng]) \
+            .where(and_(*filters))
+        return self.engine.execute(s).fetchall()
 
-        index = Index('idx_lat_lng', t_point.c.lat, t_point.c.lng)
-        index.create(engine)
+    def _all(self):
+        t_point = self.t_point
+        s = select([self.rowid, t_point.c.lat, t_point.c.lng])
+        return self.engine.execute(s).fetchall()
+
+    def _records(self, rowids):
+        """Records of the rowids, in the same order, their ids without
+        serializer.
+        """
+        if not rowids:
+            return list()
+        if self.serializer is None:
+            column = self.t_point.c.id
+        else:
+            column = self.t_point.c.data
+        s = select([self.rowid, column]).where(self.rowid.in_(rowids))
+        values = dict(self.engine.execute(s).fetchall())
+        if self.serializer is None:
+            return [values[rowid] for rowid in rowids]
+        loads = self.serializer.loads
+        return [loads(values[rowid]) for rowid in rowids]
 
     def find_n_nearest(self, lat, lng, n=5, radius=None):
         """Find n nearest point within certain distance from a point.
 
+        Without radius, the search radius starts small and doubles until n
+        points are within it, each round is a spatial index lookup.
+
         :param lat: latitude of center point.
         :param lng: longitude of center point. 
         :param n: max number of record to return.
         :param radius: only search point within ``radius`` distance.
 
+        :return: list of (distance, record), nearest first, (distance, id)
+          without serializer.
+
         **中文文档**
         """
-        engine, t_point = self.engine, self.t_point
         if radius:
-            # Use a simple box filter to minimize candidates
-            # Define latitude longitude boundary
-            dist_btwn_lat_deg = 69.172
-            dist_btwn_lon_deg = cos(radians(lat)) * 69.172
-            lat_degr_rad = abs(radius * 1.05 / dist_btwn_lat_deg)
-            lon_degr_rad = abs(radius * 1.05 / dist_btwn_lon_deg)
-
-            lat_lower = lat - lat_degr_rad
-            lat_upper = lat + lat_degr_rad
-            lng_lower = lng - lon_degr_rad
-            lng_upper = lng + lon_degr_rad
-
-            filters = [
-                t_point.c.lat >= lat_lower,
-                t_point.c.lat <= lat_upper,
-                t_point.c.lat >= lng_lower,
-                t_point.c.lat >= lng_upper,
-            ]
+            search_radius = radius
         else:
-            radius = 999999.9
-            filters = []
+            radius = MAX_DISTANCE
+            search_radius = self.initial_radius
 
-        s = select([t_point]).where(and_(*filters))
+        while True:
+            if search_radius >= MAX_DISTANCE:
+                rows = self._all()
+            else:
+                rows = self._in_box(lat, lng, search_radius)
 
-        heap = list()
-        for row in engine.execute(s):
-            dist = great_circle((lat, lng), (row.lat, row.lng))
-            if dist <= radius:
-                heap.append((dist, row.data))
+            heap = list()
+            for rowid, row_lat, row_lng in rows:
+                dist = great_circle((lat, lng), (row_lat, row_lng))
+                if dist <= search_radius:
+                    heap.append((dist, rowid))
+
+            # the n nearest are all within the search radius
+            if len(heap) >= n or search_radius >= radius or \
+                    len(heap) >= self.n_points:
+                break
+            search_radius = min(search_radius * 2, radius)
 
         # Use heap sort to find top-K nearest
-        n_nearest = heapq.nsmallest(n, heap, key=lambda x: x[0])
-        return n_nearest
+        n_nearest = heapq.nsmallest(n, heap)
+        records = self._records([rowid for _, rowid in n_nearest])
+        return [(dist, record)
+                for (dist, _), record in zip(n_nearest, records)]
+
+    #: first search radius of :meth:`find_n_nearest` without radius, miles
+    initial_radius = 10.0
 
 
 #--- Unittest ---
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Static 2-d tree over (latitude, longitude) points, for nearest neighbour
+search on the earth surface.
+
+The tree is implicit: node ``k`` has children ``2k+1`` and ``2k+2``, every
+node covers a contiguous range of the ``index`` array (the point ids in
+tree order), and each node stores the bounding box of its points. So the
+whole tree is five flat arrays, which can be saved in a file and memory
+mapped, nothing is rebuilt when it's loaded.
+
+Search is best-first: nodes are visited in order of the lower bound of the
+great circle distance from the query point to their bounding box, and the
+search stops once that bound is larger than the k-th distance found.
+
+Batch search (:meth:`KDTree.nearest_many`) handles many query points at once,
+level by level: every query descends to a node with a few times k points to
+get an upper bound of its k-th distance, then the (query, node) pairs whose
+lower bound is within it are expanded down to the leaves.
+
+**中文文档**
+
+静态的二维树, 用于地球表面上的最近邻搜索。树是隐式的, 只由几个数组组成, 可以
+保存到文件并通过 mmap 加载。搜索时按照与包围盒的最小距离的顺序访问节点。
+"""
+
+import heapq
+from array import array
+from math import radians, cos, sin, asin, sqrt, pi
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from .geo_search import AVG_EARTH_RADIUS, great_circle_array
+except:
+    from cazipcode.pkg.geo_search import AVG_EARTH_RADIUS, great_circle_array
+
+MILES_PER_KM = 0.621371
+HALF_PI = pi / 2
+INF = float("inf")
+
+#: batch search descends to a node with at least ``k * BOUND_NODE_FACTOR``
+#: points to bound the k-th distance, a bigger node gives a tighter bound
+BOUND_NODE_FACTOR = 8
+
+#: names of the arrays that make a tree
+array_names = ["index", "min_lat", "max_lat", "min_lng", "max_lng"]
+
+
+class KDTree(object):
+    """
+    :param lats, lngs: latitude and longitude of the points, any sequence
+      indexable by point id, such as ``array``, ``memoryview``, ``list``.
+    :param index, min_lat, max_lat, min_lng, max_lng: the tree arrays, see
+      :meth:`build` and :meth:`to_arrays`.
+    """
+
+    def __init__(self, lats, lngs, index, min_lat, max_lat, min_lng, max_lng):
+        self.lats = lats
+        self.lngs = lngs
+        self.index = index
+        self.min_lat = min_lat
+        self.max_lat = max_lat
+        self.min_lng = min_lng
+        self.max_lng = max_lng
+        self.n_points = len(index)
+        self.n_nodes = len(min_lat)
+        self.first_leaf = (self.n_nodes - 1) // 2
+
+    def __len__(self):
+        return self.n_points
+
+    @classmethod
+    def build(cls, lats, lngs, leaf_size=32):
+        """Build a tree, every leaf has at most ``leaf_size`` points.
+
+        Each node is split at the median of its wider side, the longitude
+        extent is scaled by the cosine of the latitude.
+        """
+        n_points = len(lats)
+        depth = 0
+        while -(-n_points // 2 ** depth) > leaf_size:  # ceil division
+            depth += 1
+        n_nodes = 2 ** (depth + 1) - 1
+        first_leaf = (n_nodes - 1) // 2
+
+        index = list(range(n_points))
+        bounds = {name: array("d", [INF] * n_nodes)
+                  for name in array_names[1:]}
+        for name in ["max_lat", "max_lng"]:
+            bounds[name] = array("d", [-INF] * n_nodes)
+
+        stack = [(0, 0, n_points)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            node_lats = [lats[i] for i in index[lo:hi]]
+            node_lngs = [lngs[i] for i in index[lo:hi]]
+            bounds["min_lat"][node] = min(node_lats)
+            bounds["max_lat"][node] = max(node_lats)
+            bounds["min_lng"][node] = min(node_lngs)
+            bounds["max_lng"][node] = max(node_lngs)
+            if node >= first_leaf:
+                continue
+
+            lat_extent = bounds["max_lat"][node] - bounds["min_lat"][node]
+            lng_extent = (bounds["max_lng"][node] - bounds["min_lng"][node]) \
+                * cos(radians((bounds["max_lat"][node] +
+                               bounds["min_lat"][node]) / 2))
+            key = lats.__getitem__ if lat_extent >= lng_extent \
+                else lngs.__getitem__
+            index[lo:hi] = sorted(index[lo:hi], key=key)
+            mid = (lo + hi) // 2
+            stack.append((2 * node + 1, lo, mid))
+            stack.append((2 * node + 2, mid, hi))
+
+        return cls(lats, lngs, array("i", index), **bounds)
+
+    def to_arrays(self):
+        """The tree arrays, dict of name -> array.
+        """
+        return {name: getattr(self, name) for name in array_names}
+
+    def _lower_bound(self, node, lat, lng, cos_lat):
+        """Lower bound of the central angle from a point to any point in the
+        bounding box of a node.
+
+        Both the latitude gap and the angle to the closest meridian edge are
+        lower bounds, the larger one is used.
+        """
+        min_lat = self.min_lat[node]
+        if lat < min_lat:
+            dlat = min_lat - lat
+        else:
+            max_lat = self.max_lat[node]
+            dlat = lat - max_lat if lat > max_lat else 0.0
+
+        # longitude gap to the closest edge, either way around the globe
+        min_lng, max_lng = self.min_lng[node], self.max_lng[node]
+        if min_lng <= lng <= max_lng:
+            dlng = 0.0
+        else:
+            dlng = min((min_lng - lng) % 360.0, (lng - max_lng) % 360.0)
+
+        bound = radians(dlat)
+        if dlng:
+            dlng = radians(dlng)
+            if dlng >= HALF_PI:
+                bound = max(bound, HALF_PI - abs(radians(lat)))
+            else:
+                bound = max(bound, asin(min(1.0, cos_lat * sin(dlng))))
+        return bound
+
+    def nearest(self, lat, lng, k=1, max_distance=None, miles=True):
+        """Find the k nearest points.
+
+        :param lat, lng: the query point.
+        :param k: number of points.
+        :param max_distance: optional, ignore points farther than this.
+        :param miles: distance unit, miles or kilometers.
+
+        :return: list of (distance, point id), nearest first, ties in point
+          id order.
+        """
+        radius = AVG_EARTH_RADIUS * MILES_PER_KM if miles \
+            else AVG_EARTH_RADIUS
+        limit = INF if max_distance is None else max_distance
+        lat1, lng1 = radians(lat), radians(lng)
+        cos_lat = cos(lat1)
+        lats, lngs, index = self.lats, self.lngs, self.index
+
+        result = list()  # max heap of (-distance, -point id)
+        if self.n_points == 0 or k <= 0:
+            return result
+
+        heap = [(0.0, 0, 0, self.n_points)]  # (bound, node, lo, hi)
+        while heap:
+            bound, node, lo, hi = heapq.heappop(heap)
+            if len(result) == k and bound > -result[0][0]:
+                break
+
+            if node >= self.first_leaf:
+                for pos in range(lo, hi):
+                    i = index[pos]
+                    lat2 = radians(lats[i])
+                    d = sin((lat2 - lat1) / 2) ** 2 + cos_lat * cos(lat2) * \
+                        sin((radians(lngs[i]) - lng1) / 2) ** 2
+                    dist = 2 * AVG_EARTH_RADIUS * asin(sqrt(d))
+                    if miles:
+                        dist = dist * MILES_PER_KM
+                    if dist > limit:
+                        continue
+                    item = (-dist, -i)
+                    if len(result) < k:
+                        heapq.heappush(result, item)
+                    elif item > result[0]:
+                        heapq.heapreplace(result, item)
+                continue
+
+            mid = (lo + hi) // 2
+            for child, child_lo, child_hi in [
+                (2 * node + 1, lo, mid),
+                (2 * node + 2, mid, hi),
+            ]:
+                if child_lo >= child_hi:
+                    continue
+                # shrink a little, float error must not prune a tie
+                bound = self._lower_bound(child, lat, lng, cos_lat) * \
+                    radius * (1 - 1e-12)
+                if bound > limit:
+                    continue
+                if len(result) == k and bound > -result[0][0]:
+                    continue
+                heapq.heappush(heap, (bound, child, child_lo, child_hi))
+
+        return sorted([(-dist, -i) for dist, i in result])
+
+    #--- batch search, requires numpy ---
+    def _numpy_arrays(self):
+        """numpy views of the point and tree arrays, plus the range of
+        ``index`` covered by every node.
+        """
+        try:
+            return self._numpy
+        except AttributeError:
+            pass
+        arrays = {name: np.asarray(getattr(self, name))
+                  for name in ["lats", "lngs"] + array_names}
+
+        node_lo = np.zeros(self.n_nodes, dtype=np.intp)
+        node_hi = np.zeros(self.n_nodes, dtype=np.intp)
+        lo, hi = np.array([0]), np.array([self.n_points])
+        start = 0
+        while start < self.n_nodes:  # level by level, the tree is complete
+            node_lo[start:start + len(lo)] = lo
+            node_hi[start:start + len(hi)] = hi
+            start += len(lo)
+            mid = (lo + hi) // 2
+            lo = np.stack([lo, mid], axis=1).ravel()
+            hi = np.stack([mid, hi], axis=1).ravel()
+        arrays["node_lo"] = node_lo
+        arrays["node_hi"] = node_hi
+
+        self._numpy = arrays
+        return arrays
+
+    def _lower_bounds(self, nodes, lat, lng):
+        """Vectorized :meth:`_lower_bound`, the bound of an empty node is
+        meaningless.
+        """
+        arrays = self._numpy_arrays()
+        dlat = np.maximum(np.maximum(arrays["min_lat"][nodes] - lat,
+                                     lat - arrays["max_lat"][nodes]), 0.0)
+        min_lng, max_lng = arrays["min_lng"][nodes], arrays["max_lng"][nodes]
+        dlng = np.where(
+            (min_lng <= lng) & (lng <= max_lng), 0.0,
+            np.minimum((min_lng - lng) % 360.0, (lng - max_lng) % 360.0))
+        dlng = np.radians(dlng)
+        lat = np.radians(lat)
+        meridian = np.arcsin(np.minimum(
+            1.0, np.cos(lat) * np.sin(np.minimum(dlng, HALF_PI))))
+        meridian = np.where(dlng >= HALF_PI, HALF_PI - np.abs(lat), meridian)
+        return np.maximum(np.radians(dlat), meridian)
+
+    def _distances(self, queries, lo, hi, lats, lngs, miles):
+        """Distances from each query to the points in ``index[lo:hi]``,
+        padded with inf to the largest range.
+
+        :return: (distances, point ids), two 2-d arrays.
+        """
+        arrays = self._numpy_arrays()
+        width = int((hi - lo).max()) if len(lo) else 0
+        positions = lo[:, None] + np.arange(width)
+        valid = positions < hi[:, None]
+        ids = arrays["index"][np.where(valid, positions, 0)]
+        dists = great_circle_array(
+            lats[queries][:, None], lngs[queries][:, None],
+            arrays["lats"][ids], arrays["lngs"][ids], miles=miles)
+        return np.where(valid, dists, INF), ids
+
+    def _nearest_chunk(self, lats, lngs, k, limit, miles):
+        arrays = self._numpy_arrays()
+        node_lo, node_hi = arrays["node_lo"], arrays["node_hi"]
+        n_queries = len(lats)
+        queries = np.arange(n_queries)
+        radius = AVG_EARTH_RADIUS * MILES_PER_KM if miles \
+            else AVG_EARTH_RADIUS
+
+        # descend to the closest node with enough points, its k-th distance
+        # is an upper bound of the k-th nearest distance
+        nodes = np.zeros(n_queries, dtype=np.intp)
+        for _ in range(self.n_nodes.bit_length() - 1):
+            internal = nodes < self.first_leaf
+            left = np.where(internal, 2 * nodes + 1, nodes)
+            right = np.where(internal, 2 * nodes + 2, nodes)
+            # the left child is the smaller half, it may be empty
+            left_bound = np.where(
+                node_hi[left] > node_lo[left],
+                self._lower_bounds(left, lats, lngs), INF)
+            go_right = self._lower_bounds(right, lats, lngs) < left_bound
+            child = np.where(go_right, right, left)
+            enough = (node_hi[child] - node_lo[child]) >= k * BOUND_NODE_FACTOR
+            nodes = np.where(internal & enough, child, nodes)
+        dists, _ = self._distances(
+            queries, node_lo[nodes], node_hi[nodes], lats, lngs, miles)
+        if dists.shape[1] >= k:
+            bound = np.partition(dists, k - 1, axis=1)[:, k - 1]
+        else:
+            bound = np.full(n_queries, INF)
+        bound = np.minimum(bound, limit)
+
+        # expand the (query, node) pairs level by level, prune by bound
+        pair_queries = queries
+        pair_nodes = np.zeros(n_queries, dtype=np.intp)
+        while len(pair_nodes) and pair_nodes[0] < self.first_leaf:
+            pair_queries = np.repeat(pair_queries, 2)
+            pair_nodes = np.stack(
+                [2 * pair_nodes + 1, 2 * pair_nodes + 2], axis=1).ravel()
+            keep = node_hi[pair_nodes] > node_lo[pair_nodes]
+            pair_queries, pair_nodes = pair_queries[keep], pair_nodes[keep]
+            # shrink a little, float error must not prune a tie
+            bounds = self._lower_bounds(
+                pair_nodes, lats[pair_queries], lngs[pair_queries]) * \
+                radius * (1 - 1e-12)
+            keep = bounds <= bound[pair_queries]
+            pair_queries, pair_nodes = pair_queries[keep], pair_nodes[keep]
+
+        # distances to the points of the remaining leaves
+        dists, ids = self._distances(
+            pair_queries, node_lo[pair_nodes], node_hi[pair_nodes],
+            lats, lngs, miles)
+        pair_queries = np.broadcast_to(pair_queries[:, None], dists.shape)
+        keep = (dists <= bound[pair_queries]) & (dists < INF)  # no padding
+        pair_queries, dists, ids = pair_queries[keep], dists[keep], ids[keep]
+
+        # k smallest (distance, point id) of each query
+        order = np.lexsort((ids, dists, pair_queries))
+        pair_queries, dists, ids = \
+            pair_queries[order], dists[order], ids[order]
+        rank = np.arange(len(order)) - \
+            np.searchsorted(pair_queries, pair_queries, "left")
+        keep = rank < k
+        result_dists = np.full((n_queries, k), INF)
+        result_ids = np.full((n_queries, k), -1, dtype=np.intp)
+        result_dists[pair_queries[keep], rank[keep]] = dists[keep]
+        result_ids[pair_queries[keep], rank[keep]] = ids[keep]
+        return result_dists, result_ids
+
+    def nearest_many(self, lats, lngs, k=1, max_distance=None, miles=True,
+                     chunk_size=4096):
+        """Find the k nearest points of many query points, requires numpy.
+        Same result as :meth:`nearest` for each query point.
+
+        :param lats, lngs: latitude and longitude of the query points, arrays
+          or iterables.
+        :param k: number of points per query.
+        :param max_distance: optional, ignore points farther than this.
+        :param miles: distance unit, miles or kilometers.
+        :param chunk_size: number of query points searched together.
+
+        :return: (distances, point ids), two arrays of shape (n, k), nearest
+          first, ties in point id order. Missing points (fewer than k within
+          ``max_distance``) have distance inf and id -1.
+        """
+        if np is None:
+            raise ImportError("numpy is required!")
+        if not hasattr(lats, "__len__"):
+            lats = list(lats)
+        if not hasattr(lngs, "__len__"):
+            lngs = list(lngs)
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lngs = np.asarray(lngs, dtype=np.float64).ravel()
+        if len(lats) != len(lngs):
+            raise ValueError("lats and lngs must have the same length!")
+
+        k = max(k, 0)
+        dists = np.full((len(lats), k), INF)
+        ids = np.full((len(lats), k), -1, dtype=np.intp)
+        if self.n_points == 0 or k == 0:
+            return dists, ids
+
+        limit = INF if max_distance is None else max_distance
+        with np.errstate(invalid="ignore"):  # bounds of empty nodes
+            for start in range(0, len(lats), chunk_size):
+                end = start + chunk_size
+                dists[start:end], ids[start:end] = self._nearest_chunk(
+                    lats[start:end], lngs[start:end], k, limit, miles)
+        return dists, ids
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bounded memo cache, optionally saved to / loaded from a json file.
+
+Keys are tuples of json types, values are json types. The file carries a
+version, a file of another version is not loaded.
+
+**中文文档**
+
+有容量上限的 LRU 缓存, 可保存到 json 文件, 下次启动时载入。
+"""
+
+import os
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    from .filelock import _replace
+except:
+    from cazipcode.pkg.filelock import _replace
+
+
+class Memo(object):
+    """Thread safe LRU memo.
+
+    :param maxsize: max number of entries, the least recently used is
+      evicted first.
+    :param version: json value written by :meth:`save`, :meth:`load` skips
+      a file of another version. For example a fingerprint of the code and
+      the data the values are computed from, so stale values are not
+      loaded after they change.
+    """
+
+    def __init__(self, maxsize=4096, version=None):
+        if maxsize < 1:
+            raise ValueError("maxsize has to be at least 1!")
+        self.maxsize = maxsize
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the statistics.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Memo statistics.
+
+        :return: dict of hits, misses, hit_rate, size, maxsize.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": float(self.hits) / total if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+    def save(self, path):
+        """Write all entries to a json file, least recently used first.
+        The file is written to a temp file and renamed into place, a reader
+        never sees a half written file.
+        """
+        with self._lock:
+            items = [[list(key), value] for key, value in self._data.items()]
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=dirname)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": self.version, "items": items}, f)
+            _replace(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def load(self, path):
+        """Add the entries of a json file written by :meth:`save`, a missing
+        or corrupted file, or a file of another version, is ignored.
+
+        :return: number of entries loaded.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return 0
+        if not isinstance(data, dict) or \
+                data.get("version") != self.version:
+            return 0
+        items = data.get("items", [])
+        for key, value in items:
+            self.put(tuple(key), value)
+        return len(items)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Character n-gram inverted index, shortlist the choices similar to a query
+before scoring them with an expensive fuzzy scorer.
+
+Strings are processed like fuzzywuzzy does (lower case, letters and digits
+only), every word is padded with a space on both sides, so a word start or
+end counts as a character.
+
+**中文文档**
+
+字符 n-gram 倒排索引。模糊匹配前, 先用共同 n-gram 的数量挑出少量最相似的
+候选, 再用代价高的打分函数打分, 不再对全部候选逐一打分。
+"""
+
+import heapq
+from collections import defaultdict
+
+try:
+    from .fuzzywuzzy import utils
+except:
+    from cazipcode.pkg.fuzzywuzzy import utils
+
+
+def ngrams(text, n=3):
+    """Set of the character n-grams of a processed string.
+    """
+    grams = set()
+    for word in text.split():
+        word = " %s " % word
+        if len(word) <= n:
+            grams.add(word)
+        for i in range(len(word) - n + 1):
+            grams.add(word[i:i + n])
+    return grams
+
+
+class NGramIndex(object):
+    """Inverted index of n-gram -> choices having it.
+
+    :param choices: iterable of strings.
+    :param n: n-gram length.
+    """
+
+    def __init__(self, choices, n=3):
+        self.n = n
+        self.choices = list()
+        self._sizes = list()
+        self._postings = defaultdict(list)
+        for choice in choices:
+            grams = ngrams(utils.full_process(choice, force_ascii=True), n)
+            i = len(self.choices)
+            self.choices.append(choice)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(i)
+        self._postings = dict(self._postings)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def candidates(self, query, limit=50):
+        """The ``limit`` choices sharing the most n-grams with the query.
+
+        Choices are ranked by overlap, shared n-grams / n-grams of the
+        shorter string (a query that is a part of a choice scores high, like
+        the partial ratios of WRatio), ties broken by the Dice coefficient.
+        Only the choices sharing at least one n-gram are looked at.
+
+        :return: list of choices, most similar first.
+        """
+        grams = ngrams(utils.full_process(query, force_ascii=True), self.n)
+        if not grams:
+            return list()
+
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self._postings.get(gram, ()):
+                shared[i] += 1
+
+        size = len(grams)
+        sizes = self._sizes
+
+        def similarity(i):
+            count = shared[i]
+            return (float(count) / min(size, sizes[i]),
+                    2.0 * count / (size + sizes[i]))
+
+        best = heapq.nlargest(limit, shared, key=similarity)
+        return [self.choices[i] for i in best]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SymSpell style deletion dictionary, all the names within a small edit
+distance of a text in a few dictionary lookups.
+
+Every name is processed like fuzzywuzzy does (lower case, letters and digits
+only). The strings obtained by deleting up to ``max_distance`` characters
+from its first ``prefix_length`` characters are the keys pointing to it. A
+text looks up its own deletes, two strings within edit distance d share a
+delete, then the candidates are checked with the Levenshtein distance of
+:mod:`.fuzzywuzzy.StringMatcher`.
+
+**中文文档**
+
+SymSpell 删除字典。对每个名字 (前 ``prefix_length`` 个字符) 预先生成删除
+最多 ``max_distance`` 个字符后的所有字符串, 作为索引。查询时只需查询文本的
+删除字符串, 再用编辑距离验证候选, 就能找出编辑距离在 d 以内的所有名字。
+"""
+
+from collections import defaultdict
+
+try:
+    from .fuzzywuzzy import utils
+    from .fuzzywuzzy.StringMatcher import distance
+except:
+    from cazipcode.pkg.fuzzywuzzy import utils
+    from cazipcode.pkg.fuzzywuzzy.StringMatcher import distance
+
+
+def deletes(text, max_distance):
+    """Set of the strings made by deleting up to ``max_distance`` characters,
+    including the text itself.
+    """
+    result = {text}
+    edge = [text]
+    for _ in range(max_distance):
+        next_edge = list()
+        for word in edge:
+            for i in range(len(word)):
+                delete = word[:i] + word[i + 1:]
+                if delete not in result:
+                    result.add(delete)
+                    next_edge.append(delete)
+        edge = next_edge
+    return result
+
+
+class SymSpellIndex(object):
+    """Deletion dictionary of a set of names.
+
+    :param choices: iterable of strings.
+    :param max_distance: largest edit distance :meth:`lookup` can answer.
+    :param prefix_length: only the deletes of the first characters are
+      indexed, it keeps the index small for long names.
+    """
+
+    def __init__(self, choices, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.choices = list()
+        self._processed = list()
+        self._deletes = defaultdict(list)
+        for choice in choices:
+            processed = utils.full_process(choice, force_ascii=True)
+            if not processed:
+                continue
+            i = len(self.choices)
+            self.choices.append(choice)
+            self._processed.append(processed)
+            for delete in deletes(processed[:prefix_length], max_distance):
+                self._deletes[delete].append(i)
+        self._deletes = dict(self._deletes)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def lookup(self, text, max_distance=None):
+        """All names within ``max_distance`` (default the index
+        ``max_distance``) of the processed text.
+
+        :return: list of (edit distance, name), closest first.
+        """
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        processed = utils.full_process(text, force_ascii=True)
+        if not processed:
+            return list()
+
+        candidates = set()
+        for delete in deletes(processed[:self.prefix_length], max_distance):
+            candidates.update(self._deletes.get(delete, ()))
+
+        result = list()
+        for i in candidates:
+            choice = self._processed[i]
+            if abs(len(choice) - len(processed)) > max_distance:
+                continue
+            d = distance(processed, choice)
+            if d <= max_distance:
+                result.append((d, self.choices[i]))
+        result.sort()
+        return result
@@ -1,30 +1,40 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import random
-import heapq
-from math import radians, cos
 from functools import total_ordering
-from sqlalchemy import select, func, and_
 
 try:
     from .data import (
-        engine, t,
+        get_engine, get_snapshot, get_kdtree, get_postalcode_index,
         find_province, find_city, find_area_name, fields,
     )
+    from .backend import (
+        SqliteBackend, MmapBackend, Area, EQ, GE, LE, PREFIX, SUBSTRING,
+    )
     from .pkg.nameddict import Base
-    from .pkg.geo_search import great_circle
+    from .pkg.memo import Memo
+    from .pkg.geo_search import great_circle, great_circle_array
     from .pkg.six import string_types
 except:
     from cazipcode.data import (
-        engine, t,
+        get_engine, get_snapshot, get_kdtree, get_postalcode_index,
         find_province, find_city, find_area_name, fields,
     )
+    from cazipcode.backend import (
+        SqliteBackend, MmapBackend, Area, EQ, GE, LE, PREFIX, SUBSTRING,
+    )
     from cazipcode.pkg.nameddict import Base
-    from cazipcode.pkg.geo_search import great_circle
+    from cazipcode.pkg.memo import Memo
+    from cazipcode.pkg.geo_search import great_circle, great_circle_array
     from cazipcode.pkg.six import string_types
 
 
+__all__ = [
+    "great_circle", "fields", "PostalCode", "SearchEngine", "ResultCache",
+    "DEFAULT_LIMIT", "SQLITE", "MMAP",
+]
+
+
 @total_ordering
 class PostalCode(Base):
     """Represent a postal code.
@@ -88,6 +98,16 @@ class PostalCode(Base):
         self.timezone = timezone
         self.day_light_savings = day_light_savings
 
+    @classmethod
+    def _make(cls, d):
+        """Make an instance from a row, a dict or a sqlalchemy row with all
+        the attributes. Skips the ``__setattr__`` check of each attribute,
+        it costs more than decoding the row.
+        """
+        self = cls.__new__(cls)
+        self.__dict__.update(d)
+        return self
+
     def __str__(self):
         return self.to_json(indent=4)
 
@@ -111,18 +131,105 @@ class PostalCode(Base):
 DEFAULT_LIMIT = 5
 
 
+SQLITE = "sqlite"
+MMAP = "mmap"
+
+class ResultCache(Memo):
+    """Bounded LRU cache of :meth:`SearchEngine.find` results, keyed on the
+    normalized query: the resolved criteria, the geo filters, the sort
+    order and the number of results. Thread safe. Share one instance
+    between engines for a global cache.
+
+    Results are stored as tuples of :class:`PostalCode`, a hit returns a new
+    list of copies, so callers can't mutate the cached results. Results are
+    not json types, the cache is not meant to be saved to a file.
+
+    :param maxsize: max number of results kept, the least recently used is
+      evicted first.
+    """
+
+    def __init__(self, maxsize=1024):
+        super(ResultCache, self).__init__(maxsize=maxsize)
+
+    def get(self, key):
+        """Copies of the cached result, None on a miss.
+        """
+        result = super(ResultCache, self).get(key)
+        if result is None:
+            return None
+        return [PostalCode._make(p.__dict__) for p in result]
+
+    def put(self, key, result):
+        """Cache copies of a result.
+        """
+        super(ResultCache, self).put(
+            key, tuple([PostalCode._make(p.__dict__) for p in result]))
+
+
+#: KD-tree of the snapshot opened by a worker process, path -> tree
+_worker_kdtree = dict()
+
+
+def _nearest_many_job(snapshot_path, lats, lngs, k):
+    """Run by a worker process of :meth:`SearchEngine.nearest_many`.
+
+    The worker memory maps the snapshot file once and keeps it open, every
+    worker shares the same pages of the OS page cache, nothing else of
+    ``cazipcode.data`` is loaded.
+    """
+    try:
+        tree = _worker_kdtree[snapshot_path]
+    except KeyError:
+        try:
+            from .data.snapshot import Snapshot
+        except:
+            from cazipcode.data.snapshot import Snapshot
+        tree = Snapshot(snapshot_path).kdtree()
+        _worker_kdtree[snapshot_path] = tree
+    return tree.nearest_many(lats, lngs, k=k)
+
+
 class SearchEngine(object):
     """
+    :param backend: ``"sqlite"`` (default) runs sql queries on
+      ``data.sqlite``. ``"mmap"`` scans the memory mapped columnar snapshot
+      with numpy, no sql at all, faster for read-only latency sensitive
+      use, requires numpy. Both give the same API.
+    :param exact_index: if True, :meth:`by_postalcode` and
+      :meth:`by_postalcodes` skip the backend and use an in-memory hash
+      index of postal code -> snapshot row, a few microseconds per lookup.
+      The index is built on first use (about 0.1 second) and shared by every
+      engine.
+    :param result_cache: None (default) no result cache. An int, the size
+      of a :class:`ResultCache` of this engine. A :class:`ResultCache`
+      instance, shared with every engine using it. :meth:`find` and the
+      ``by_xxx`` methods built on it return the cached result of a repeated
+      query, see :meth:`result_cache_info`.
     """
 
-    def __init__(self):
-        self.connect = engine.connect()
+    def __init__(self, backend=SQLITE, exact_index=False, result_cache=None):
+        self.postalcode_index = get_postalcode_index() if exact_index \
+            else None
+        if result_cache is None or isinstance(result_cache, ResultCache):
+            self.result_cache = result_cache
+        else:
+            self.result_cache = ResultCache(result_cache)
+        self.backend_name = backend
+        if backend == SQLITE:
+            self.backend = SqliteBackend(get_engine())
+            self.connect = self.backend.connect
+        elif backend == MMAP:
+            self.backend = MmapBackend(get_snapshot())
+            self.connect = None
+        else:
+            raise ValueError("backend has to be one of %r, %r!" % (
+                SQLITE, MMAP))
 
     def __enter__(self):
         return self
 
     def __exit__(self, *exc_info):
-        self.connect.close()
+        self.close()
 
     def close(self):
         """Closs engine.
@@ -131,7 +238,7 @@ class SearchEngine(object):
 
         断开与数据库的连接。
         """
-        self.connect.close()
+        self.backend.close()
 
     def find(self,
              lat=None, lng=None, radius=None,
@@ -148,7 +255,9 @@ class SearchEngine(object):
              day_light_savings=None,
              sort_by=None,
              ascending=True,
-             returns=DEFAULT_LIMIT):
+             returns=DEFAULT_LIMIT,
+             polygon=None,
+             along_route=None, buffer=None):
         """A powerful search method.
 
         :param lat, lng, radius: search near lat, lng with in xxx miles.
@@ -166,44 +275,56 @@ class SearchEngine(object):
         :param timezone_greater, timezone_less: timezone falls in a range.
         :param timezone: int, all postal code timezone exactly matches.
         :param day_light_savings: bool or int, whether using day light savings.        
+        :param polygon: all postal code inside a polygon, list of (lat, lng)
+          vertices. Edges are straight lines in the lat, lng plane.
+        :param along_route, buffer: all postal code within ``buffer`` miles
+          of a route, list of (lat, lng) points joined by great circle arcs.
+
+        Geo filters (near, polygon, route) are pruned by the spatial index
+        and combine with every other filter.
         """
 
-        filters = list()
+        criteria = list()
+        area_keys = list()
 
         # near lat, lng
         if lat is not None and lng is not None and radius is not None:
-            dist_btwn_lat_deg = 69.172
-            dist_btwn_lon_deg = cos(radians(lat)) * 69.172
-            lat_degr_rad = abs(radius * 1.05 / dist_btwn_lat_deg)
-            lon_degr_rad = abs(radius * 1.05 / dist_btwn_lon_deg)
-
-            lat_lower = lat - lat_degr_rad
-            lat_upper = lat + lat_degr_rad
-            lng_lower = lng - lon_degr_rad
-            lng_upper = lng + lon_degr_rad
-
-#             print("%.6f, %.6f, %.6f, %.6f" % (lat_lower, lat_upper, lng_lower, lng_upper))
-#             print("%.6f" % great_circle((lat, lng), (lat_upper, lng_upper)))
-#             print("%.6f" % great_circle((lat, lng), (lat_lower, lng_lower)))
-
-            filters.append(t.c.latitude >= lat_lower)
-            filters.append(t.c.latitude <= lat_upper)
-            filters.append(t.c.longitude >= lng_lower)
-            filters.append(t.c.longitude <= lng_upper)
+            near = (lat, lng, radius)
 
         elif lat is None and lng is None and radius is None:
-            pass
+            near = None
 
         else:
             raise ValueError("lat, lng, radius has to be all given or not.")
 
+        # polygon, route
+        areas = list()
+        if polygon is not None:
+            polygon = list(polygon)
+            if len(polygon) < 3:
+                raise ValueError("polygon needs at least 3 vertices!")
+            areas.append(Area.polygon(polygon))
+            area_keys.append(
+                ("polygon", tuple([tuple(point) for point in polygon])))
+
+        if along_route is not None and buffer is not None:
+            along_route = list(along_route)
+            if not along_route:
+                raise ValueError("along_route needs at least 1 point!")
+            areas.append(Area.route(along_route, buffer))
+            area_keys.append(
+                ("route", tuple([tuple(point) for point in along_route]),
+                 buffer))
+
+        elif along_route is not None or buffer is not None:
+            raise ValueError("along_route, buffer has to be all given or not.")
+
         # prefix
         if prefix is not None:
             if not isinstance(prefix, string_types):
                 raise TypeError("prefix has to be a string")
             if 1 <= len(prefix) <= 7:
-                pattern = "%s%%" % prefix
-                filters.append(t.c.postalcode.like(pattern))
+                criteria.append((fields.postalcode, PREFIX, prefix))
             else:
                 raise ValueError("prefix has to be a 1-7 letter length!")
 
@@ -212,8 +333,7 @@ class SearchEngine(object):
             if not isinstance(substring, string_types):
                 raise TypeError("substring has to be a string")
             if 1 <= len(substring) <= 7:
-                pattern = "%%%s%%" % substring
-                filters.append(t.c.postalcode.like(pattern))
+                criteria.append((fields.postalcode, SUBSTRING, substring))
             else:
                 raise ValueError("substring has to be a 1-7 letter length!")
 
@@ -221,7 +341,7 @@ class SearchEngine(object):
         if province:
             try:
                 province = find_province(province, best_match=True)[0]
-                filters.append(t.c.province == province)
+                criteria.append((fields.province, EQ, province))
             except ValueError:
                 pass
 
@@ -229,7 +349,7 @@ class SearchEngine(object):
         if city:
             try:
                 city = find_city(city, best_match=True)[0]
-                filters.append(t.c.city == city)
+                criteria.append((fields.city, EQ, city))
             except ValueError:
                 pass
 
@@ -237,119 +357,88 @@ class SearchEngine(object):
         if area_name:
             try:
                 area_name = find_area_name(area_name, best_match=True)[0]
-                filters.append(t.c.area_name == area_name)
+                criteria.append((fields.area_name, EQ, area_name))
             except ValueError:
                 pass
 
         # area_code
         if area_code:
-            filters.append(t.c.area_code == area_code)
+            criteria.append((fields.area_code, EQ, area_code))
 
         # latitude
         if lat_greater is not None:
-            filters.append(t.c.latitude >= lat_greater)
+            criteria.append((fields.latitude, GE, lat_greater))
 
         if lat_less is not None:
-            filters.append(t.c.latitude <= lat_less)
+            criteria.append((fields.latitude, LE, lat_less))
 
         # longitude
         if lng_greater is not None:
-            filters.append(t.c.longitude >= lng_greater)
+            criteria.append((fields.longitude, GE, lng_greater))
 
         if lng_less is not None:
-            filters.append(t.c.longitude <= lng_less)
+            criteria.append((fields.longitude, LE, lng_less))
 
         # elevation
         if elevation_greater is not None:
-            filters.append(t.c.elevation >= elevation_greater)
+            criteria.append((fields.elevation, GE, elevation_greater))
 
         if elevation_less is not None:
-            filters.append(t.c.elevation <= elevation_less)
+            criteria.append((fields.elevation, LE, elevation_less))
 
         # population
         if population_greater is not None:
-            filters.append(t.c.population >= population_greater)
+            criteria.append((fields.population, GE, population_greater))
 
         if population_less is not None:
-            filters.append(t.c.population <= population_less)
+            criteria.append((fields.population, LE, population_less))
 
         # dwellings
         if dwellings_greater is not None:
-            filters.append(t.c.dwellings >= dwellings_greater)
+            criteria.append((fields.dwellings, GE, dwellings_greater))
 
         if dwellings_less is not None:
-            filters.append(t.c.dwellings <= dwellings_less)
+            criteria.append((fields.dwellings, LE, dwellings_less))
 
         # timezone
         if timezone_greater is not None:
-            filters.append(t.c.timezone >= timezone_greater)
+            criteria.append((fields.timezone, GE, timezone_greater))
 
         if timezone_less is not None:
-            filters.append(t.c.timezone <= timezone_less)
+            criteria.append((fields.timezone, LE, timezone_less))
 
         if timezone:
-            filters.append(t.c.timezone == timezone)
+            criteria.append((fields.timezone, EQ, timezone))
 
         # day_light_savings
         if day_light_savings is not None:
             day_light_savings = int(day_light_savings)
-            filters.append(t.c.day_light_savings == day_light_savings)
-
-        # execute query
-        sql = select([t]).where(and_(*filters))
-
-        if sort_by:
-            if ascending:
-                clause = t.c[sort_by].asc()
-            else:
-                clause = t.c[sort_by].desc()
-            sql = sql.order_by(clause)
-
-        # if use "near" search
-        if radius:
-            # sort_by given, then sort by keyword
-            if sort_by:
-                result = list()
-                for row in self.connect.execute(sql):
-                    dist = great_circle(
-                        (lat, lng), (row.latitude, row.longitude))
-                    if dist <= radius:
-                        result.append(PostalCode._make(row))
-                        if len(result) == returns:
-                            break
-
-            # sort_by not given, then sort by distance, don't use limit clause
-            else:
-                heap = list()
-                for row in self.connect.execute(sql):
-                    # 43.959918, 46.995828, -77.885944, -73.556256
-                    dist = great_circle(
-                        (lat, lng), (row.latitude, row.longitude))
-                    if dist <= radius:
-                        heap.append((dist, row))
-
-                # Use heap sort to find top-K
-                if ascending:
-                    heap = heapq.nsmallest(returns, heap, key=lambda x: x[0])
-                else:
-                    heap = heapq.nlargest(returns, heap, key=lambda x: x[0])
-
-                result = [PostalCode._make(row) for _, row in heap]
-
-        #
-        else:
-            if not sort_by:
-                if ascending:
-                    clause = t.c[fields.postalcode].asc()
-                else:
-                    clause = t.c[fields.postalcode].desc()
-                sql = sql.order_by(clause)
+            criteria.append(
+                (fields.day_light_savings, EQ, day_light_savings))
+
+        if self.result_cache is not None:
+            key = (self.backend_name, tuple(criteria), near,
+                   tuple(area_keys), sort_by, bool(ascending), returns)
+            result = self.result_cache.get(key)
+            if result is not None:
+                return result
+
+        rows = self.backend.find(criteria, near, sort_by, ascending, returns,
+                                 areas=areas)
+        result = [PostalCode._make(row) for row in rows]
+        if self.result_cache is not None:
+            self.result_cache.put(key, result)
+        return result
 
-            sql = sql.limit(returns)
-            result = [PostalCode._make(row)
-                      for row in self.connect.execute(sql)]
+    def result_cache_info(self):
+        """Result cache statistics, see :meth:`ResultCache.info`.
 
-        return result
+        :return: dict of hits, misses, hit_rate, size, maxsize, None without
+          result cache.
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.info()
 
     def near(self, lat, lng, radius,
              sort_by=fields.postalcode,
@@ -362,15 +451,199 @@ class SearchEngine(object):
             returns=returns,
         )
 
+    def nearest(self, lat, lng, k=1):
+        """Find the k nearest postal code, no radius needed. Typical use is
+        reverse geocoding, which postal code is this GPS point in.
+
+        Uses the KD-tree spatial index stored in the snapshot, with best
+        first search, with any backend.
+
+        :param lat, lng: the query point.
+        :param k: number of postal code.
+
+        :return: list of (distance in miles, :class:`PostalCode`), nearest
+          first.
+        """
+        snapshot = get_snapshot()
+        return [
+            (dist, PostalCode._make(snapshot.row(i)))
+            for dist, i in get_kdtree().nearest(lat, lng, k=k)
+        ]
+
+    def nearest_many(self, lats, lngs, k=1, max_workers=1):
+        """Batch :meth:`nearest`, for reverse geocoding many GPS points.
+        Requires numpy.
+
+        Points are searched in chunks against the shared KD-tree, with numpy,
+        no :class:`PostalCode` is created.
+
+        With ``max_workers`` other than 1, the points are split across a
+        ``concurrent.futures.ProcessPoolExecutor`` (python2 needs the
+        ``futures`` backport). Each worker memory maps the same snapshot
+        file, so the data and the KD-tree are in memory only once. On
+        platforms that spawn processes, call it under
+        ``if __name__ == "__main__":``.
+
+        :param lats, lngs: latitude and longitude of the points, arrays or
+          iterables.
+        :param k: number of postal code per point.
+        :param max_workers: number of worker processes, ``None`` is the
+          number of CPUs, 1 searches in this process.
+
+        :return: (distances, postalcodes), two numpy arrays of shape (n, k),
+          distance in miles and postal code string, nearest first, in the
+          order of the points. Use :meth:`by_postalcode` to get the full
+          record.
+        """
+        if max_workers == 1:
+            dists, ids = get_kdtree().nearest_many(lats, lngs, k=k)
+        else:
+            dists, ids = self._nearest_many_parallel(
+                lats, lngs, k, max_workers)
+        postalcodes = get_snapshot().numpy(fields.postalcode)[ids] \
+            .astype("U")
+        postalcodes[ids < 0] = ""  # fewer than k postal codes
+        return dists, postalcodes
+
+    #: points per job of the parallel :meth:`nearest_many`, at most
+    parallel_chunk_size = 1 << 16
+
+    def _nearest_many_parallel(self, lats, lngs, k, max_workers):
+        import numpy as np
+        from multiprocessing import cpu_count
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not hasattr(lats, "__len__"):
+            lats = list(lats)
+        if not hasattr(lngs, "__len__"):
+            lngs = list(lngs)
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lngs = np.asarray(lngs, dtype=np.float64).ravel()
+        if len(lats) != len(lngs):
+            raise ValueError("lats and lngs must have the same length!")
+        if len(lats) == 0:
+            return get_kdtree().nearest_many(lats, lngs, k=k)
+
+        # a few jobs per worker, so a slow one doesn't keep the others idle
+        n_workers = max_workers or cpu_count()
+        n_jobs = max(n_workers * 4,
+                     -(-len(lats) // self.parallel_chunk_size))
+        n_jobs = min(n_jobs, len(lats))
+        path = get_snapshot().path
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(  # map keeps the input order
+                _nearest_many_job,
+                [path] * n_jobs,
+                np.array_split(lats, n_jobs),
+                np.array_split(lngs, n_jobs),
+                [k] * n_jobs,
+            ))
+        return (np.concatenate([dists for dists, _ in results]),
+                np.concatenate([ids for _, ids in results]))
+
+    def _lat_lngs(self, postalcodes):
+        """Latitude and longitude of many postal codes, one binary search of
+        the sorted postal code column of the snapshot for all of them.
+
+        :return: (lats, lngs), two numpy arrays in input order.
+        """
+        snapshot = get_snapshot()
+        rows, found = snapshot.find_postalcodes(
+            [postalcode.strip().upper() for postalcode in postalcodes])
+        if not found.all():
+            raise ValueError("Can not find %s!" % ", ".join([
+                repr(postalcodes[i]) for i in (~found).nonzero()[0][:10]]))
+        return (snapshot.numpy(fields.latitude)[rows],
+                snapshot.numpy(fields.longitude)[rows])
+
+    def distance_matrix(self, origins, destinations, miles=True):
+        """Great circle distance between every origin and every destination
+        postal code. Requires numpy.
+
+        The postal codes are looked up all at once, the distances are
+        computed with one vectorized haversine. For a matrix too big for the
+        memory, use :meth:`iter_distance_matrix`.
+
+        :param origins, destinations: list of postal code.
+        :param miles: distance unit, miles or kilometers.
+
+        :return: numpy array of shape (len(origins), len(destinations)),
+          ``matrix[i, j]`` is the distance from ``origins[i]`` to
+          ``destinations[j]``.
+
+        Raise ``ValueError`` if a postal code is not found.
+        """
+        lats, lngs = self._lat_lngs(list(origins))
+        dest_lats, dest_lngs = self._lat_lngs(list(destinations))
+        return great_circle_array(lats[:, None], lngs[:, None],
+                                  dest_lats, dest_lngs, miles=miles)
+
+    def iter_distance_matrix(self, origins, destinations, miles=True,
+                             block_size=1024):
+        """Same as :meth:`distance_matrix`, but yield it block of rows by
+        block of rows, only one block is in memory at a time.
+
+        :param block_size: number of rows (origins) per block.
+
+        :return: generator of (start, block), ``block`` is the rows
+          ``start:start + len(block)`` of the matrix.
+
+        Raise ``ValueError`` if a postal code is not found, before the first
+        block.
+        """
+        if block_size < 1:
+            raise ValueError("block_size has to be positive!")
+        lats, lngs = self._lat_lngs(list(origins))
+        dest_lats, dest_lngs = self._lat_lngs(list(destinations))
+
+        def blocks():
+            for start in range(0, len(lats), block_size):
+                end = start + block_size
+                yield start, great_circle_array(
+                    lats[start:end, None], lngs[start:end, None],
+                    dest_lats, dest_lngs, miles=miles)
+
+        return blocks()
+
     def by_postalcode(self, postalcode):
         """Find exact postal code.
         """
-        sql = select([t]).where(t.c.postalcode == postalcode.strip().upper())
-        try:
-            postalcode = PostalCode._make(self.connect.execute(sql).fetchone())
-            return postalcode
-        except:
+        key = postalcode.strip().upper()
+        if self.postalcode_index is None:
+            row = self.backend.by_postalcode(key)
+        else:
+            i = self.postalcode_index.get(key)
+            row = None if i is None else get_snapshot().row(i)
+        if row is None:
             raise ValueError("Can not find '%s'!" % postalcode)
+        return PostalCode._make(row)
+
+    def by_postalcodes(self, postalcodes):
+        """Find many exact postal codes at once, for example to validate the
+        addresses of a batch. Much faster than :meth:`by_postalcode` in a
+        loop, the postal codes are resolved together.
+
+        :param postalcodes: list of postal code, normalized like
+          :meth:`by_postalcode`.
+
+        :return: list of :class:`PostalCode`, in input order, ``None`` for a
+          postal code not found.
+
+        **中文文档**
+
+        批量精确查询邮编, 按输入顺序返回结果, 找不到的邮编返回 None。
+        """
+        postalcodes = [postalcode.strip().upper() for postalcode in postalcodes]
+        if self.postalcode_index is None:
+            rows = self.backend.by_postalcodes(postalcodes)
+        else:
+            get, row = self.postalcode_index.get, get_snapshot().row
+            rows = list()
+            for postalcode in postalcodes:
+                i = get(postalcode)
+                rows.append(None if i is None else row(i))
+        return [None if row is None else PostalCode._make(row)
+                for row in rows]
 
     def by_prefix(self, prefix,
                   sort_by=fields.postalcode,
@@ -457,6 +730,28 @@ class SearchEngine(object):
             returns=returns,
         )
 
+    def by_polygon(self, polygon,
+                   sort_by=fields.postalcode,
+                   ascending=True,
+                   returns=DEFAULT_LIMIT):
+        return self.find(
+            polygon=polygon,
+            sort_by=sort_by,
+            ascending=ascending,
+            returns=returns,
+        )
+
+    def by_route(self, along_route, buffer,
+                 sort_by=fields.postalcode,
+                 ascending=True,
+                 returns=DEFAULT_LIMIT):
+        return self.find(
+            along_route=along_route, buffer=buffer,
+            sort_by=sort_by,
+            ascending=ascending,
+            returns=returns,
+        )
+
     def by_population(self,
                       population_greater=None, population_less=None,
                       sort_by=fields.postalcode,
@@ -520,9 +815,4 @@ class SearchEngine(object):
         )
 
     def random(self, returns=DEFAULT_LIMIT):
-        sql = select([t.c.postalcode])
-        all_postalcode = [row[0] for row in self.connect.execute(sql)]
-        result = list()
-        for postalcode in random.sample(all_postalcode, returns):
-            result.append(self.by_postalcode(postalcode))
-        return result
+        return [PostalCode._make(row) for row in self.backend.random(returns)]
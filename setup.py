@@ -78,11 +78,25 @@ except:
     print("'requirements.txt' not found!")
     REQUIRES = list()
 
-path = os.path.join(NAME, "data", "data.sqlite")
-try:
-    os.remove(path)
-except:
-    pass
+# Build the sqlite database and the columnar snapshot once at packaging time,
+# they are shipped with the package and opened read-only at runtime. Rebuild
+# them if the source data is newer. A file is built in a temp file and
+# renamed into place, a failed build raises and never leaves a half written
+# file to be packaged.
+from cazipcode.data import (
+    db_path, snapshot_path, json_data_path, build_database,
+)
+from cazipcode.data.snapshot import build_snapshot
+from cazipcode.pkg.filelock import atomic_build
+
+for path, build in [
+    (db_path, build_database),
+    (snapshot_path, build_snapshot),
+]:
+    if os.path.exists(path) and \
+            os.path.getmtime(path) < os.path.getmtime(json_data_path):
+        os.remove(path)
+    atomic_build(path, build)
 
 setup(
     name=NAME,
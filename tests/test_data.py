@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.data unittest.
+"""
+
+import os
+import sys
+import time
+import random
+import subprocess
+import multiprocessing
+import pytest
+from cazipcode import data
+from cazipcode.pkg.fuzzywuzzy import process
+from cazipcode.pkg.filelock import atomic_build, _break_stale_lock
+from cazipcode.pkg.memo import Memo
+
+
+def test_import_is_lazy():
+    code = (
+        "import cazipcode, sys\n"
+        "from cazipcode import data\n"
+        "assert len(data._lazy_cache) == 0\n"
+        "assert 'cazipcode.pkg.superjson._superjson' not in sys.modules\n"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_lazy_attributes():
+    assert data.engine is data.get_engine()
+    assert data.all_city is data.get_all_city()
+    assert "Ottawa" in data.all_city
+    assert data.city_long_to_long_upper["OTTAWA"] == "Ottawa"
+    assert "Ottawa" in data.all_area_name
+    assert data.area_name_long_to_long_upper["OTTAWA"] == "Ottawa"
+
+    with pytest.raises(AttributeError):
+        data.not_exists
+
+
+def test_readonly_engine():
+    engine = data.get_engine()
+    assert "immutable=1" in str(engine.url)
+    assert "mode=ro" in str(engine.url)
+    assert engine.execute("PRAGMA mmap_size").scalar() == data.MMAP_SIZE
+    with pytest.raises(Exception):
+        engine.execute(data.t.delete())
+
+
+def _race(path):
+    atomic_build(path, lambda tmp_path: _slow_build_counted(path, tmp_path))
+    with open(path) as f:
+        return f.read()
+
+
+def _slow_build_counted(path, tmp_path):
+    with open(path + ".calls", "a") as f:
+        f.write("x")
+    time.sleep(0.5)
+    with open(tmp_path, "w") as f:
+        f.write("done")
+
+
+def test_atomic_build(tmpdir):
+    path = str(tmpdir.join("file.txt"))
+    pool = multiprocessing.Pool(4)
+    try:
+        result = pool.map(_race, [path] * 8)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert result == ["done"] * 8
+    with open(path + ".calls") as f:
+        assert f.read() == "x"  # built only once
+    assert sorted(os.listdir(str(tmpdir))) == ["file.txt", "file.txt.calls"]
+
+
+def test_atomic_build_failure(tmpdir):
+    path = str(tmpdir.join("file.txt"))
+
+    def build(tmp_path):
+        with open(tmp_path, "w") as f:
+            f.write("half")
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        atomic_build(path, build)
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_atomic_build_stale_lock(tmpdir):
+    path = str(tmpdir.join("file.txt"))
+    lock_path = path + ".lock"
+    with open(lock_path, "w") as f:
+        f.write("12345")
+    os.utime(lock_path, (time.time() - 100, time.time() - 100))
+
+    def build(tmp_path):
+        with open(tmp_path, "w") as f:
+            f.write("done")
+
+    assert atomic_build(path, build, timeout=10) is True
+    assert os.listdir(str(tmpdir)) == ["file.txt"]
+
+    # a fresh lock taken by a late waiter is put back
+    with open(lock_path, "w") as f:
+        f.write("12345")
+    _break_stale_lock(lock_path, timeout=10)
+    assert sorted(os.listdir(str(tmpdir))) == ["file.txt", "file.txt.lock"]
+
+
+def test_find():
+    assert data.find_province("on") == ["ON"]
+    assert data.find_province("ontario") == ["ON"]
+    assert data.find_province("tario") == ["ON"]
+
+    assert data.find_city("ottawa") == ["Ottawa", ]
+    assert data.find_city("otawa") == ["Ottawa", ]
+
+    assert data.find_area_name("ottawa") == ["Ottawa", ]
+    assert data.find_area_name("otawa") == ["Ottawa", ]
+
+
+def test_find_shortlist_miss():
+    # names the trigram shortlist misses are found by the full scan
+    data.fuzzy_memo.clear()
+    assert data.find_city("lr noge") == ["Gem", ]
+    assert data.find_city("udnroblf") == ["Narol", ]
+
+
+def typo(text):
+    chars = list(text.lower())
+    i = random.randrange(len(chars))
+    letter = random.choice("abcdefghijklmnopqrstuvwxyz ")
+    op = random.randrange(3)
+    if op == 0:
+        del chars[i]
+    elif op == 1:
+        chars[i] = letter
+    else:
+        chars.insert(i, letter)
+    return "".join(chars)
+
+
+def test_find_same_as_full_scan():
+    # indexes only speed up fuzzy matching, the name is the WRatio best
+    data.fuzzy_memo.clear()
+    assert data.find_city("north van") == ["North Vancouver", ]
+    assert data.find_city("tario") == ["Mantario", ]
+    assert data.find_city("kifr mountain") == ["Mountain", ]
+    assert data.find_city("la") == ["Aklavik", ]
+
+    random.seed(7)
+    for find, names in [(data.find_city, data.get_all_city()),
+                        (data.find_area_name, data.get_all_area_name())]:
+        names = sorted(names)
+        queries = [typo(name) for name in random.sample(names, 10)]
+        queries += [typo(typo(typo(name)))
+                    for name in random.sample(names, 5)]
+        for text in queries:
+            if text.upper() in {name.upper() for name in names}:
+                continue
+            name, confidence = process.extractOne(text, names)
+            if confidence >= 70:
+                assert find(text) == [name, ]
+            else:
+                with pytest.raises(ValueError):
+                    find(text)
+
+
+def test_fuzzy_memo(tmpdir):
+    data.fuzzy_memo.clear()
+    assert data.find_city("otawa") == ["Ottawa", ]
+    assert data.find_city("otawa") == ["Ottawa", ]
+    with pytest.raises(ValueError):
+        data.find_city("xqzvw")
+    with pytest.raises(ValueError):
+        data.find_city("xqzvw")
+    assert data.find_area_name("otawa") == ["Ottawa", ]
+    info = data.fuzzy_memo.info()
+    assert (info["hits"], info["misses"], info["size"]) == (2, 3, 3)
+    assert data.fuzzy_memo.get(("city", "otawa", True, 70))[0][0] == "Ottawa"
+
+    # min_confidence is part of the key
+    choices = data.get_city_prepared_choices()
+    assert data.fuzzy_match("otawa", choices, True, min_confidence=99,
+                            kind="city") == []
+    assert data.fuzzy_match("otawa", choices, True, min_confidence=70,
+                            kind="city") == ["Ottawa"]
+
+    path = str(tmpdir.join("fuzzy_memo.json"))
+    data.fuzzy_memo.save(path)
+    data.fuzzy_memo.clear()
+    assert data.fuzzy_memo.load(path) == 4
+    assert data.find_city("otawa") == ["Ottawa", ]
+    assert data.fuzzy_memo.info()["hits"] == 1
+
+    # a memo saved with another scorer or data is not loaded
+    version = data.fuzzy_memo.version
+    try:
+        data.fuzzy_memo.clear()
+        data.fuzzy_memo.version = data.get_fuzzy_memo_version()
+        assert data.fuzzy_memo.load(path) == 0
+        assert data.find_city("otawa") == ["Ottawa", ]
+        data.fuzzy_memo.save(path)
+        data.fuzzy_memo.clear()
+        assert data.fuzzy_memo.load(path) == 1
+    finally:
+        data.fuzzy_memo.version = version
+
+    data.fuzzy_memo.clear()
+    assert data.fuzzy_memo.load(str(tmpdir.join("not_exists.json"))) == 0
+
+
+def test_persist_fuzzy_memo(tmpdir):
+    path1 = str(tmpdir.join("memo1.json"))
+    path2 = str(tmpdir.join("memo2.json"))
+    code = (
+        "import atexit\n"
+        "from cazipcode import data\n"
+        "registered = []\n"
+        "register = atexit.register\n"
+        "atexit.register = lambda *args: registered.append(args) or "
+        "register(*args)\n"
+        "data.persist_fuzzy_memo(%r)\n"
+        "data.persist_fuzzy_memo(%r)\n"
+        "data.persist_fuzzy_memo(%r)\n"
+        "assert len(registered) == 1\n"
+        "assert data.find_city('otawa') == ['Ottawa']\n"
+    ) % (path1, path1, path2)
+    subprocess.check_call([sys.executable, "-c", code])
+    assert not os.path.exists(path1)  # saved once, to the last path
+    assert Memo(version=data.get_fuzzy_memo_version()).load(path2) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
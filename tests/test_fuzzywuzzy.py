@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.pkg.fuzzywuzzy unittest.
+"""
+
+import random
+import pytest
+from cazipcode.data import get_all_city
+from cazipcode.pkg.fuzzywuzzy import fuzz, process, utils, pure_levenshtein
+from cazipcode.pkg.fuzzywuzzy.StringMatcher import StringMatcher
+
+queries = ["otawa", "tario", "st john", "north van", "upperwnorthosydney",
+           "Saint-Jean", "xqzvw", "la", "ottawa ottawa"]
+
+
+def test_WRatio_upper_bound():
+    random.seed(0)
+    cities = sorted(get_all_city())
+    for text in queries + random.sample(cities, 10):
+        p1 = utils.full_process(text, force_ascii=True)
+        for city in random.sample(cities, 200) + ["Ottawa", ""]:
+            p2 = utils.full_process(city, force_ascii=True)
+            assert fuzz.WRatio_upper_bound(p1, p2) >= fuzz.WRatio(text, city)
+
+
+def test_extractOne_prune():
+    random.seed(1)
+    cities = sorted(get_all_city())
+    choices = random.sample(cities, 500)
+    for text in queries:
+        expected = process.extractOne(text, choices)
+        assert process.extractOne(text, choices, prune=True) == expected
+        assert process.extractOne(text, choices, score_cutoff=80,
+                                  prune=True) == \
+            process.extractOne(text, choices, score_cutoff=80)
+
+    mapping = dict(enumerate(choices[:50]))
+    assert process.extractOne("otawa", mapping, prune=True) == \
+        process.extractOne("otawa", mapping)
+    assert process.extractOne("otawa", ["Ottawa", "Otawa", "Otawa"],
+                              prune=True) == ("Otawa", 100)
+    assert process.extractOne("otawa", [], prune=True) is None
+
+
+def test_WRatio_prepared():
+    random.seed(2)
+    cities = sorted(get_all_city())
+    for text in queries + random.sample(cities, 10):
+        prepared_text = fuzz.PreparedString(text)
+        for city in random.sample(cities, 200) + ["Ottawa", "", "!!"]:
+            assert fuzz.WRatio_prepared(
+                prepared_text, fuzz.PreparedString(city)) == \
+                fuzz.WRatio(text, city)
+
+
+def test_PreparedChoices():
+    random.seed(3)
+    choices = random.sample(sorted(get_all_city()), 500)
+    prepared = process.PreparedChoices(choices)
+    assert len(prepared) == 500
+    assert list(prepared) == choices
+    for text in queries:
+        expected = process.extractOne(text, choices)
+        assert process.extractOne(text, prepared) == expected
+        assert process.extractOne(text, prepared, prune=True) == expected
+        assert process.extract(text, prepared, limit=3) == \
+            process.extract(text, choices, limit=3)
+        # custom scorer, scores the strings
+        assert process.extractOne(text, prepared, scorer=fuzz.ratio) == \
+            process.extractOne(text, choices, scorer=fuzz.ratio)
+
+    subset = prepared.subset(choices[:10])
+    assert list(subset) == choices[:10]
+    assert subset.prepared[0] is prepared.prepared[0]
+    assert process.extractOne("otawa", subset) == \
+        process.extractOne("otawa", choices[:10])
+
+
+def test_WRatio_prepared_upper_bounds():
+    pytest.importorskip("numpy")
+    random.seed(5)
+    cities = sorted(get_all_city())
+    prepared = [fuzz.PreparedString(city) for city in
+                random.sample(cities, 1000) + ["", "!!", "ottawa ottawa"]]
+    arrays = fuzz.PreparedArrays(prepared)
+    for text in queries + random.sample(cities, 10) + [""]:
+        prepared_text = fuzz.PreparedString(text)
+        bounds = fuzz.WRatio_prepared_upper_bounds(prepared_text, arrays)
+        for bound, p in zip(bounds, prepared):
+            assert bound + 1 >= \
+                fuzz.WRatio_prepared_upper_bound(prepared_text, p)
+
+
+def test_PreparedChoices_prefilter(monkeypatch):
+    pytest.importorskip("numpy")
+    cities = sorted(get_all_city())
+    prepared = process.PreparedChoices(cities)
+    assert len(prepared) >= process.PREFILTER_MIN_CHOICES
+    results = [process.extractOne(text, prepared, score_cutoff=cutoff,
+                                  prune=True)
+               for text in queries for cutoff in [1, 70, 90]]
+    assert prepared._arrays is not None
+    monkeypatch.setattr(fuzz, "np", None)
+    assert results == [
+        process.extractOne(text, prepared, score_cutoff=cutoff, prune=True)
+        for text in queries for cutoff in [1, 70, 90]]
+
+
+def dp_distance(s1, s2, substitute=1):
+    previous = list(range(len(s2) + 1))
+    for i, c1 in enumerate(s1, 1):
+        current = [i]
+        for j, c2 in enumerate(s2, 1):
+            current.append(min(
+                previous[j] + 1, current[j - 1] + 1,
+                previous[j - 1] + (substitute if c1 != c2 else 0)))
+        previous = current
+    return previous[-1]
+
+
+def random_pairs(n, max_length=40):
+    random.seed(4)
+    for _ in range(n):
+        yield tuple(
+            "".join([random.choice("abcde ")
+                     for _ in range(random.randrange(max_length))])
+            for _ in range(2))
+
+
+def test_pure_levenshtein():
+    for s1, s2 in random_pairs(500):
+        distance = dp_distance(s1, s2)
+        assert pure_levenshtein.distance(s1, s2) == distance
+        indel = dp_distance(s1, s2, substitute=2)
+        lensum = len(s1) + len(s2)
+        assert pure_levenshtein.ratio(s1, s2) == pytest.approx(
+            float(lensum - indel) / lensum if lensum else 1.0)
+
+        # an optimal alignment
+        ops = pure_levenshtein.editops(s1, s2)
+        assert len(ops) == distance
+        codes = pure_levenshtein.opcodes(s1, s2)
+        assert pure_levenshtein.editops(codes, s1, s2) == ops
+        assert pure_levenshtein.opcodes(ops, s1, s2) == codes
+        blocks = pure_levenshtein.matching_blocks(codes, s1, s2)
+        assert blocks == pure_levenshtein.matching_blocks(ops, s1, s2)
+        assert blocks[-1] == (len(s1), len(s2), 0)
+        for i, j, n in blocks:
+            assert s1[i:i + n] == s2[j:j + n]
+
+    assert pure_levenshtein.ratio("", "") == 1.0
+    assert pure_levenshtein.distance("", "abc") == 3
+    assert pure_levenshtein.matching_blocks([], "", "") == [(0, 0, 0)]
+
+    matcher = StringMatcher(None, "ottawa", "otawa")
+    assert matcher.distance() == 1
+    assert matcher.ratio() == pytest.approx(10.0 / 11)
+    assert [tuple(block) for block in matcher.get_matching_blocks()] == [
+        (0, 0, 2), (3, 2, 3), (6, 5, 0)]
+
+
+def test_same_as_native_levenshtein():
+    Levenshtein = pytest.importorskip("Levenshtein")
+    for s1, s2 in random_pairs(500, max_length=100):
+        assert pure_levenshtein.distance(s1, s2) == \
+            Levenshtein.distance(s1, s2)
+        assert pure_levenshtein.ratio(s1, s2) == pytest.approx(
+            Levenshtein.ratio(s1, s2))
+        assert pure_levenshtein.opcodes(s1, s2) == \
+            [tuple(code) for code in Levenshtein.opcodes(s1, s2)]
+        codes = Levenshtein.opcodes(s1, s2)
+        assert pure_levenshtein.matching_blocks(codes, s1, s2) == [
+            tuple(block)
+            for block in Levenshtein.matching_blocks(codes, s1, s2)]
+
+
+if __name__ == "__main__":
+    import os
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.pkg.geo_search unittest.
+"""
+
+import math
+import heapq
+import pickle
+import random
+import pytest
+from cazipcode import backend
+from cazipcode.pkg import geo_search
+from cazipcode.pkg.geo_search import (
+    great_circle, great_circle_array, bounding_boxes, GeoSearchEngine,
+    point_in_polygon, points_in_polygon, polygon_bounding_box,
+    distance_to_route, distances_to_route, route_bounding_boxes,
+)
+
+
+def random_points(n):
+    random.seed(0)
+    lats = [random.uniform(-90, 90) for _ in range(n)]
+    lngs = [random.uniform(-180, 180) for _ in range(n)]
+    return lats, lngs
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_great_circle_array(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(geo_search, "np", None)
+    lats, lngs = random_points(1000)
+    lat, lng = 45.477873, -75.721100
+    for miles in [True, False]:
+        expected = [great_circle((lat, lng), point, miles=miles)
+                    for point in zip(lats, lngs)]
+        assert list(great_circle_array(lat, lng, lats, lngs, miles=miles)) \
+            == pytest.approx(expected, rel=1e-12)
+    assert list(great_circle_array(lat, lng, [], [])) == []
+
+
+def test_great_circle_array_broadcast():
+    np = pytest.importorskip("numpy")
+    lats, lngs = random_points(20)
+    matrix = great_circle_array(
+        np.array(lats[:5])[:, None], np.array(lngs[:5])[:, None],
+        lats[5:], lngs[5:],
+    )
+    assert matrix.shape == (5, 15)
+    for i in range(5):
+        for j in range(15):
+            assert matrix[i, j] == pytest.approx(great_circle(
+                (lats[i], lngs[i]), (lats[5 + j], lngs[5 + j])))
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_top_k(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(backend, "np", None)
+    random.seed(0)
+    dists = [float(random.randint(0, 50)) for _ in range(500)]  # many ties
+    items = list(enumerate(dists))
+    for radius in [0, 10, 100]:
+        for returns in [0, 1, 5, 50, 1000]:
+            within = [(i, d) for i, d in items if d <= radius]
+            expected = [i for i, _ in heapq.nsmallest(
+                returns, within, key=lambda x: x[1])]
+            assert list(backend.top_k(dists, radius, returns, True)) == \
+                expected
+            expected = [i for i, _ in heapq.nlargest(
+                returns, within, key=lambda x: x[1])]
+            assert list(backend.top_k(dists, radius, returns, False)) == \
+                expected
+            expected = [i for i, _ in within][:returns]
+            assert list(backend.first_k(dists, radius, returns)) == expected
+
+
+def in_boxes(lat, lng, boxes):
+    return any([lat_lower <= lat <= lat_upper and lng_lower <= lng <= lng_upper
+                for lat_lower, lat_upper, lng_lower, lng_upper in boxes])
+
+
+def test_bounding_boxes():
+    random.seed(3)
+    centers = [(76.418142, -82.89339), (89.9, 0.0), (-89.5, 120.0),
+               (0.0, 179.9), (65.0, -179.5), (45.47, -75.72)]
+    centers += [(random.uniform(-90, 90), random.uniform(-180, 180))
+                for _ in range(50)]
+    for lat, lng in centers:
+        for radius in [1, 50, 500, 3000]:
+            boxes = bounding_boxes(lat, lng, radius)
+            assert 1 <= len(boxes) <= 2
+            for lat_lower, lat_upper, lng_lower, lng_upper in boxes:
+                assert -90 <= lat_lower <= lat_upper <= 90
+                assert -180 <= lng_lower <= lng_upper <= 180
+
+            # every point of the circle is in the boxes
+            lats, lngs = random_points(2000)
+            for point in zip(lats, lngs):
+                if great_circle((lat, lng), point) <= radius:
+                    assert in_boxes(point[0], point[1], boxes)
+
+            # the box is tight, its edges touch the circle
+            lat_lower, lat_upper = boxes[0][:2]
+            if lat_upper < 90:
+                assert great_circle((lat, lng), (lat_upper, lng)) == \
+                    pytest.approx(radius)
+            if len(boxes) == 1 and boxes[0][2:] != (-180.0, 180.0):
+                # latitude of the tangent point on the meridian lng_upper
+                angle = radius / (geo_search.AVG_EARTH_RADIUS * 0.621371)
+                tangent_lat = math.degrees(math.asin(
+                    math.sin(math.radians(lat)) / math.cos(angle)))
+                assert great_circle((lat, lng), (tangent_lat, boxes[0][3])) \
+                    == pytest.approx(radius)
+
+    # split at longitude 180
+    boxes = bounding_boxes(0.0, 179.9, 50)
+    assert len(boxes) == 2
+    assert in_boxes(0.0, -179.9, boxes)
+    # cover the north pole
+    assert bounding_boxes(89.9, 0.0, 50)[0][1:] == (90.0, -180.0, 180.0)
+    # kilometers
+    assert bounding_boxes(0.0, 0.0, 100, miles=False)[0][1] == \
+        pytest.approx(bounding_boxes(0.0, 0.0, 100 * 0.621371)[0][1])
+
+
+STAR = [(50.0, -100.0), (52.0, -97.0), (55.0, -97.5), (53.0, -95.0),
+        (55.0, -92.0), (51.5, -93.5), (49.0, -91.0), (50.5, -94.5)]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_points_in_polygon(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(geo_search, "np", None)
+    square = [(0.0, 0.0), (0.0, 10.0), (10.0, 10.0), (10.0, 0.0)]
+    assert point_in_polygon(5.0, 5.0, square)
+    assert not point_in_polygon(5.0, 15.0, square)
+    assert not point_in_polygon(-1.0, 5.0, square)
+    assert point_in_polygon(5.0, 5.0, square + square[:1])  # closed ring
+
+    random.seed(4)
+    lats = [random.uniform(48, 56) for _ in range(2000)]
+    lngs = [random.uniform(-101, -90) for _ in range(2000)]
+    mask = points_in_polygon(lats, lngs, STAR)
+    expected = [point_in_polygon(lat, lng, STAR)
+                for lat, lng in zip(lats, lngs)]
+    assert list(mask) == expected
+    assert 0 < sum(expected) < len(expected)
+    lat_lower, lat_upper, lng_lower, lng_upper = polygon_bounding_box(STAR)
+    for lat, lng, inside in zip(lats, lngs, expected):
+        if inside:
+            assert lat_lower <= lat <= lat_upper
+            assert lng_lower <= lng <= lng_upper
+
+
+def slerp(point1, point2, n):
+    """n + 1 points evenly spaced along the great circle arc.
+    """
+    a, b = geo_search._unit(*point1), geo_search._unit(*point2)
+    omega = math.acos(max(-1.0, min(1.0, geo_search._dot(a, b))))
+    points = list()
+    for i in range(n + 1):
+        f = float(i) / n
+        if omega < 1e-12:
+            v = a
+        else:
+            w1 = math.sin((1 - f) * omega) / math.sin(omega)
+            w2 = math.sin(f * omega) / math.sin(omega)
+            v = [w1 * x + w2 * y for x, y in zip(a, b)]
+        points.append((math.degrees(math.asin(max(-1.0, min(1.0, v[2])))),
+                       math.degrees(math.atan2(v[1], v[0]))))
+    return points
+
+
+def arcs(route):
+    if len(route) == 1:
+        return [(route[0], route[0])]
+    return list(zip(route[:-1], route[1:]))
+
+
+ROUTES = [
+    [(43.65, -79.38), (45.50, -73.57), (46.81, -71.21)],  # Toronto - Quebec
+    [(49.28, -123.12), (53.55, -113.49), (49.90, -97.14)],
+    [(65.0, 170.0), (66.0, -170.0)],  # crosses longitude 180
+    [(80.0, -100.0), (80.0, 80.0)],  # over the north pole
+    [(60.0, -150.0), (60.0, -30.0)],  # high turning point
+    [(45.0, -75.0)],  # a single point
+]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_distance_to_route(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(geo_search, "np", None)
+    random.seed(5)
+    for route in ROUTES:
+        samples = list()
+        for point1, point2 in arcs(route):
+            samples.extend(slerp(point1, point2, 2000))
+        points = [(random.uniform(30, 89), random.uniform(-180, 180))
+                  for _ in range(30)]
+        dists = distances_to_route([lat for lat, _ in points],
+                                   [lng for _, lng in points], route)
+        for (lat, lng), dist in zip(points, dists):
+            assert dist == pytest.approx(distance_to_route(lat, lng, route))
+            sampled = min([great_circle((lat, lng), sample)
+                           for sample in samples])
+            assert dist <= sampled + 1e-6
+            assert dist == pytest.approx(sampled, abs=2.0)
+
+
+def test_route_bounding_boxes():
+    random.seed(6)
+    for route in ROUTES:
+        for buffer in [1, 30, 300]:
+            boxes = route_bounding_boxes(route, buffer)
+            for lat_lower, lat_upper, lng_lower, lng_upper in boxes:
+                assert -90 <= lat_lower <= lat_upper <= 90
+                assert -180 <= lng_lower <= lng_upper <= 180
+            # random points close to the route
+            samples = list()
+            for point1, point2 in arcs(route):
+                samples.extend(slerp(point1, point2, 50))
+            degree = buffer / 69.0
+            for _ in range(500):
+                lat, lng = random.choice(samples)
+                lat = max(-90.0, min(90.0, lat + random.uniform(
+                    -2 * degree, 2 * degree)))
+                lng = (lng + random.uniform(-20 * degree, 20 * degree)
+                       + 180) % 360 - 180
+                if distance_to_route(lat, lng, route) <= buffer:
+                    assert in_boxes(lat, lng, boxes)
+
+
+class Store(object):
+    def __init__(self, id, lat, lng):
+        self.id, self.lat, self.lng = id, lat, lng
+
+
+def brute_force(stores, lat, lng, n, radius=None):
+    result = list()
+    for store in stores:
+        dist = great_circle((lat, lng), (store.lat, store.lng))
+        if radius is None or dist <= radius:
+            result.append((dist, store.id))
+    return sorted(result)[:n]
+
+
+@pytest.mark.parametrize("use_rtree", [True, False])
+def test_geo_search_engine(use_rtree):
+    random.seed(1)
+    stores = [Store("s%s" % i, random.uniform(-60, 60),
+                    random.uniform(-180, 180)) for i in range(3000)]
+    search = GeoSearchEngine(serializer=pickle)  # any python object
+    search.train(stores[:2000], key_id=lambda x: x.id,
+                 key_lat=lambda x: x.lat, key_lng=lambda x: x.lng)
+    search.train(stores[2000:], key_id=lambda x: x.id,
+                 key_lat=lambda x: x.lat, key_lng=lambda x: x.lng,
+                 clear_old=False)
+    assert search.use_rtree
+    search.use_rtree = use_rtree
+    assert search.n_points == 3000
+
+    points = [(35.68, 139.69), (48.86, 2.35), (-33.87, 151.21),
+              (0.0, 179.9), (45.47, -75.72)]
+    points += [(random.uniform(-60, 60), random.uniform(-180, 180))
+               for _ in range(20)]
+    for lat, lng in points:
+        for n, radius in [(1, None), (10, None), (5, 300), (50, 600)]:
+            result = search.find_n_nearest(lat, lng, n=n, radius=radius)
+            expected = brute_force(stores, lat, lng, n, radius)
+            assert [store.id for _, store in result] == \
+                [id for _, id in expected]
+            assert [dist for dist, _ in result] == \
+                pytest.approx([dist for dist, _ in expected])
+
+    search.train(stores[:3], key_id=lambda x: x.id,
+                 key_lat=lambda x: x.lat, key_lng=lambda x: x.lng)
+    assert len(search.find_n_nearest(0.0, 0.0, n=5)) == 3
+
+
+def test_geo_search_engine_reopen(tmpdir):
+    random.seed(2)
+    stores = [{"id": "s%s" % i, "lat": random.uniform(-60, 60),
+               "lng": random.uniform(-180, 180)} for i in range(200)]
+    objects = [Store(**store) for store in stores]
+    database = str(tmpdir.join("geo.sqlite"))
+    search = GeoSearchEngine(database=database)  # json
+    search.train(stores[:100], key_id=lambda x: x["id"],
+                 key_lat=lambda x: x["lat"], key_lng=lambda x: x["lng"])
+    search.engine.dispose()
+
+    # records are read back from the file
+    search = GeoSearchEngine(database=database)
+    assert search.n_points == 100
+    assert search.use_rtree
+    result = search.find_n_nearest(45.47, -75.72, n=5)
+    expected = brute_force(objects[:100], 45.47, -75.72, 5)
+    assert [store for _, store in result] == \
+        [stores[int(id[1:])] for _, id in expected]
+
+    # and more can be added
+    search.train(stores[100:], key_id=lambda x: x["id"],
+                 key_lat=lambda x: x["lat"], key_lng=lambda x: x["lng"],
+                 clear_old=False)
+    assert search.n_points == 200
+    for n in [1, 10, 300]:
+        result = search.find_n_nearest(45.47, -75.72, n=n)
+        assert [store["id"] for _, store in result] == \
+            [id for _, id in brute_force(objects, 45.47, -75.72, n)]
+
+
+def test_geo_search_engine_ids():
+    random.seed(3)
+    stores = [Store("s%s" % i, random.uniform(-60, 60),
+                    random.uniform(-180, 180)) for i in range(500)]
+    search = GeoSearchEngine(serializer=None)  # ids only
+    search.train(stores, key_id=lambda x: x.id,
+                 key_lat=lambda x: x.lat, key_lng=lambda x: x.lng)
+    for n, radius in [(1, None), (10, 500)]:
+        result = search.find_n_nearest(10.0, 20.0, n=n, radius=radius)
+        expected = brute_force(stores, 10.0, 20.0, n, radius)
+        assert [id for _, id in result] == [id for _, id in expected]
+        assert [dist for dist, _ in result] == \
+            pytest.approx([dist for dist, _ in expected])
+
+
+if __name__ == "__main__":
+    import os
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.pkg.kdtree unittest.
+"""
+
+import random
+import pytest
+from cazipcode.pkg.geo_search import great_circle
+from cazipcode.pkg.kdtree import KDTree
+
+
+def brute_force(lats, lngs, lat, lng, k, max_distance=None, miles=True):
+    result = list()
+    for i, point in enumerate(zip(lats, lngs)):
+        dist = great_circle((lat, lng), point, miles=miles)
+        if max_distance is None or dist <= max_distance:
+            result.append((dist, i))
+    return sorted(result)[:k]
+
+
+def test_nearest():
+    random.seed(0)
+    lats = [random.uniform(40, 80) for _ in range(2000)]
+    lngs = [random.uniform(-170, -50) for _ in range(2000)]
+    tree = KDTree.build(lats, lngs, leaf_size=8)
+    assert len(tree) == 2000
+
+    for _ in range(50):
+        lat, lng = random.uniform(30, 89), random.uniform(-179, -40)
+        for k in [1, 7]:
+            assert tree.nearest(lat, lng, k) == pytest.approx(
+                brute_force(lats, lngs, lat, lng, k))
+        assert tree.nearest(lat, lng, 5, max_distance=300, miles=False) == \
+            pytest.approx(brute_force(lats, lngs, lat, lng, 5,
+                                      max_distance=300, miles=False))
+
+
+def test_nearest_across_antimeridian():
+    random.seed(1)
+    lats = [random.uniform(40, 80) for _ in range(2000)]
+    lngs = [random.uniform(-170, -50) for _ in range(2000)]
+    tree = KDTree.build(lats, lngs, leaf_size=8)
+    for _ in range(50):  # the closest edge is across longitude 180
+        lat, lng = random.uniform(0, 89), random.uniform(100, 180)
+        assert tree.nearest(lat, lng, 3) == pytest.approx(
+            brute_force(lats, lngs, lat, lng, 3))
+
+
+def test_nearest_many():
+    np = pytest.importorskip("numpy")
+    random.seed(2)
+    lats = [random.uniform(40, 80) for _ in range(2000)]
+    lngs = [random.uniform(-170, -50) for _ in range(2000)]
+    lats[1:10] = [lats[0]] * 9  # ties
+    lngs[1:10] = [lngs[0]] * 9
+    tree = KDTree.build(lats, lngs, leaf_size=8)
+
+    points = [(random.uniform(0, 89), random.uniform(-180, 180))
+              for _ in range(200)] + [(lats[0], lngs[0])]
+    query_lats = np.array([lat for lat, _ in points])
+    query_lngs = [lng for _, lng in points]
+    for k, max_distance in [(1, None), (12, None), (5, 500)]:
+        dists, ids = tree.nearest_many(
+            query_lats, query_lngs, k=k, max_distance=max_distance,
+            chunk_size=64)
+        assert dists.shape == ids.shape == (len(points), k)
+        for (lat, lng), dist_row, id_row in zip(points, dists, ids):
+            expected = tree.nearest(lat, lng, k, max_distance=max_distance)
+            assert [i for i in id_row if i >= 0] == [i for _, i in expected]
+            assert list(dist_row[:len(expected)]) == \
+                pytest.approx([dist for dist, _ in expected])
+            assert (dist_row[len(expected):] == float("inf")).all()
+
+    # any iterable
+    assert (tree.nearest_many(iter(query_lats), iter(query_lngs))[1] ==
+            tree.nearest_many(query_lats, query_lngs)[1]).all()
+
+    dists, ids = tree.nearest_many([39.0], [-92.0], k=2001)
+    assert (ids[0, :2000] >= 0).all() and ids[0, 2000] == -1
+    dists, ids = KDTree.build([], []).nearest_many([39.0], [-92.0], k=3)
+    assert (ids == -1).all()
+    with pytest.raises(ValueError):
+        tree.nearest_many([1, 2], [3])
+
+
+def test_small_and_empty():
+    lats, lngs = [38.42, 40.22, 39.71], [-93.29, -92.37, -91.76]
+    tree = KDTree.build(lats, lngs)
+    assert [i for _, i in tree.nearest(39.0, -92.0, k=10)] == \
+        [i for _, i in brute_force(lats, lngs, 39.0, -92.0, 10)]
+
+    tree = KDTree.build([], [])
+    assert tree.nearest(39.0, -92.0, k=3) == []
+
+
+def test_to_arrays():
+    lats, lngs = [38.42, 40.22, 39.71], [-93.29, -92.37, -91.76]
+    tree = KDTree.build(lats, lngs)
+    tree = KDTree(lats, lngs, **tree.to_arrays())
+    assert tree.nearest(40.2, -92.4)[0][1] == 1
+
+
+if __name__ == "__main__":
+    import os
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
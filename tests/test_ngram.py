@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.pkg.ngram unittest.
+"""
+
+import random
+import pytest
+from cazipcode.data import get_all_city
+from cazipcode.pkg.ngram import ngrams, NGramIndex
+from cazipcode.pkg.fuzzywuzzy import process
+
+
+def test_ngrams():
+    assert ngrams("ab") == {" ab", "ab "}
+    assert ngrams("a") == {" a "}
+    assert ngrams("st john") == {
+        " st", "st ", " jo", "joh", "ohn", "hn "}
+    assert ngrams("") == set()
+
+
+def test_candidates():
+    index = NGramIndex(["Ottawa", "Toronto", "Saint John", "St. John's"])
+    assert len(index) == 4
+    assert index.candidates("otawa", limit=1) == ["Ottawa"]
+    assert index.candidates("tornoto", limit=1) == ["Toronto"]
+    assert set(index.candidates("john", limit=2)) == {
+        "Saint John", "St. John's"}
+    assert index.candidates("xqzvw") == []
+    assert index.candidates("!!") == []
+
+
+def typo(text):
+    chars = list(text.lower())
+    i = random.randrange(len(chars))
+    chars[i] = random.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+def test_same_best_match_as_full_scan():
+    random.seed(0)
+    cities = sorted(get_all_city())
+    index = NGramIndex(cities)
+    for city in random.sample(cities, 10):
+        text = typo(city)
+        expected = process.extractOne(text, cities)
+        result = process.extractOne(text, index.candidates(text))
+        assert result[1] == expected[1]
+
+
+if __name__ == "__main__":
+    import os
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
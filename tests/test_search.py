@@ -5,8 +5,17 @@
 elementary_path unittest.
 """
 
+import os
+import errno
+import shutil
+import warnings
 import pytest
-from cazipcode.search import fields, SearchEngine, great_circle, DEFAULT_LIMIT
+from cazipcode import data
+from cazipcode.data import get_snapshot
+from cazipcode.data import snapshot as snapshot_module
+from cazipcode.search import (
+    fields, SearchEngine, ResultCache, great_circle, DEFAULT_LIMIT,
+)
 
 
 def assert_is_all_ascending(array):
@@ -26,9 +35,10 @@ def assert_is_all_descending(array):
 
 
 class TestSearchEngine:
+    backend = "sqlite"
 
     def setup_method(self):
-        self.search = SearchEngine()
+        self.search = SearchEngine(backend=self.backend)
 
     def teardown_method(self):
         self.search.close()
@@ -203,6 +213,25 @@ class TestSearchEngine:
         p = self.search.by_postalcode(postalcode)
         assert p.postalcode == postalcode
 
+    def test_by_postalcodes(self):
+        postalcodes = ["K1G 0A1", " k1a 0a1 ", "K1A 0A", "K1G 0A1", "X0A 0A0",
+                       "K1A 0A1X", u"K1A 0A\xe9", ""]
+        postalcodes += [p.postalcode for p in self.search.random(returns=50)]
+        self.search.backend.in_chunk_size = 7
+        result = self.search.by_postalcodes(postalcodes)
+        assert len(result) == len(postalcodes)
+        for postalcode, p in zip(postalcodes, result):
+            try:
+                expected = self.search.by_postalcode(postalcode)
+            except ValueError:
+                expected = None
+            assert p == expected
+            if p is not None:
+                assert p.to_dict() == expected.to_dict()
+        assert [p is None for p in result[:8]] == \
+            [False, False, True, False, False, True, True, True]
+        assert self.search.by_postalcodes([]) == []
+
     def test_all_postalcode(self):
         result = self.search.all_postalcode(
             sort_by=fields.postalcode, ascending=True)
@@ -216,6 +245,385 @@ class TestSearchEngine:
         assert len(result) == DEFAULT_LIMIT
 
 
+class TestMmapSearchEngine(TestSearchEngine):
+    backend = "mmap"
+
+    def setup_method(self):
+        pytest.importorskip("numpy")
+        super(TestMmapSearchEngine, self).setup_method()
+
+
+def test_backend_consistency():
+    pytest.importorskip("numpy")
+    lat, lng = 45.477873, -75.721100
+    queries = [
+        dict(prefix="k1a"),
+        dict(prefix="K1A", sort_by=fields.population, ascending=False),
+        dict(substring="1A", returns=20),
+        dict(province="on", sort_by=fields.population),
+        dict(city="otawa", sort_by=fields.dwellings, returns=20),
+        dict(area_name="ottawa", sort_by=fields.population),
+        dict(area_code=613),
+        dict(lat=lat, lng=lng, radius=100),
+        dict(lat=lat, lng=lng, radius=100, ascending=False),
+        dict(lat=lat, lng=lng, radius=100, sort_by=fields.postalcode),
+        dict(lat=lat, lng=lng, radius=50, sort_by=fields.population,
+             ascending=False, returns=20),
+        dict(timezone_greater=5, timezone_less=8,
+             sort_by=fields.timezone, ascending=False, returns=30),
+        dict(day_light_savings=False),
+        dict(population_less=100, sort_by=fields.elevation, returns=50),
+        dict(elevation_greater=0, elevation_less=50),
+        dict(sort_by=fields.area_code, returns=30),
+        dict(sort_by=fields.area_code, ascending=False, returns=30),
+        dict(sort_by=fields.city, province="QC", returns=40),
+        dict(city="Toronto", sort_by=fields.population, ascending=False),
+        dict(province="ON", sort_by=fields.elevation, ascending=False,
+             returns=5),
+        dict(province="ON", sort_by=fields.city, ascending=False,
+             returns=100),
+        dict(population_greater=0, sort_by=fields.latitude, ascending=False,
+             returns=500),
+        dict(prefix="K1A 0A1"),
+        dict(prefix="Z"),
+        dict(city="ottawa", province="QC"),
+    ]
+    with SearchEngine() as sqlite, SearchEngine(backend="mmap") as mmap:
+        for query in queries:
+            assert sqlite.find(**query) == mmap.find(**query)
+
+        assert sqlite.by_postalcode("k1g 0a1").to_dict() == \
+            mmap.by_postalcode("k1g 0a1").to_dict()
+        with pytest.raises(ValueError):
+            mmap.by_postalcode("X0X 0X0")
+
+
+def test_nearest():
+    import random
+    snapshot = get_snapshot()
+    latitude = snapshot.array(fields.latitude)
+    longitude = snapshot.array(fields.longitude)
+    all_points = list(zip(latitude, longitude))
+
+    random.seed(1)
+    points = [(45.477873, -75.721100), (43.653226, -79.383184),
+              (63.748611, -68.519722), (0.0, 0.0), (49.0, -123.1)]
+    points += [(random.uniform(42, 70), random.uniform(-140, -53))
+               for _ in range(5)]
+
+    with SearchEngine() as search:
+        for lat, lng in points:
+            result = search.nearest(lat, lng, k=5)
+            dists = sorted(great_circle((lat, lng), point)
+                           for point in all_points)[:5]
+            assert [dist for dist, _ in result] == pytest.approx(dists)
+            for dist, p in result:
+                assert dist == pytest.approx(
+                    great_circle((lat, lng), (p.latitude, p.longitude)))
+
+        lat, lng = 45.477873, -75.721100
+        dist, p = search.nearest(lat, lng)[0]
+        assert p == search.near(lat, lng, 5, sort_by=None)[0]
+
+        assert search.nearest(lat, lng, k=0) == []
+
+
+def test_nearest_many():
+    pytest.importorskip("numpy")
+    points = [(45.477873, -75.721100), (43.653226, -79.383184),
+              (63.748611, -68.519722), (0.0, 0.0), (49.0, -123.1)]
+    with SearchEngine() as search:
+        dists, postalcodes = search.nearest_many(
+            [lat for lat, _ in points], [lng for _, lng in points], k=3)
+        assert dists.shape == postalcodes.shape == (len(points), 3)
+        for (lat, lng), dist_row, postalcode_row in zip(
+                points, dists, postalcodes):
+            result = search.nearest(lat, lng, k=3)
+            assert list(dist_row) == pytest.approx([d for d, _ in result])
+            assert list(postalcode_row) == [p.postalcode for _, p in result]
+
+
+def test_nearest_many_parallel():
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("concurrent.futures")
+    random_state = np.random.RandomState(0)
+    lats = random_state.uniform(42, 70, 1000)
+    lngs = random_state.uniform(-140, -53, 1000)
+    with SearchEngine() as search:
+        search.parallel_chunk_size = 100
+        dists1, postalcodes1 = search.nearest_many(lats, lngs, k=2)
+        dists2, postalcodes2 = search.nearest_many(
+            lats, lngs, k=2, max_workers=2)
+        assert (dists1 == dists2).all()
+        assert (postalcodes1 == postalcodes2).all()
+
+
+def test_nearest_many_parallel_temp_snapshot(monkeypatch):
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("concurrent.futures")
+    # the package directory is not writable, the snapshot is a temp file
+    def atomic_build(path, build):
+        raise OSError(errno.EACCES, "Permission denied")
+
+    def build_snapshot(path):
+        shutil.copyfile(data.snapshot_path, path)
+
+    monkeypatch.setattr(data, "atomic_build", atomic_build)
+    monkeypatch.setattr(snapshot_module, "build_snapshot", build_snapshot)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        snapshot = data._open_snapshot()
+    assert snapshot.path != data.snapshot_path
+    assert os.path.exists(snapshot.path)  # the workers open it by path
+    monkeypatch.setitem(data._lazy_cache, "get_snapshot", snapshot)
+
+    random_state = np.random.RandomState(1)
+    lats = random_state.uniform(42, 70, 200)
+    lngs = random_state.uniform(-140, -53, 200)
+    with SearchEngine() as search:
+        search.parallel_chunk_size = 50
+        dists1, postalcodes1 = search.nearest_many(lats, lngs)
+        dists2, postalcodes2 = search.nearest_many(lats, lngs, max_workers=2)
+        assert (dists1 == dists2).all()
+        assert (postalcodes1 == postalcodes2).all()
+
+
+def test_distance_matrix():
+    np = pytest.importorskip("numpy")
+    origins = ["K1A 0A1", " m1b 0a1", "X0A 0A0"]
+    destinations = ["V0A 0A0", "K1A 0A1", "A1A 0A1", "B0C 0A1"]
+    with SearchEngine() as search:
+        for miles in [True, False]:
+            matrix = search.distance_matrix(origins, destinations,
+                                            miles=miles)
+            assert matrix.shape == (3, 4)
+            for i, origin in enumerate(origins):
+                p1 = search.by_postalcode(origin)
+                for j, destination in enumerate(destinations):
+                    p2 = search.by_postalcode(destination)
+                    assert matrix[i, j] == pytest.approx(great_circle(
+                        (p1.latitude, p1.longitude),
+                        (p2.latitude, p2.longitude), miles=miles))
+        assert matrix[0, 1] == 0.0
+
+        blocks = list(search.iter_distance_matrix(
+            origins, destinations, miles=False, block_size=2))
+        assert [start for start, _ in blocks] == [0, 2]
+        assert (np.vstack([block for _, block in blocks]) == matrix).all()
+
+        assert search.distance_matrix([], destinations).shape == (0, 4)
+        for postalcodes in [["K1A 0A1", "K1A 0A"], ["K1A 0A1X"],
+                            [u"K1A 0A\xe9"]]:
+            with pytest.raises(ValueError):
+                search.distance_matrix(postalcodes, destinations)
+            with pytest.raises(ValueError):
+                search.iter_distance_matrix(destinations, postalcodes)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "mmap"])
+def test_near_arctic(backend):
+    if backend == "mmap":
+        pytest.importorskip("numpy")
+    from cazipcode.pkg.geo_search import great_circle_array
+    snapshot = get_snapshot()
+    latitude = list(snapshot.array(fields.latitude))
+    longitude = list(snapshot.array(fields.longitude))
+
+    queries = [(postalcode, radius)  # Nunavut
+               for postalcode in ["X0A 0J0", "X0A 0V0", "X0A 0A0"]
+               for radius in [50, 300, 700]]
+    queries.append(("X0E 0V0", 1500))  # the 1.05 fudge box missed some
+    with SearchEngine(backend=backend) as search:
+        for postalcode, radius in queries:
+            p = search.by_postalcode(postalcode)
+            dists = great_circle_array(
+                p.latitude, p.longitude, latitude, longitude)
+            expected = sorted([
+                snapshot.postalcode(i)
+                for i, dist in enumerate(dists) if dist <= radius
+            ])
+            result = search.near(p.latitude, p.longitude, radius,
+                                 returns=len(snapshot))
+            assert len(expected) > 0
+            assert [r.postalcode for r in result] == expected
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "mmap"])
+def test_polygon_and_route(backend):
+    if backend == "mmap":
+        pytest.importorskip("numpy")
+    from cazipcode.pkg.geo_search import (
+        point_in_polygon, distance_to_route,
+    )
+    snapshot = get_snapshot()
+    rows = [snapshot.row(i) for i in range(len(snapshot))
+            if 42 <= snapshot.value(fields.latitude, i) <= 47.5 and
+            -81 <= snapshot.value(fields.longitude, i) <= -70]
+
+    # around Ottawa and Gatineau, across the provinces border
+    polygon = [(45.2, -76.0), (45.6, -76.0), (45.6, -75.4), (45.2, -75.4),
+               (45.4, -75.7)]
+    route = [(43.65, -79.38), (45.42, -75.70), (45.50, -73.57)]
+    near = (45.42, -75.70, 30)
+    with SearchEngine(backend=backend) as search:
+        def in_polygon(r):
+            return point_in_polygon(r["latitude"], r["longitude"], polygon)
+
+        def near_route(r, buffer):
+            return distance_to_route(
+                r["latitude"], r["longitude"], route) <= buffer
+
+        def in_circle(r):
+            return great_circle(
+                near[:2], (r["latitude"], r["longitude"])) <= near[2]
+
+        queries = [
+            (dict(polygon=polygon), in_polygon),
+            (dict(along_route=route, buffer=2),
+             lambda r: near_route(r, 2)),
+            (dict(polygon=polygon, along_route=route, buffer=5,
+                  province="QC"),
+             lambda r: in_polygon(r) and near_route(r, 5) and
+             r["province"] == "QC"),
+            (dict(along_route=route, buffer=3,
+                  lat=near[0], lng=near[1], radius=near[2]),
+             lambda r: near_route(r, 3) and in_circle(r)),
+        ]
+
+        for kwargs, match in queries:
+            expected = sorted([r["postalcode"] for r in rows if match(r)])
+            assert len(expected) > 0
+            result = search.find(returns=len(snapshot), **kwargs)
+            assert sorted([p.postalcode for p in result]) == expected
+            if "lat" not in kwargs:  # postal code order
+                assert [p.postalcode for p in result] == expected
+
+        # sorted by a column, limited
+        result = search.by_polygon(polygon, sort_by=fields.population,
+                                   ascending=False, returns=10)
+        assert len(result) == 10
+        assert all([point_in_polygon(p.latitude, p.longitude, polygon)
+                    for p in result])
+        populations = [p.population for p in result]
+        assert populations == sorted(populations, reverse=True)
+        assert len(search.by_route(route, 1, returns=7)) == 7
+
+    with pytest.raises(ValueError):
+        search.find(polygon=polygon[:2])
+    with pytest.raises(ValueError):
+        search.find(along_route=route)
+
+
+def test_rtree():
+    lat, lng = 43.653226, -79.383184
+    with SearchEngine() as search:
+        assert search.backend.use_rtree
+        for radius in [2, 10]:
+            result1 = search.near(lat, lng, radius, sort_by=None, returns=50)
+            search.backend.use_rtree = False
+            result2 = search.near(lat, lng, radius, sort_by=None, returns=50)
+            search.backend.use_rtree = True
+            assert len(result1) > 0
+            assert result1 == result2
+
+
+def test_statement_cache():
+    lookups = list()
+    with SearchEngine() as search:
+        search.backend.on_statement_cache = \
+            lambda key, hit: lookups.append(hit)
+        result1 = search.by_prefix("K1A", returns=5)
+        result2 = search.by_prefix("M1B", returns=5)
+        assert lookups == [False, True]
+        assert [p.postalcode[:3] for p in result1] == ["K1A"] * 5
+        assert [p.postalcode[:3] for p in result2] == ["M1B"] * 5
+
+        # different shape, different statement
+        result3 = search.by_prefix("M1B", ascending=False, returns=5)
+        assert lookups[-1] is False
+        assert result3[0].postalcode > result2[-1].postalcode
+
+        search.near(43.653226, -79.383184, 5, returns=5)
+        search.near(45.421530, -75.697193, 5, returns=5)
+        assert lookups[-2:] == [False, True]
+
+        info = search.backend.statement_cache_info()
+        assert info["hits"] == lookups.count(True)
+        assert info["misses"] == lookups.count(False)
+        assert info["size"] == info["misses"]
+        assert 0.0 < info["hit_rate"] < 1.0
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "mmap"])
+def test_result_cache(backend):
+    if backend == "mmap":
+        pytest.importorskip("numpy")
+    with SearchEngine(backend=backend) as search, \
+            SearchEngine(backend=backend, result_cache=2) as cached:
+        assert search.result_cache_info() is None
+        expected = search.by_city("Toronto")
+        result1 = cached.by_city("Toronto")
+        result2 = cached.by_city("toronto")  # same resolved city
+        assert [p.to_dict() for p in result1] == \
+            [p.to_dict() for p in expected]
+        assert [p.to_dict() for p in result2] == \
+            [p.to_dict() for p in expected]
+        info = cached.result_cache_info()
+        assert (info["hits"], info["misses"], info["size"]) == (1, 1, 1)
+
+        # callers can't mutate the cached result
+        result2[0].city = "Mutated"
+        result2.pop()
+        result3 = cached.by_city("Toronto")
+        assert [p.to_dict() for p in result3] == \
+            [p.to_dict() for p in expected]
+
+        # evicted by size, least recently used first
+        cached.near(43.65, -79.38, 5)
+        cached.by_prefix("K1A")
+        assert cached.result_cache_info()["size"] == 2
+        cached.by_city("Toronto")
+        assert cached.result_cache_info()["misses"] == 4
+
+    # global scope, shared by engines
+    cache = ResultCache(maxsize=10)
+    with SearchEngine(backend=backend, result_cache=cache) as search1, \
+            SearchEngine(backend=backend, result_cache=cache) as search2:
+        search1.by_prefix("K1A")
+        search2.by_prefix("K1A")
+        assert cache.info()["hits"] == 1
+        cache.clear()
+        assert cache.info() == {"hits": 0, "misses": 0, "hit_rate": 0.0,
+                                "size": 0, "maxsize": 10}
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "mmap"])
+def test_exact_index(backend):
+    postalcodes = [" k1a 0a1", "K1A 0A", "K1A 0A1X", u"K1A 0A\xe9", "",
+                   "A0A 0A1", "Y1A 9Z9"]
+    with SearchEngine(backend=backend) as search, \
+            SearchEngine(backend=backend, exact_index=True) as indexed:
+        assert search.postalcode_index is None
+        assert len(indexed.postalcode_index) == len(get_snapshot())
+        postalcodes += [p.postalcode for p in search.random(returns=100)]
+        result = indexed.by_postalcodes(postalcodes)
+        expected = search.by_postalcodes(postalcodes)
+        assert len([p for p in result if p is None]) == 5
+        for postalcode, p1, p2 in zip(postalcodes, result, expected):
+            if p2 is None:
+                assert p1 is None
+                with pytest.raises(ValueError):
+                    indexed.by_postalcode(postalcode)
+            else:
+                assert p1.to_dict() == p2.to_dict()
+                assert indexed.by_postalcode(postalcode).to_dict() == \
+                    p2.to_dict()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        SearchEngine(backend="redis")
+
+
 if __name__ == "__main__":
-    import os
     pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.data.snapshot unittest.
+"""
+
+import pytest
+from cazipcode.data import (
+    fields, get_snapshot, load_postalcode_data, snapshot_file,
+)
+from cazipcode.data.snapshot import Snapshot, write_snapshot, VERSION
+
+
+postalcode_data = [
+    {
+        "postalcode": "A0A 0A1", "city": "Avondale", "province": "NL",
+        "area_code": 709, "area_name": "Avondale",
+        "latitude": 47.487036, "longitude": -53.086027,
+        "elevation": 0, "population": 46297, "dwellings": 23950,
+        "timezone": 20, "day_light_savings": 1,
+    },
+    {
+        "postalcode": "K1G 0A1", "city": "Ottawa", "province": "ON",
+        "area_code": None, "area_name": "Ottawa",
+        "latitude": 45.417874, "longitude": -75.648284,
+        "elevation": 56, "population": 33994, "dwellings": 14817,
+        "timezone": 5, "day_light_savings": 1,
+    },
+]
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join("test.snapshot"))
+    write_snapshot(path, postalcode_data)
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 2
+        assert snapshot.row(0) == postalcode_data[0]
+        assert snapshot.row(-1) == postalcode_data[1]
+        assert snapshot.row(1)[fields.area_code] is None
+        assert snapshot.postalcode(1) == "K1G 0A1"
+        assert snapshot.dictionary(fields.city) == ["Avondale", "Ottawa"]
+        assert list(snapshot.array(fields.city)) == [0, 1]
+        assert list(snapshot.array(fields.latitude)) == [
+            47.487036, 45.417874]
+        with pytest.raises(IndexError):
+            snapshot.row(2)
+
+
+def test_bad_fixed_width(tmpdir):
+    with pytest.raises(ValueError):
+        write_snapshot(str(tmpdir.join("test.snapshot")),
+                       [dict(postalcode_data[0], postalcode="A0A0A1")])
+
+
+def test_numpy_view():
+    np = pytest.importorskip("numpy")
+    snapshot = get_snapshot()
+    latitude = snapshot.numpy(fields.latitude)
+    assert latitude.dtype == np.float64
+    assert len(latitude) == len(snapshot)
+    assert not latitude.flags.writeable
+    assert latitude[10] == snapshot.array(fields.latitude)[10]
+
+
+def test_rows_and_find_postalcodes(tmpdir):
+    pytest.importorskip("numpy")
+    path = str(tmpdir.join("test.snapshot"))
+    write_snapshot(path, postalcode_data)
+    with Snapshot(path) as snapshot:
+        assert snapshot.rows([1, 0, 1]) == \
+            [postalcode_data[1], postalcode_data[0], postalcode_data[1]]
+        assert snapshot.rows([]) == []
+        rows, found = snapshot.find_postalcodes(
+            ["K1G 0A1", "A0A 0A1", "K1G 0A", "K1G 0A1X", u"K1G 0A\xe9", ""])
+        assert list(found) == [True, True, False, False, False, False]
+        assert list(rows[:2]) == [1, 0]
+
+    snapshot = get_snapshot()
+    indices = list(range(0, len(snapshot), 997))
+    assert snapshot.rows(indices) == [snapshot.row(i) for i in indices]
+
+
+def test_file_name_has_version():
+    assert snapshot_file == "canada_postalcode.v%s.snapshot" % VERSION
+
+
+def test_dataset():
+    snapshot = get_snapshot()
+    data = load_postalcode_data()
+    assert len(snapshot) == len(data)
+    for i in range(0, len(data), 997):
+        assert snapshot.row(i) == data[i]
+
+
+if __name__ == "__main__":
+    import os
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])
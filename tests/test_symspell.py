@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cazipcode.pkg.symspell unittest.
+"""
+
+import random
+import pytest
+from cazipcode.data import get_all_area_name
+from cazipcode.pkg.fuzzywuzzy import utils
+from cazipcode.pkg.fuzzywuzzy.StringMatcher import distance
+from cazipcode.pkg.symspell import deletes, SymSpellIndex
+
+
+def test_deletes():
+    assert deletes("abc", 0) == {"abc"}
+    assert deletes("abc", 1) == {"abc", "bc", "ac", "ab"}
+    assert deletes("aab", 2) == {"aab", "ab", "aa", "a", "b"}
+
+
+def test_lookup():
+    index = SymSpellIndex(["Ottawa", "Toronto", "St. John's", "!!"])
+    assert len(index) == 3
+    assert index.lookup("otawa") == [(1, "Ottawa")]
+    assert index.lookup("OTTAWA") == [(0, "Ottawa")]
+    assert index.lookup("st. johns") == [(1, "St. John's")]
+    assert index.lookup("toranta", max_distance=1) == []
+    assert index.lookup("xqzvw") == []
+    assert index.lookup("") == []
+
+
+def test_same_as_brute_force():
+    random.seed(0)
+    names = sorted(get_all_area_name())
+    index = SymSpellIndex(names)
+    processed = [utils.full_process(name, force_ascii=True)
+                 for name in names]
+    for name in random.sample(names, 20):
+        chars = list(name.lower())
+        for _ in range(2):
+            i = random.randrange(len(chars))
+            chars[i:i + 1] = random.choice(["", "x", "xy"])
+        text = "".join(chars)
+        query = utils.full_process(text, force_ascii=True)
+        expected = sorted([
+            (distance(query, p), name)
+            for name, p in zip(names, processed)
+            if p and distance(query, p) <= 2
+        ])
+        assert index.lookup(text) == expected
+
+
+if __name__ == "__main__":
+    import os
+    pytest.main([os.path.basename(__file__), "--tb=native", "-s", ])